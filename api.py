@@ -0,0 +1,310 @@
+# API HTTP só de leitura do SGA: boletim, grade e alunos em exame em JSON, para atender muitas
+# consultas ao mesmo tempo (por exemplo na divulgação das notas) sem a interface aberta.
+# Só biblioteca padrão: asyncio, sem servidor web externo.
+#
+#   python api.py --porta 8080
+#   python api.py --pasta dados --motor python --host 0.0.0.0
+#
+#   GET /boletim/ra/100001                 aluno e matrículas com notas e situação
+#   GET /boletim/cpf/12345678900
+#   GET /turmas                            turmas com as matérias da grade
+#   GET /turmas/3                          uma turma e as matérias dela
+#   GET /turmas/3/materias/7               matrículas (notas) de uma matéria da turma
+#   GET /materias
+#   GET /exames?turma=3&materia=7          alunos em exame (filtros opcionais)
+#   GET /status                            quando o índice foi montado e quantos registros tem
+#   GET /diagnostico                       medidas da instrumentação (SGA_INSTRUMENTACAO=1)
+#
+# As consultas não leem os .dat: respondem de um índice em memória (IndiceConsultas), que é
+# montado de novo numa thread quando algum .dat muda e trocado inteiro quando fica pronto.
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from urllib.parse import urlsplit, parse_qs, unquote
+
+import servico
+from servico import (TABELA_ALUNOS, TABELA_MATRICULAS, ARQUIVOS_TABELAS, Matricula, CacheCadastros, VisaoMapeada,
+                     SITUACAO_EXAME, registro_apagado, registro_para_dict, situacao_status, instrumentacao)
+
+PORTA_PADRAO = 8080
+INTERVALO_VERIFICACAO = 1.0   # segundos entre uma conferência dos .dat e outra
+TEMPO_OCIOSO = 30.0           # prazo para chegar um pedido inteiro (linha e cabeçalhos); senão a conexão fecha
+MAXIMO_CABECALHOS = 100
+MAXIMO_RESPOSTAS_GUARDADAS = 4096  # respostas prontas por índice (listas grandes não são refeitas)
+
+# (tamanho, mtime, inode) de cada .dat, como no CacheCadastros.sincronizar
+def assinaturas_arquivos():
+    assinaturas = {}
+    for tabela, (arquivo, _) in ARQUIVOS_TABELAS.items():
+        try:
+            st = os.stat(arquivo)
+            assinaturas[tabela] = (st.st_size, st.st_mtime_ns, st.st_ino)
+        except FileNotFoundError:
+            assinaturas[tabela] = (0, 0, 0)
+    return assinaturas
+
+class ErroConsulta(Exception):
+    def __init__(self, status, mensagem):
+        super().__init__(mensagem)
+        self.status = status
+
+# --- Índice em memória ---
+# Uma foto dos .dat que nunca muda depois de montada: as consultas (na thread do asyncio)
+# leem sem trava enquanto a próxima é montada noutra thread. As matrículas são copiadas
+# do mapeamento (uma cópia só, sem decodificar) e indexadas por aluno, por (turma, matéria)
+# e situação Exame; ficam só a primeira cópia de cada chave e nada apagado, como na compactação
+class IndiceConsultas:
+    def __init__(self, cadastros, dados_alunos, cpfs, matriculas, assinaturas):
+        self.alunos = dict(cadastros.alunos)
+        self.turmas = dict(cadastros.turmas)
+        self.materias = dict(cadastros.materias)
+        self.grade = {id_turma: list(materias) for id_turma, materias in cadastros.grade.items()}
+        self.dados_alunos = dict(dados_alunos)  # ra -> (cpf, telefone)
+        self.cpfs = dict(cpfs)                  # cpf -> ra
+        self.matriculas = matriculas
+        self.assinaturas = assinaturas
+        self.montado_em = time.time()
+        self.por_aluno, self.por_grade, self.exames = {}, {}, []
+        vistas = set()
+        for pos, m in enumerate(matriculas):
+            if registro_apagado(m): continue
+            chave = (m.ra_aluno, m.id_turma, m.id_materia)
+            if chave in vistas: continue
+            vistas.add(chave)
+            self.por_aluno.setdefault(m.ra_aluno, []).append(pos)
+            self.por_grade.setdefault((m.id_turma, m.id_materia), []).append(pos)
+            if situacao_status(m.status) == SITUACAO_EXAME: self.exames.append(pos)
+        self.respostas = {}  # alvo do pedido -> corpo JSON já codificado
+
+    # --- Montagem das respostas ---
+    def nome_turma(self, id_turma): return self.turmas.get(id_turma, f"ID {id_turma}")
+
+    def nome_materia(self, id_materia): return self.materias.get(id_materia, f"ID {id_materia}")
+
+    def aluno(self, ra):
+        if ra not in self.alunos: raise ErroConsulta(404, f"aluno {ra} não encontrado")
+        cpf, telefone = self.dados_alunos.get(ra, ("", ""))
+        return {"ra": ra, "nome": self.alunos[ra], "cpf": cpf, "telefone": telefone}
+
+    def matricula(self, pos, com_aluno=False):
+        dados = registro_para_dict(self.matriculas[pos])
+        dados["turma"] = self.nome_turma(dados["id_turma"])
+        dados["materia"] = self.nome_materia(dados["id_materia"])
+        if com_aluno: dados["nome"] = self.alunos.get(dados["ra_aluno"], "Desconhecido")
+        return dados
+
+    def boletim(self, ra):
+        return {"aluno": self.aluno(ra), "matriculas": [self.matricula(pos) for pos in self.por_aluno.get(ra, [])]}
+
+    def turma(self, id_turma):
+        if id_turma not in self.turmas: raise ErroConsulta(404, f"turma {id_turma} não encontrada")
+        return {"id": id_turma, "nome": self.turmas[id_turma],
+                "materias": [{"id": m, "nome": self.nome_materia(m)} for m in self.grade.get(id_turma, [])]}
+
+    def notas(self, id_turma, id_materia):
+        if id_materia not in self.grade.get(id_turma, ()) and (id_turma, id_materia) not in self.por_grade:
+            raise ErroConsulta(404, f"a matéria {id_materia} não está na grade da turma {id_turma}")
+        return {"turma": {"id": id_turma, "nome": self.nome_turma(id_turma)},
+                "materia": {"id": id_materia, "nome": self.nome_materia(id_materia)},
+                "matriculas": [self.matricula(pos, com_aluno=True) for pos in self.por_grade.get((id_turma, id_materia), [])]}
+
+    def lista_exames(self, id_turma=None, id_materia=None):
+        return [self.matricula(pos, com_aluno=True) for pos in self.exames
+                if (id_turma is None or self.matriculas[pos].id_turma == id_turma)
+                and (id_materia is None or self.matriculas[pos].id_materia == id_materia)]
+
+    def status(self):
+        return {"motor": servico.motor,
+                "montado_em": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.montado_em)),
+                "alunos": len(self.alunos), "turmas": len(self.turmas), "materias": len(self.materias),
+                "matriculas": sum(len(p) for p in self.por_aluno.values()), "em_exame": len(self.exames)}
+
+    # Caminho (sem a query) e parâmetros -> objeto da resposta. ErroConsulta se não existir
+    def consultar(self, partes, parametros):
+        if len(partes) == 3 and partes[:2] == ["boletim", "ra"]: return self.boletim(numero(partes[2], "RA"))
+        if len(partes) == 3 and partes[:2] == ["boletim", "cpf"]:
+            ra = self.cpfs.get(partes[2])
+            if ra is None: raise ErroConsulta(404, f"CPF {partes[2]} não encontrado")
+            return self.boletim(ra)
+        rota = tuple("*" if i % 2 else parte for i, parte in enumerate(partes))  # /turmas/3 -> ("turmas", "*")
+        if rota == ("turmas",): return [self.turma(id_turma) for id_turma in self.turmas]
+        if rota == ("turmas", "*"): return self.turma(numero(partes[1], "turma"))
+        if rota == ("turmas", "*", "materias", "*"):
+            return self.notas(numero(partes[1], "turma"), numero(partes[3], "matéria"))
+        if rota == ("materias",): return [{"id": id_materia, "nome": nome} for id_materia, nome in self.materias.items()]
+        if rota == ("exames",):
+            return self.lista_exames(parametro_numero(parametros, "turma"), parametro_numero(parametros, "materia"))
+        if rota == ("status",): return self.status()
+        if rota == ("diagnostico",): return instrumentacao.relatorio()
+        raise ErroConsulta(404, "caminho desconhecido")
+
+    # Corpo JSON da resposta; o mesmo pedido no mesmo índice sai da memória (o diagnóstico não)
+    def responder(self, alvo):
+        corpo = self.respostas.get(alvo)
+        if corpo is not None: return corpo
+        url = urlsplit(alvo)
+        partes = [unquote(parte) for parte in url.path.split("/") if parte]
+        corpo = json.dumps(self.consultar(partes, parse_qs(url.query)), ensure_ascii=False).encode("utf-8")
+        if partes != ["diagnostico"] and len(self.respostas) < MAXIMO_RESPOSTAS_GUARDADAS:
+            self.respostas[alvo] = corpo
+        return corpo
+
+def numero(texto, campo):
+    try:
+        return int(texto)
+    except ValueError:
+        raise ErroConsulta(400, f"{campo} inválido: {texto}") from None
+
+def parametro_numero(parametros, nome):
+    valores = parametros.get(nome)
+    return numero(valores[0], nome) if valores else None
+
+# --- Montagem do índice (fora da thread do asyncio) ---
+# Os cadastros seguem o CacheCadastros (só o que entrou desde a última vez, ou tudo de novo
+# depois de uma exclusão); CPF e telefone vêm pelo ao_aplicar. As matrículas mudam no lugar
+# a cada nota lançada: são copiadas de novo sempre que o matriculas.dat muda
+class MontadorIndice:
+    def __init__(self):
+        self.dados_alunos, self.cpfs = {}, {}
+        self.cadastros = CacheCadastros(ao_aplicar=self.aplicar_aluno, ao_limpar=self.limpar_alunos)
+        self.visao_matriculas = VisaoMapeada(TABELA_MATRICULAS)
+
+    def aplicar_aluno(self, tabela, registro):
+        if tabela != TABELA_ALUNOS: return
+        cpf = registro.cpf.decode("utf-8")
+        self.dados_alunos[registro.ra] = (cpf, registro.telefone.decode("utf-8"))
+        self.cpfs.setdefault(cpf, registro.ra)  # CPF repetido: fica o primeiro, como no buscarAlunoPorCPF
+
+    def limpar_alunos(self):
+        self.dados_alunos.clear()
+        self.cpfs.clear()
+
+    def montar(self):
+        with instrumentacao.medir("api: montagem do índice"):
+            assinaturas = assinaturas_arquivos()  # antes de ler: o que mudar depois é pego na próxima
+            self.cadastros.sincronizar()
+            registros = self.visao_matriculas.atualizar()
+            matriculas = (Matricula * len(registros)).from_buffer_copy(registros)
+            return IndiceConsultas(self.cadastros, self.dados_alunos, self.cpfs, matriculas, assinaturas)
+
+# --- Servidor HTTP ---
+MOTIVOS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error"}
+
+class ServidorConsultas:
+    def __init__(self, intervalo=INTERVALO_VERIFICACAO):
+        self.montador = MontadorIndice()
+        self.indice = None
+        self.intervalo = intervalo
+
+    async def iniciar(self, host, porta):
+        self.indice = await asyncio.to_thread(self.montador.montar)
+        self.verificacao = asyncio.create_task(self.verificar_arquivos())
+        return await asyncio.start_server(self.atender, host, porta)
+
+    # Confere tamanho/mtime/inode dos .dat (só os stat) e monta um índice novo quando mudam.
+    # Enquanto ele é montado as consultas continuam respondendo pelo anterior
+    async def verificar_arquivos(self):
+        while True:
+            await asyncio.sleep(self.intervalo)
+            if assinaturas_arquivos() == self.indice.assinaturas: continue
+            try:
+                self.indice = await asyncio.to_thread(self.montador.montar)
+            except Exception as e:  # qualquer erro (.dat no meio de uma troca...): tenta na próxima rodada
+                print(f"Erro ao atualizar o índice: {e!r}", file=sys.stderr)
+
+    async def atender(self, reader, writer):
+        try:
+            while await self.atender_pedido(reader, writer): pass
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    # Linha do pedido e cabeçalhos; None se o cliente fechou a conexão sem mandar nada
+    async def ler_pedido(self, reader):
+        linha = await reader.readline()
+        if not linha: return None
+        metodo, alvo, versao = linha.decode("latin-1").split()
+        cabecalhos = {}
+        for _ in range(MAXIMO_CABECALHOS):
+            cabecalho = await reader.readline()
+            if cabecalho in (b"\r\n", b"\n", b""): break
+            nome, _, valor = cabecalho.decode("latin-1").partition(":")
+            cabecalhos[nome.strip().lower()] = valor.strip().lower()
+        else:
+            raise ValueError("cabeçalhos demais")
+        return metodo, alvo, versao, cabecalhos
+
+    # Um pedido por vez na mesma conexão; retorna se a conexão continua aberta. O pedido
+    # inteiro tem TEMPO_OCIOSO para chegar: quem para no meio não segura a conexão.
+    # A API não usa corpo: pedido com corpo é recusado e a conexão fecha sem lê-lo
+    async def atender_pedido(self, reader, writer):
+        pedido = await asyncio.wait_for(self.ler_pedido(reader), TEMPO_OCIOSO)
+        if pedido is None: return False
+        metodo, alvo, versao, cabecalhos = pedido
+        conexao = cabecalhos.get("connection", "")
+        manter = conexao == "keep-alive" if versao == "HTTP/1.0" else conexao != "close"
+
+        if cabecalhos.get("content-length", "0") != "0" or "transfer-encoding" in cabecalhos:
+            status, corpo = 400, json.dumps({"erro": "pedido com corpo não é aceito"}, ensure_ascii=False).encode("utf-8")
+            manter = False
+        elif metodo not in ("GET", "HEAD"):
+            status, corpo = 405, json.dumps({"erro": "só GET e HEAD"}, ensure_ascii=False).encode("utf-8")
+        else:
+            with instrumentacao.medir("api: pedido"):
+                status, corpo = self.responder(alvo)
+        cabecalho = (f"HTTP/1.1 {status} {MOTIVOS[status]}\r\n"
+                     "Content-Type: application/json; charset=utf-8\r\n"
+                     f"Content-Length: {len(corpo)}\r\n"
+                     f"Connection: {'keep-alive' if manter else 'close'}\r\n")
+        if status == 405: cabecalho += "Allow: GET, HEAD\r\n"
+        writer.write(cabecalho.encode("latin-1") + b"\r\n" + (corpo if metodo != "HEAD" else b""))
+        await writer.drain()
+        return manter
+
+    def responder(self, alvo):
+        try:
+            return 200, self.indice.responder(alvo)
+        except ErroConsulta as e:
+            return e.status, json.dumps({"erro": str(e)}, ensure_ascii=False).encode("utf-8")
+        except Exception as e:  # a conexão segue: um pedido com erro não derruba o servidor
+            print(f"Erro em {alvo}: {e!r}", file=sys.stderr)
+            return 500, json.dumps({"erro": "erro interno"}).encode("utf-8")
+
+async def servir(args):
+    servidor = ServidorConsultas(args.intervalo)
+    inicio = time.perf_counter()
+    tcp = await servidor.iniciar(args.host, args.porta)
+    status = servidor.indice.status()
+    print(f"Índice montado em {time.perf_counter() - inicio:.2f} s ({status['alunos']} alunos, "
+          f"{status['matriculas']} matrículas). Atendendo em http://{args.host}:{args.porta}/")
+    async with tcp:
+        await tcp.serve_forever()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="API HTTP (só leitura) de boletins, grade e exames do SGA.")
+    parser.add_argument("--pasta", help="pasta com os arquivos .dat (padrão: pasta atual)")
+    parser.add_argument("--motor", choices=servico.MOTORES, help=f"motor de armazenamento (padrão: {servico.motor})")
+    parser.add_argument("--host", default="127.0.0.1", help="endereço (padrão: 127.0.0.1, só este computador)")
+    parser.add_argument("--porta", type=int, default=PORTA_PADRAO, help=f"porta (padrão: {PORTA_PADRAO})")
+    parser.add_argument("--intervalo", type=float, default=INTERVALO_VERIFICACAO,
+                        help=f"segundos entre as conferências dos .dat (padrão: {INTERVALO_VERIFICACAO})")
+    args = parser.parse_args(argv)
+    try:
+        if args.pasta: os.chdir(args.pasta)
+        if args.motor: servico.escolher_motor(args.motor)
+        servico.carregar_biblioteca()
+        servico.conferir_formato()
+        asyncio.run(servir(args))
+    except (OSError, ValueError) as e:
+        print(f"Erro: {e}", file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,110 +1,169 @@
-import tkinter as tk
-from tkinter import ttk, messagebox
-import ctypes
-import os
-import random
 import time
-from collections import defaultdict
-
-# --- 1. A Ponte (ctypes) - 5 estruturas ---
-
-class Aluno(ctypes.Structure):
-    _fields_ = [
-        ("ra", ctypes.c_long),
-        ("nome", ctypes.c_char * 100),
-        ("cpf", ctypes.c_char * 15),
-        ("telefone", ctypes.c_char * 20)
-    ]
-class Turma(ctypes.Structure): _fields_ = [("id", ctypes.c_int), ("nome", ctypes.c_char * 100)]
-class Materia(ctypes.Structure): _fields_ = [("id", ctypes.c_int), ("nome", ctypes.c_char * 100)]
-class Matricula(ctypes.Structure):
-    _fields_ = [
-        ("ra_aluno", ctypes.c_long),
-        ("id_turma", ctypes.c_int),
-        ("id_materia", ctypes.c_int),
-        ("np1", ctypes.c_float), ("np2", ctypes.c_float), ("pim", ctypes.c_float),
-        ("faltas", ctypes.c_int),
-        ("media_final", ctypes.c_float),
-        ("status", ctypes.c_char * 20)
-    ]
-class TurmaMateria(ctypes.Structure): _fields_ = [("id_turma", ctypes.c_int), ("id_materia", ctypes.c_int)]
-
-# --- Carrega a biblioteca C ---
-lib_c_path = "./database.dll"
-if not os.path.exists(lib_c_path):
-    messagebox.showerror("Erro Crítico", f"Biblioteca C não encontrada em {lib_c_path}\nCompile o 'database.c' (nova versão) primeiro!")
-    exit()
-try:
-    lib_c = ctypes.CDLL(lib_c_path)
-except OSError as e:
-    messagebox.showerror("Erro Crítico", f"Não foi possível carregar a DLL. {e}")
-    exit()
-
-# --- Define os tipos de argumentos e retorno (BOA PRÁTICA) ---
-
-# Aluno
-lib_c.salvarAluno.argtypes = [Aluno]
-lib_c.carregarAlunos.argtypes = [ctypes.POINTER(Aluno), ctypes.c_int]
-lib_c.carregarAlunos.restype = ctypes.c_int
-lib_c.buscarAlunoPorRA.argtypes = [ctypes.c_long, ctypes.POINTER(Aluno)]
-lib_c.buscarAlunoPorRA.restype = ctypes.c_int
-# --- NOVO: Definição da busca por CPF ---
-lib_c.buscarAlunoPorCPF.argtypes = [ctypes.c_char_p, ctypes.POINTER(Aluno)]
-lib_c.buscarAlunoPorCPF.restype = ctypes.c_int
-
-# Turma
-lib_c.salvarTurma.argtypes = [Turma]
-lib_c.carregarTurmas.argtypes = [ctypes.POINTER(Turma), ctypes.c_int]
-lib_c.carregarTurmas.restype = ctypes.c_int
-
-# Materia
-lib_c.salvarMateria.argtypes = [Materia]
-lib_c.carregarMaterias.argtypes = [ctypes.POINTER(Materia), ctypes.c_int]
-lib_c.carregarMaterias.restype = ctypes.c_int
-
-# Matricula
-lib_c.salvarMatricula.argtypes = [Matricula]
-lib_c.carregarMatriculas.argtypes = [ctypes.POINTER(Matricula), ctypes.c_int]
-lib_c.carregarMatriculas.restype = ctypes.c_int
-lib_c.atualizarMatricula.argtypes = [Matricula]
-
-# Grade (TurmaMateria)
-lib_c.salvarTurmaMateria.argtypes = [TurmaMateria]
-lib_c.carregarTurmaMateria.argtypes = [ctypes.POINTER(TurmaMateria), ctypes.c_int]
-lib_c.carregarTurmaMateria.restype = ctypes.c_int
-
-
-# --- 2. A Lógica de Cálculo (Python) (Sem mudanças) ---
-def calcular_status(np1, np2, pim, faltas):
-    if faltas >= 15:
-        media = 0.0
-        status = "Reprovado (Faltas)"
-        return media, status
-    media = ((np1 * 4) + (np2 * 4) + (pim * 2)) / 10.0
-    status = "Aprovado" if media >= 7.0 else "Exame"
-    return media, status
-
-# --- 3. A Aplicação Tkinter ---
+INICIO_PROGRAMA = time.perf_counter()  # antes dos outros imports, que também contam na abertura
+import os
+import sys
+import tkinter as tk
+from tkinter import ttk, messagebox, filedialog
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Estruturas, acesso à biblioteca C e regras de cálculo ficam em servico.py
+import servico
+from servico import (lib_c, TABELA_ALUNOS, TABELA_TURMAS, TABELA_MATERIAS, TABELA_MATRICULAS, TABELA_GRADE,
+                     ARQUIVOS_TABELAS, VisaoMapeada, consultar_matriculas, atualizar_matriculas_lote,
+                     calcular_status, montar_matricula, recalcular_matriculas, CacheCadastros,
+                     linhas_boletim, linhas_notas, linhas_exames, SITUACOES, estatisticas_turmas,
+                     estatisticas_situacoes, resumo_estatistica, linhas_estatisticas, linhas_faixas,
+                     instrumentacao)
+
+# Cópia do cache dos cadastros em disco (servico.ARQUIVO_COPIA_CACHE) para abrir mais rápido
+# da próxima vez; SGA_COPIA_CACHE=0 desliga
+USAR_COPIA_CACHE = os.environ.get("SGA_COPIA_CACHE", "1") != "0"
+
+# --- Consulta em segundo plano ---
+# Compartilhada entre a thread do Tkinter e a thread de consultas: a interface marca
+# 'cancelada', a consulta informa 'progresso' e para de trabalhar quando é cancelada
+class ConsultaCancelada(Exception): pass
+
+class TarefaSegundoPlano:
+    PASSO_PROGRESSO = 1000  # registros processados entre uma verificação e outra
+
+    def __init__(self, descricao):
+        self.descricao = descricao
+        self.cancelada = False
+        self.progresso = None  # (feitos, total)
+
+    # Percorre os registros informando o progresso; interrompe se a consulta foi cancelada
+    def acompanhar(self, registros):
+        total = len(registros)
+        for i, registro in enumerate(registros):
+            if i % self.PASSO_PROGRESSO == 0:
+                if self.cancelada: raise ConsultaCancelada()
+                self.progresso = (i, total)
+            yield registro
+        self.progresso = (total, total)
+
+# --- Tabela preenchida em blocos ---
+# Adaptador do ttk.Treeview para resultados grandes: limpa tudo numa chamada só e insere
+# as linhas em blocos agendados com after(). O primeiro bloco (mais do que cabe na tela)
+# aparece na hora; o resto vai entrando sem travar a janela.
+class TabelaEmBlocos:
+    TAMANHO_BLOCO = 300
+    INTERVALO_BLOCOS_MS = 1
+
+    def __init__(self, tree):
+        self.tree = tree
+        self.pendentes = deque()  # (iid ou None, valores) ainda não inseridos
+        self.inseridas = 0
+        self.agendamento = None
+        barra = ttk.Scrollbar(tree.master, orient="vertical", command=tree.yview)
+        barra.pack(side="right", fill="y", before=tree)
+        tree.configure(yscrollcommand=barra.set)
+
+    def limpar(self):
+        if self.agendamento is not None:
+            self.tree.after_cancel(self.agendamento)
+            self.agendamento = None
+        self.pendentes.clear()
+        self.inseridas = 0
+        self.tree.delete(*self.tree.get_children())
+
+    # iid: função que calcula o iid da linha a partir dos valores (None = automático)
+    def preencher(self, linhas, iid=None):
+        self.limpar()
+        self.acrescentar(linhas, iid)
+
+    def acrescentar(self, linhas, iid=None):
+        self.pendentes.extend((iid(valores) if iid else None, valores) for valores in linhas)
+        if self.agendamento is not None or not self.pendentes: return
+        if self.inseridas < self.TAMANHO_BLOCO: self.inserir_bloco()  # tela ainda não está cheia
+        else: self.agendamento = self.tree.after(self.INTERVALO_BLOCOS_MS, self.inserir_bloco)
+
+    # Atualiza a linha se ela já está na tabela; senão entra na fila como linha nova
+    def definir(self, iid, valores):
+        if self.tree.exists(iid): self.tree.item(iid, values=valores)
+        else: self.acrescentar([valores], lambda v: iid)
+
+    def inserir_bloco(self):
+        self.agendamento = None
+        with instrumentacao.medir("tela: bloco de linhas"):
+            for _ in range(min(self.TAMANHO_BLOCO, len(self.pendentes))):
+                iid, valores = self.pendentes.popleft()
+                if iid is None: self.tree.insert("", "end", values=valores)
+                elif self.tree.exists(iid): self.tree.item(iid, values=valores)  # repetida na fila
+                else: self.tree.insert("", "end", iid=iid, values=valores)
+                self.inseridas += 1
+        if self.pendentes:
+            self.agendamento = self.tree.after(self.INTERVALO_BLOCOS_MS, self.inserir_bloco)
+
+# --- Medição da abertura (python app.py --medir-abertura) ---
+# Cada marcar() guarda o tempo desde a marca anterior e desde o início do programa;
+# registrar() guarda uma fase medida à parte (montagem de uma aba, leitura na thread)
+class TemposAbertura:
+    def __init__(self, inicio, ativo=False):
+        self.inicio = self.anterior = inicio
+        self.ativo = ativo
+        self.fases = []  # (fase, segundos, segundos desde o início ou None)
+
+    def marcar(self, fase):
+        agora = time.perf_counter()
+        self.fases.append((fase, agora - self.anterior, agora - self.inicio))
+        self.anterior = agora
+
+    def registrar(self, fase, segundos):
+        self.fases.append((fase, segundos, None))
+
+    def relatorio(self):
+        linhas = [f"{'fase':<45}{'ms':>10}{'desde o início':>16}"]
+        for fase, segundos, desde_inicio in self.fases:
+            total = f"{desde_inicio * 1000:.1f}" if desde_inicio is not None else ""
+            linhas.append(f"{fase:<45}{segundos * 1000:>10.1f}{total:>16}")
+        return "\n".join(linhas)
+
+# --- A Aplicação Tkinter ---
 
 class App(tk.Tk):
     
-    MAX_REGISTROS = 256 
-    
-    def __init__(self):
+    def __init__(self, tempos=None):
         super().__init__()
+        self.tempos = tempos or TemposAbertura(time.perf_counter())
         self.title("Sistema de Gestão Acadêmica (SGA)")
         self.geometry("900x700")
         
-        # Caches de dados
-        self.cache_alunos = {} 
-        self.cache_turmas = {} 
-        self.cache_materias = {} 
-        self.cache_grade = defaultdict(list)
+        # Caches de dados (servico.CacheCadastros); os nomes curtos continuam valendo
+        # porque o cache só limpa e preenche estes mesmos dicionários
+        self.visoes = {tabela: VisaoMapeada(tabela) for tabela in ARQUIVOS_TABELAS}
+        self.visao_matriculas = self.visoes[TABELA_MATRICULAS]
+        self.cache = CacheCadastros(self.visoes, ao_aplicar=self.mostrar_registro_cache, ao_limpar=self.limpar_tabelas_cache)
+        self.cache_alunos = self.cache.alunos
+        self.cache_turmas = self.cache.turmas
+        self.cache_materias = self.cache.materias
+        self.cache_grade = self.cache.grade
         
         self.ra_aluno_encontrado = None 
         self.matricula_selecionada = None 
+        self.alteracoes_notas = {}  # ra -> (np1, np2, pim, faltas) editados na grade e ainda não salvos
+        # (id_turma, id_materia) das matrículas que estão na grade: as alterações são gravadas
+        # nela, mesmo que os combos tenham mudado depois
+        self.filtro_notas = None
+        # Consultas rodando em segundo plano: nome -> TarefaSegundoPlano
+        self.tarefas_ativas = {}
+        # Uma thread basta: as chamadas à biblioteca C são feitas uma por vez de qualquer jeito
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.protocol("WM_DELETE_WINDOW", self.fechar)
+        
+        # --- Barra de progresso das consultas (embaixo da janela) ---
+        self.frame_progresso = ttk.Frame(self, padding=(10, 0, 10, 5))
+        self.frame_progresso.pack(fill="x", side="bottom")
+        self.lbl_progresso = ttk.Label(self.frame_progresso, text="")
+        self.lbl_progresso.pack(side="left")
+        self.btn_cancelar_consulta = ttk.Button(self.frame_progresso, text="Cancelar", command=self.cancelar_consultas, state="disabled")
+        self.btn_cancelar_consulta.pack(side="right")
+        self.barra_progresso = ttk.Progressbar(self.frame_progresso, mode="indeterminate", length=200)
+        self.barra_progresso.pack(side="right", padx=10)
         
         # --- Criação das Abas ---
+        # Só os frames: o conteúdo de cada aba é montado na primeira vez que ela é aberta
         self.notebook = ttk.Notebook(self)
         self.notebook.pack(fill="both", expand=True, padx=10, pady=10)
         
@@ -114,90 +173,242 @@ class App(tk.Tk):
         # --- NOVO: Aba de Busca/Boletim ---
         self.tab_boletim = ttk.Frame(self.notebook)
         self.tab_exames = ttk.Frame(self.notebook)
+        self.tab_estatisticas = ttk.Frame(self.notebook)
+        self.tab_diagnostico = ttk.Frame(self.notebook)
         
         self.notebook.add(self.tab_gestao, text=" Gestão ")
         self.notebook.add(self.tab_alunos, text=" Alunos ")
         self.notebook.add(self.tab_notas, text=" Notas e Faltas ")
         self.notebook.add(self.tab_boletim, text=" Boletim Aluno ")
         self.notebook.add(self.tab_exames, text=" Alunos em Exame ")  # Nova aba
-
-        # --- Popula cada Aba ---
-        self.criar_aba_gestao()
-        self.criar_aba_alunos()
-        self.criar_aba_notas()
-        self.criar_aba_boletim()
-        self.criar_aba_exames()  # Nova aba
-
-        
-        self.carregar_dados_para_cache()
-        self.atualizar_comboboxes_globais()
+        self.notebook.add(self.tab_estatisticas, text=" Estatísticas ")
+        self.notebook.add(self.tab_diagnostico, text=" Diagnóstico ")
+
+        # --- Popula cada Aba (ver construir_aba) ---
+        self.construtores_abas = {
+            str(self.tab_gestao): self.criar_aba_gestao,
+            str(self.tab_alunos): self.criar_aba_alunos,
+            str(self.tab_notas): self.criar_aba_notas,
+            str(self.tab_boletim): self.criar_aba_boletim,
+            str(self.tab_exames): self.criar_aba_exames,
+            str(self.tab_estatisticas): self.criar_aba_estatisticas,
+            str(self.tab_diagnostico): self.criar_aba_diagnostico,
+        }
+        self.notebook.bind("<<NotebookTabChanged>>", self.on_aba_trocada)
+        self.construir_aba(self.tab_gestao)  # a aba que aparece na abertura
+
+        # Os cadastros são carregados em segundo plano depois que a janela aparece
+        self.estado_copia = None  # estado dos .dat segundo a cópia em disco lida na abertura
+        self.after_idle(self.iniciar_carga_cache)
+        # Acompanha mudanças feitas nos .dat por outros programas
+        self.after(self.INTERVALO_SINCRONIZACAO_MS, self.sincronizar_periodicamente)
+
+    # --- Abas montadas sob demanda ---
+    # Montar todas na abertura custava tempo antes da primeira tela; cada aba preenche
+    # os próprios comboboxes com o que já estiver no cache quando for montada
+    def construir_aba(self, aba):
+        criar = self.construtores_abas.pop(str(aba), None)
+        if criar is None: return
+        inicio = time.perf_counter()
+        criar()
+        self.tempos.registrar(f"montagem da aba {self.notebook.tab(aba, 'text').strip()}", time.perf_counter() - inicio)
+
+    def aba_montada(self, aba):
+        return str(aba) not in self.construtores_abas
+
+    def on_aba_trocada(self, event=None):
+        aba = self.notebook.select()
+        self.construir_aba(aba)
+        # Os números mudam a cada nota lançada: recarrega sempre que a aba é aberta
+        if aba == str(self.tab_estatisticas): self.carregar_estatisticas()
+        elif aba == str(self.tab_diagnostico): self.mostrar_diagnostico()
 
     # --- Funções de Carregamento de Dados ---
     
+    # Alunos, turmas, matérias e grade ficam em cache (matrículas são sempre consultadas no arquivo)
+    INTERVALO_SINCRONIZACAO_MS = 3000
+
+    # Recarga completa: quando algum .dat foi reescrito (exclusões)
     def carregar_dados_para_cache(self):
-        # Limpa caches
-        self.cache_alunos.clear()
-        self.cache_turmas.clear()
-        self.cache_materias.clear()
-        self.cache_grade.clear()
-
-        # Carrega Alunos
-        AlunoArray = Aluno * self.MAX_REGISTROS
-        buffer_a = AlunoArray()
-        num_alunos = lib_c.carregarAlunos(buffer_a, self.MAX_REGISTROS)
-        for i in range(num_alunos):
-            aluno = buffer_a[i]
-            self.cache_alunos[aluno.ra] = aluno.nome.decode('utf-8')
-            
-        # Carrega Turmas
-        TurmaArray = Turma * self.MAX_REGISTROS
-        buffer_t = TurmaArray()
-        num_turmas = lib_c.carregarTurmas(buffer_t, self.MAX_REGISTROS)
-        for i in range(num_turmas):
-            turma = buffer_t[i]
-            self.cache_turmas[turma.id] = turma.nome.decode('utf-8')
-            
-        # Carrega Matérias
-        MateriaArray = Materia * self.MAX_REGISTROS
-        buffer_m = MateriaArray()
-        num_materias = lib_c.carregarMaterias(buffer_m, self.MAX_REGISTROS)
-        for i in range(num_materias):
-            materia = buffer_m[i]
-            self.cache_materias[materia.id] = materia.nome.decode('utf-8')
-            
-        # Carrega a Grade
-        GradeArray = TurmaMateria * self.MAX_REGISTROS
-        buffer_g = GradeArray()
-        num_grade = lib_c.carregarTurmaMateria(buffer_g, self.MAX_REGISTROS)
-        for i in range(num_grade):
-            ligacao = buffer_g[i]
-            if ligacao.id_materia not in self.cache_grade[ligacao.id_turma]:
-                self.cache_grade[ligacao.id_turma].append(ligacao.id_materia)
-
-        # Atualiza tabelas na Aba Gestão
-        self.atualizar_tree_gestao(self.tree_turmas, self.cache_turmas)
-        self.atualizar_tree_gestao(self.tree_materias, self.cache_materias)
-        self.atualizar_tree_grade()
+        carga = self.tarefas_ativas.pop("cache", None)
+        if carga:  # a carga da abertura ainda em andamento ficaria mais velha que esta
+            carga.cancelada = True
+            self.atualizar_progresso()
+        self.cache.carregar()
+
+    # --- Carga dos cadastros em segundo plano ---
+    # A janela aparece antes: os .dat são lidos na thread de consultas num cache separado
+    # (a thread não mexe nos widgets nem no cache da tela) que é adotado quando fica pronto.
+    # Com a cópia em disco, só o que mudou nos .dat desde que ela foi gravada é lido.
+    # Se a carga for cancelada, a sincronização periódica carrega tudo na próxima rodada
+    def iniciar_carga_cache(self):
+        self.update_idletasks()
+        self.tempos.marcar("primeira tela desenhada")
+
+        def consulta(tarefa):
+            novo = CacheCadastros()
+            inicio = time.perf_counter()
+            copia = USAR_COPIA_CACHE and novo.carregar_copia()
+            estado_copia = dict(novo.estado) if copia else None
+            lida = time.perf_counter()
+            novo.sincronizar()
+            fases = [("  leitura da cópia em disco", lida - inicio)] if copia else []
+            fases.append(("  .dat alterados depois da cópia" if copia else "  leitura dos .dat", time.perf_counter() - lida))
+            return novo, estado_copia, fases
+
+        def ao_terminar(resultado):
+            novo, estado_copia, fases = resultado
+            self.tempos.marcar("cadastros carregados (segundo plano)")
+            for fase, segundos in fases: self.tempos.registrar(fase, segundos)
+            self.cache.adotar(novo)
+            self.estado_copia = estado_copia
+            self.preencher_tabelas_cache()
+            self.atualizar_comboboxes_globais()
+            self.tempos.marcar("cadastros na tela")
+            if self.tempos.ativo: self.after_idle(self.terminar_medicao)
+
+        self.executar_em_segundo_plano("cache", "Carregando cadastros...", consulta, ao_terminar)
+
+    # Grava a cópia em disco se os .dat mudaram desde a que foi lida (ou se não havia cópia)
+    def salvar_copia_cache(self):
+        if not USAR_COPIA_CACHE or not self.cache.estado or self.cache.estado == self.estado_copia: return
+        inicio = time.perf_counter()
+        try:
+            self.cache.salvar_copia()
+        except OSError:
+            return  # a cópia é só um atalho: sem ela a próxima abertura lê os .dat
+        self.tempos.registrar("gravação da cópia em disco", time.perf_counter() - inicio)
+
+    # Modo --medir-abertura: mede a montagem das outras abas e fecha
+    def terminar_medicao(self):
+        for aba in list(self.construtores_abas): self.construir_aba(aba)
+        self.fechar()
+
+    # Aplica só os registros acrescentados nos .dat desde a última vez (por este ou por outro programa)
+    def sincronizar_caches(self):
+        with instrumentacao.medir("tela: sincronização dos cadastros"):
+            alteradas = self.cache.sincronizar()
+        if alteradas & {TABELA_TURMAS, TABELA_MATERIAS}: self.atualizar_comboboxes_globais()
+
+    def sincronizar_periodicamente(self):
+        # Com consulta em andamento a biblioteca está ocupada: sincroniza na próxima rodada
+        if not self.tarefas_ativas: self.sincronizar_caches()
+        self.after(self.INTERVALO_SINCRONIZACAO_MS, self.sincronizar_periodicamente)
+
+    # Aplica um registro (novo ou relido do arquivo) no cache e, pelo mostrar_registro_cache,
+    # nas tabelas da tela. Pode ser chamado duas vezes para o mesmo registro sem duplicar nada
+    def aplicar_registro_cache(self, tabela, registro):
+        self.cache.aplicar(tabela, registro)
+
+    def mostrar_registro_cache(self, tabela, registro):
+        if tabela in (TABELA_TURMAS, TABELA_MATERIAS):
+            tabela_tela = self.tabela_turmas if tabela == TABELA_TURMAS else self.tabela_materias
+            tabela_tela.definir(registro.id, (registro.id, registro.nome.decode('utf-8')))
+        elif tabela == TABELA_GRADE:
+            self.tabela_grade.definir(f"{registro.id_turma}:{registro.id_materia}",
+                                      (self.cache.nome_turma(registro.id_turma), self.cache.nome_materia(registro.id_materia)))
+
+    def limpar_tabelas_cache(self):
+        for tabela in (self.tabela_turmas, self.tabela_materias, self.tabela_grade):
+            tabela.limpar()
+
+    # Mostra o cache inteiro de uma vez (depois de adotar o cache carregado em segundo plano)
+    def preencher_tabelas_cache(self):
+        self.limpar_tabelas_cache()
+        for id_turma, nome in self.cache_turmas.items(): self.tabela_turmas.definir(id_turma, (id_turma, nome))
+        for id_materia, nome in self.cache_materias.items(): self.tabela_materias.definir(id_materia, (id_materia, nome))
+        for id_turma, materias in self.cache_grade.items():
+            for id_materia in materias:
+                self.tabela_grade.definir(f"{id_turma}:{id_materia}", (self.cache.nome_turma(id_turma), self.cache.nome_materia(id_materia)))
     
+    # --- Consultas em segundo plano ---
+    # A consulta roda numa thread (a janela continua respondendo) e o resultado volta
+    # para a thread do Tkinter pelo after(): a thread nunca mexe nos widgets.
+    # Cada tipo de consulta tem um nome; pedir de novo cancela a anterior do mesmo nome.
+    # Com a instrumentação ligada, a consulta e a atualização da tela entram no Diagnóstico
+    INTERVALO_ACOMPANHAMENTO_MS = 50
+
+    def executar_em_segundo_plano(self, nome, descricao, consulta, ao_terminar):
+        consulta = instrumentacao.instrumentar(f"consulta: {nome}", consulta)
+        ao_terminar = instrumentacao.instrumentar(f"tela: {nome}", ao_terminar)
+        anterior = self.tarefas_ativas.get(nome)
+        if anterior: anterior.cancelada = True
+        tarefa = TarefaSegundoPlano(descricao)
+        self.tarefas_ativas[nome] = tarefa
+        futuro = self.executor.submit(consulta, tarefa)
+        self.atualizar_progresso()
+        self.after(self.INTERVALO_ACOMPANHAMENTO_MS, self.acompanhar_tarefa, nome, tarefa, futuro, ao_terminar)
+
+    def acompanhar_tarefa(self, nome, tarefa, futuro, ao_terminar):
+        if not futuro.done():
+            self.atualizar_progresso()
+            return self.after(self.INTERVALO_ACOMPANHAMENTO_MS, self.acompanhar_tarefa, nome, tarefa, futuro, ao_terminar)
+        if self.tarefas_ativas.get(nome) is tarefa: del self.tarefas_ativas[nome]
+        self.atualizar_progresso()
+        if tarefa.cancelada: return  # cancelada ou substituída por outra consulta: descarta
+        try:
+            resultado = futuro.result()
+        except Exception as e:
+            return messagebox.showerror("Erro", f"Ocorreu um erro: {e}")
+        ao_terminar(resultado)
+
+    def atualizar_progresso(self):
+        if not self.tarefas_ativas:
+            self.barra_progresso.stop()
+            self.lbl_progresso.config(text="")
+            self.btn_cancelar_consulta.config(state="disabled")
+            return
+        tarefa = list(self.tarefas_ativas.values())[-1]  # a mais recente
+        texto = tarefa.descricao
+        if tarefa.progresso:
+            feitos, total = tarefa.progresso
+            texto += f" ({feitos} de {total})"
+        self.lbl_progresso.config(text=texto)
+        if not self.btn_cancelar_consulta.instate(["!disabled"]):
+            self.barra_progresso.start(15)
+            self.btn_cancelar_consulta.config(state="normal")
+
+    def cancelar_consultas(self):
+        for tarefa in self.tarefas_ativas.values(): tarefa.cancelada = True
+        self.tarefas_ativas.clear()
+        self.atualizar_progresso()
+
+    def fechar(self):
+        self.cancelar_consultas()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.salvar_copia_cache()
+        self.destroy()
+
+    def lista_turmas(self): return [f"{nome} (ID: {id})" for id, nome in self.cache_turmas.items()]
+
+    def lista_materias(self): return [f"{nome} (ID: {id})" for id, nome in self.cache_materias.items()]
+
+    # Só nas abas já montadas: as outras pegam as listas quando forem montadas
     def atualizar_comboboxes_globais(self):
-        turma_list = [f"{nome} (ID: {id})" for id, nome in self.cache_turmas.items()]
-        materia_list = [f"{nome} (ID: {id})" for id, nome in self.cache_materias.items()]
+        turma_list = self.lista_turmas()
+        materia_list = self.lista_materias()
         
         # Aba Gestão (Grade)
-        self.combo_grade_turma['values'] = turma_list
-        self.combo_grade_materia['values'] = materia_list
+        if self.aba_montada(self.tab_gestao):
+            self.combo_grade_turma['values'] = turma_list
+            self.combo_grade_materia['values'] = materia_list
         
         # Aba Alunos (Matricular)
-        self.combo_turma_mat['values'] = turma_list
+        if self.aba_montada(self.tab_alunos):
+            self.combo_turma_mat['values'] = turma_list
         
         # Aba Notas (Filtrar)
-        self.combo_turma_notas['values'] = turma_list
-        self.combo_materia_notas['values'] = [] # Sempre limpo, depende da turma
+        if self.aba_montada(self.tab_notas):
+            self.combo_turma_notas['values'] = turma_list
+            self.combo_materia_notas['values'] = [] # Sempre limpo, depende da turma
+
+        # Aba Exames (Filtrar)
+        if self.aba_montada(self.tab_exames):
+            self.combo_exame_turma['values'] = turma_list
 
-    def atualizar_tree_gestao(self, tree, cache_dados):
-        for row in tree.get_children(): tree.delete(row)
-        for id, nome in cache_dados.items():
-            tree.insert("", "end", values=(id, nome))
+        # Aba Estatísticas (Filtrar)
+        if self.aba_montada(self.tab_estatisticas):
+            self.combo_estatisticas_turma['values'] = turma_list
 
     def _get_id_from_combo(self, combo_value):
         try:
@@ -231,6 +442,8 @@ class App(tk.Tk):
         self.tree_turmas.heading('id', text='ID')
         self.tree_turmas.heading('nome', text='Nome')
         self.tree_turmas.pack(fill="both", expand=True)
+        self.tabela_turmas = TabelaEmBlocos(self.tree_turmas)
+        ttk.Button(frame_lista_turmas, text="Excluir Turma Selecionada", command=self.excluir_turma).pack(side="bottom", pady=(5, 0), before=self.tree_turmas)
 
         # --- Painel de Matérias ---
         frame_nova_materia = ttk.LabelFrame(tab_materias, text="Nova Matéria", padding=10)
@@ -245,6 +458,8 @@ class App(tk.Tk):
         self.tree_materias.heading('id', text='ID')
         self.tree_materias.heading('nome', text='Nome')
         self.tree_materias.pack(fill="both", expand=True)
+        self.tabela_materias = TabelaEmBlocos(self.tree_materias)
+        ttk.Button(frame_lista_materias, text="Excluir Matéria Selecionada", command=self.excluir_materia).pack(side="bottom", pady=(5, 0), before=self.tree_materias)
 
         # --- Painel da Grade Curricular ---
         frame_ligar_grade = ttk.LabelFrame(tab_grade, text="Ligar Matéria à Turma", padding=10)
@@ -252,9 +467,11 @@ class App(tk.Tk):
         ttk.Label(frame_ligar_grade, text="Turma:").grid(row=0, column=0, padx=5, sticky="w")
         self.combo_grade_turma = ttk.Combobox(frame_ligar_grade, width=35, state="readonly")
         self.combo_grade_turma.grid(row=0, column=1, padx=5, sticky="ew")
+        self.combo_grade_turma['values'] = self.lista_turmas()
         ttk.Label(frame_ligar_grade, text="Matéria:").grid(row=1, column=0, padx=5, sticky="w")
         self.combo_grade_materia = ttk.Combobox(frame_ligar_grade, width=35, state="readonly")
         self.combo_grade_materia.grid(row=1, column=1, padx=5, sticky="ew")
+        self.combo_grade_materia['values'] = self.lista_materias()
         ttk.Button(frame_ligar_grade, text="Ligar Matéria à Turma", command=self.salvar_ligacao_grade).grid(row=2, column=0, columnspan=2, pady=10)
         frame_lista_grade = ttk.LabelFrame(tab_grade, text="Grade Atual", padding=10)
         frame_lista_grade.pack(fill="both", expand=True, pady=10)
@@ -262,27 +479,25 @@ class App(tk.Tk):
         self.tree_grade.heading('turma', text='Turma')
         self.tree_grade.heading('materia', text='Matéria')
         self.tree_grade.pack(fill="both", expand=True)
-
-    def gerar_id_unico(self): return int(time.time() * 1000) % 1000000
+        self.tabela_grade = TabelaEmBlocos(self.tree_grade)
+        ttk.Button(frame_lista_grade, text="Desligar Matéria Selecionada", command=self.excluir_ligacao_grade).pack(side="bottom", pady=(5, 0), before=self.tree_grade)
 
     def salvar_turma(self):
         nome = self.entry_turma_nome.get()
-        if not nome: return messagebox.showwarning("Erro", "O nome da turma não pode estar vazio.")
-        turma_c = Turma(id=self.gerar_id_unico(), nome=nome.encode('utf-8'))
-        lib_c.salvarTurma(turma_c)
+        try: turma_c = servico.cadastrar_turma(nome)
+        except ValueError as e: return messagebox.showwarning("Erro", str(e))
         messagebox.showinfo("Sucesso", f"Turma '{nome}' salva com ID: {turma_c.id}")
         self.entry_turma_nome.delete(0, 'end')
-        self.carregar_dados_para_cache()
+        self.aplicar_registro_cache(TABELA_TURMAS, turma_c)
         self.atualizar_comboboxes_globais()
 
     def salvar_materia(self):
         nome = self.entry_materia_nome.get()
-        if not nome: return messagebox.showwarning("Erro", "O nome da matéria não pode estar vazio.")
-        materia_c = Materia(id=self.gerar_id_unico(), nome=nome.encode('utf-8'))
-        lib_c.salvarMateria(materia_c)
+        try: materia_c = servico.cadastrar_materia(nome)
+        except ValueError as e: return messagebox.showwarning("Erro", str(e))
         messagebox.showinfo("Sucesso", f"Matéria '{nome}' salva com ID: {materia_c.id}")
         self.entry_materia_nome.delete(0, 'end')
-        self.carregar_dados_para_cache()
+        self.aplicar_registro_cache(TABELA_MATERIAS, materia_c)
         self.atualizar_comboboxes_globais()
 
     def salvar_ligacao_grade(self):
@@ -290,23 +505,47 @@ class App(tk.Tk):
         id_materia = self._get_id_from_combo(self.combo_grade_materia.get())
         if not id_turma or not id_materia:
             return messagebox.showerror("Erro", "Selecione uma Turma e uma Matéria válidas.")
-        if id_materia in self.cache_grade.get(id_turma, []):
+        if id_materia in self.cache_grade.get(id_turma, {}):
             return messagebox.showwarning("Aviso", "Essa matéria já está ligada a essa turma.")
-        tm_c = TurmaMateria(id_turma=id_turma, id_materia=id_materia)
-        lib_c.salvarTurmaMateria(tm_c)
+        tm_c = servico.ligar_materia_turma(id_turma, id_materia)
         nome_turma = self.cache_turmas.get(id_turma, "Turma")
         nome_materia = self.cache_materias.get(id_materia, "Matéria")
         messagebox.showinfo("Sucesso", f"Matéria '{nome_materia}' ligada à Turma '{nome_turma}'!")
+        self.aplicar_registro_cache(TABELA_GRADE, tm_c)
+
+    # --- Exclusões (com as dependências: grade e matrículas) ---
+    def excluir(self, pergunta, apagar, *args):
+        if not messagebox.askyesno("Excluir", pergunta): return False
+        try: apagar(*args)
+        except IOError as e:
+            messagebox.showerror("Erro", str(e))
+            return False
         self.carregar_dados_para_cache()
+        self.atualizar_comboboxes_globais()
+        return True
+
+    def excluir_turma(self):
+        selecao = self.tree_turmas.selection()
+        if not selecao: return messagebox.showwarning("Aviso", "Selecione uma turma na lista.")
+        id_turma = int(selecao[0])
+        self.excluir(f"Excluir a turma '{self.cache_turmas.get(id_turma, id_turma)}'?\n"
+                     "A grade e as matrículas dela também serão apagadas.", servico.apagar_turma, id_turma)
+
+    def excluir_materia(self):
+        selecao = self.tree_materias.selection()
+        if not selecao: return messagebox.showwarning("Aviso", "Selecione uma matéria na lista.")
+        id_materia = int(selecao[0])
+        self.excluir(f"Excluir a matéria '{self.cache_materias.get(id_materia, id_materia)}'?\n"
+                     "As ligações na grade e as matrículas dela também serão apagadas.", servico.apagar_materia, id_materia)
+
+    def excluir_ligacao_grade(self):
+        selecao = self.tree_grade.selection()
+        if not selecao: return messagebox.showwarning("Aviso", "Selecione uma ligação na grade.")
+        id_turma, id_materia = (int(x) for x in selecao[0].split(":"))
+        nome_turma, nome_materia = self.tree_grade.item(selecao[0])['values']
+        self.excluir(f"Tirar '{nome_materia}' da grade da turma '{nome_turma}'?\n"
+                     "As matrículas nessa matéria também serão apagadas.", servico.desligar_materia_turma, id_turma, id_materia)
         
-    def atualizar_tree_grade(self):
-        for row in self.tree_grade.get_children(): self.tree_grade.delete(row)
-        for id_turma, lista_id_materias in self.cache_grade.items():
-            nome_turma = self.cache_turmas.get(id_turma, f"ID {id_turma}")
-            for id_materia in lista_id_materias:
-                nome_materia = self.cache_materias.get(id_materia, f"ID {id_materia}")
-                self.tree_grade.insert("", "end", values=(nome_turma, nome_materia))
-
     # --- ABA 2: ALUNOS (Cadastro e Matrícula na Turma) ---
     def criar_aba_alunos(self):
         nb_alunos = ttk.Notebook(self.tab_alunos)
@@ -333,14 +572,25 @@ class App(tk.Tk):
         ttk.Button(frame_cadastro, text="Cadastrar Aluno", command=self.salvar_aluno).grid(row=2, column=0, columnspan=4, pady=10)
         
         # --- Painel Buscar / Matricular ---
-        frame_busca = ttk.LabelFrame(tab_buscar_matricular, text="Buscar Aluno por RA", padding=10)
+        frame_busca = ttk.LabelFrame(tab_buscar_matricular, text="Buscar Aluno por RA ou Nome", padding=10)
         frame_busca.pack(fill="x", side="top", pady=5)
         ttk.Label(frame_busca, text="RA:").grid(row=0, column=0, padx=5, sticky="w")
         self.entry_busca_ra = ttk.Entry(frame_busca, width=20)
         self.entry_busca_ra.grid(row=0, column=1, padx=5, sticky="w")
         ttk.Button(frame_busca, text="Buscar", command=self.buscar_aluno_ra).grid(row=0, column=2, padx=10)
+        self.btn_excluir_aluno = ttk.Button(frame_busca, text="Excluir Aluno", command=self.excluir_aluno, state="disabled")
+        self.btn_excluir_aluno.grid(row=0, column=3, padx=10)
         self.label_busca_resultado = ttk.Label(frame_busca, text="Nenhum aluno buscado.", foreground="blue")
         self.label_busca_resultado.grid(row=1, column=0, columnspan=3, pady=5)
+        # Busca por parte do nome: as sugestões mudam a cada tecla; escolher uma busca pelo RA
+        ttk.Label(frame_busca, text="Nome:").grid(row=2, column=0, padx=5, sticky="w")
+        self.entry_busca_nome = ttk.Entry(frame_busca, width=40)
+        self.entry_busca_nome.grid(row=2, column=1, columnspan=3, padx=5, sticky="ew")
+        self.entry_busca_nome.bind('<KeyRelease>', self.atualizar_sugestoes_nome)
+        self.lista_sugestoes_nome = tk.Listbox(frame_busca, height=6)
+        self.lista_sugestoes_nome.grid(row=3, column=1, columnspan=3, padx=5, pady=2, sticky="ew")
+        self.lista_sugestoes_nome.bind('<<ListboxSelect>>', self.escolher_sugestao_nome)
+        self.sugestoes_nome = []  # (ra, nome) na ordem da lista
         
         # --- MUDANÇA (Request 1): Painel de Matrícula simplificado ---
         self.frame_matricular = ttk.LabelFrame(tab_buscar_matricular, text="Matricular Aluno na Turma", padding=10)
@@ -349,6 +599,7 @@ class App(tk.Tk):
         ttk.Label(self.frame_matricular, text="Turma:").grid(row=0, column=0, sticky="w", padx=5, pady=2)
         self.combo_turma_mat = ttk.Combobox(self.frame_matricular, width=40, state="readonly")
         self.combo_turma_mat.grid(row=0, column=1, sticky="ew", padx=5, pady=2)
+        self.combo_turma_mat['values'] = self.lista_turmas()
         
         # O Combobox de Matéria foi REMOVIDO
         
@@ -356,9 +607,6 @@ class App(tk.Tk):
                                          command=self.matricular_aluno_na_turma, state="disabled") # Novo comando
         self.btn_matricular.grid(row=2, column=0, columnspan=2, pady=10)
 
-    def gerar_ra(self):
-        return int(time.time() * 10 + random.randint(100, 999))
-
     def salvar_aluno(self):
         try:
             nome = self.entry_aluno_nome.get()
@@ -367,33 +615,59 @@ class App(tk.Tk):
             if not nome or not cpf:
                 return messagebox.showwarning("Erro", "Nome e CPF são obrigatórios.")
             
-            aluno_c = Aluno(ra=self.gerar_ra(), nome=nome.encode('utf-8'), 
-                            cpf=cpf.encode('utf-8'), telefone=tel.encode('utf-8'))
-            lib_c.salvarAluno(aluno_c)
+            aluno_c = servico.cadastrar_aluno(nome, cpf, tel)
             messagebox.showinfo("Sucesso", f"Aluno {nome} salvo com o RA: {aluno_c.ra}")
             self.entry_aluno_nome.delete(0, 'end')
             self.entry_aluno_cpf.delete(0, 'end')
             self.entry_aluno_tel.delete(0, 'end')
-            self.carregar_dados_para_cache()
+            self.aplicar_registro_cache(TABELA_ALUNOS, aluno_c)
         except Exception as e:
             messagebox.showerror("Erro", f"Ocorreu um erro: {e}")
 
+    SUGESTOES_NOME = 20
+
+    def atualizar_sugestoes_nome(self, event=None):
+        with instrumentacao.medir("tela: sugestões de nome"):
+            self.sugestoes_nome = self.cache.indice_nomes.buscar(self.entry_busca_nome.get(), self.SUGESTOES_NOME)
+        self.lista_sugestoes_nome.delete(0, 'end')
+        for ra, nome in self.sugestoes_nome:
+            self.lista_sugestoes_nome.insert('end', f"{nome} (RA: {ra})")
+
+    def escolher_sugestao_nome(self, event=None):
+        selecao = self.lista_sugestoes_nome.curselection()
+        if not selecao: return
+        ra, _ = self.sugestoes_nome[selecao[0]]
+        self.entry_busca_ra.delete(0, 'end')
+        self.entry_busca_ra.insert(0, str(ra))
+        self.buscar_aluno_ra()
+
     def buscar_aluno_ra(self):
         try: ra = int(self.entry_busca_ra.get())
         except ValueError: return messagebox.showerror("Erro", "RA inválido. Digite apenas números.")
             
-        aluno_encontrado = Aluno()
-        resultado = lib_c.buscarAlunoPorRA(ra, ctypes.byref(aluno_encontrado))
+        aluno_encontrado = servico.buscar_aluno_por_ra(ra)
         
-        if resultado == 1:
+        if aluno_encontrado:
             nome = aluno_encontrado.nome.decode('utf-8')
             self.label_busca_resultado.config(text=f"Aluno Encontrado: {nome} (RA: {ra})", foreground="green")
             self.ra_aluno_encontrado = ra
             self.btn_matricular.config(state="normal") 
+            self.btn_excluir_aluno.config(state="normal")
         else:
             self.label_busca_resultado.config(text=f"Aluno com RA {ra} não encontrado.", foreground="red")
             self.ra_aluno_encontrado = None
             self.btn_matricular.config(state="disabled") 
+            self.btn_excluir_aluno.config(state="disabled")
+
+    def excluir_aluno(self):
+        ra = self.ra_aluno_encontrado
+        if ra is None: return
+        if self.excluir(f"Excluir o aluno {self.cache_alunos.get(ra, '')} (RA {ra}) e todas as matrículas dele?",
+                        servico.apagar_aluno, ra):
+            self.label_busca_resultado.config(text=f"Aluno com RA {ra} excluído.", foreground="blue")
+            self.ra_aluno_encontrado = None
+            self.btn_matricular.config(state="disabled")
+            self.btn_excluir_aluno.config(state="disabled")
 
     # --- NOVO (Request 1): Lógica de Matrícula na Turma Inteira ---
     def matricular_aluno_na_turma(self):
@@ -405,28 +679,19 @@ class App(tk.Tk):
             return messagebox.showerror("Erro", "Selecione uma Turma válida.")
             
         # Pega a lista de matérias da grade
-        lista_id_materias = self.cache_grade.get(id_turma, [])
+        lista_id_materias = self.cache_grade.get(id_turma, {})
         
         if not lista_id_materias:
             return messagebox.showwarning("Aviso", "Esta turma não possui matérias na Grade Curricular. "
                                           "Vá em Gestão -> Grade Curricular para adicioná-las.")
         
-        # Loop para criar uma matrícula para CADA matéria da grade
-        count = 0
-        for id_materia in lista_id_materias:
-            matricula_c = Matricula(
-                ra_aluno=self.ra_aluno_encontrado,
-                id_turma=id_turma,
-                id_materia=id_materia,
-                np1=0.0, np2=0.0, pim=0.0,
-                faltas=0, media_final=0.0,
-                status=b"Pendente"
-            )
-            lib_c.salvarMatricula(matricula_c)
-            count += 1
+        # Cria uma matrícula para CADA matéria da grade
+        count = servico.matricular_aluno(self.ra_aluno_encontrado, id_turma, lista_id_materias)
         
         nome_aluno = self.cache_alunos.get(self.ra_aluno_encontrado, "Aluno")
         nome_turma = self.cache_turmas.get(id_turma, "Turma")
+        if count == 0:
+            return messagebox.showinfo("Aviso", f"{nome_aluno} já está matriculado em todas as matérias da turma {nome_turma}.")
         messagebox.showinfo("Sucesso", f"{nome_aluno} matriculado em {count} matérias da turma {nome_turma}!")
 
     # --- ABA 3: NOTAS E FALTAS (Lógica de filtro atualizada) ---
@@ -437,13 +702,18 @@ class App(tk.Tk):
         ttk.Label(frame_filtros, text="Turma:").grid(row=0, column=0, sticky="w", padx=5, pady=2)
         self.combo_turma_notas = ttk.Combobox(frame_filtros, width=35, state="readonly")
         self.combo_turma_notas.grid(row=0, column=1, sticky="ew", padx=5, pady=2)
+        self.combo_turma_notas['values'] = self.lista_turmas()
         self.combo_turma_notas.bind("<<ComboboxSelected>>", self.on_turma_select_notas)
         
         ttk.Label(frame_filtros, text="Matéria:").grid(row=0, column=2, sticky="w", padx=5, pady=2)
         self.combo_materia_notas = ttk.Combobox(frame_filtros, width=35, state="readonly")
         self.combo_materia_notas.grid(row=0, column=3, sticky="ew", padx=5, pady=2)
         
-        ttk.Button(frame_filtros, text="Carregar Alunos Matriculados", command=self.carregar_matriculas_para_tree).grid(row=1, column=0, columnspan=4, pady=10)
+        ttk.Button(frame_filtros, text="Carregar Alunos Matriculados", command=self.carregar_matriculas_para_tree).grid(row=1, column=0, columnspan=2, pady=10)
+        # Modo "salvar todas": edita as células da tabela (duplo clique) e grava tudo de uma vez
+        self.btn_salvar_todas = ttk.Button(frame_filtros, text="Salvar Todas as Alterações", command=self.salvar_todas_notas, state="disabled")
+        self.btn_salvar_todas.grid(row=1, column=2, columnspan=2, pady=10)
+        ttk.Button(frame_filtros, text="Recalcular Médias e Status", command=self.recalcular_status_turma).grid(row=2, column=0, columnspan=4)
 
         main_frame_notas = ttk.Frame(self.tab_notas, padding=10)
         main_frame_notas.pack(fill="both", expand=True)
@@ -458,7 +728,11 @@ class App(tk.Tk):
             self.tree_notas.column(col, width=80)
         self.tree_notas.column('nome', width=150)
         self.tree_notas.pack(fill="both", expand=True)
+        self.tabela_notas = TabelaEmBlocos(self.tree_notas)
         self.tree_notas.bind('<<TreeviewSelect>>', self.on_tree_notas_select)
+        self.tree_notas.bind('<Double-1>', self.editar_celula_notas)
+        self.tree_notas.tag_configure('alterado', background="#fff3c4")
+        self.entry_celula_notas = None
 
         self.frame_edicao_notas = ttk.LabelFrame(main_frame_notas, text="Editar Notas/Faltas", padding=10)
         self.frame_edicao_notas.pack(fill="y", side="right", padx=5)
@@ -480,6 +754,8 @@ class App(tk.Tk):
         self.entry_edit_faltas.grid(row=4, column=1, sticky="w", padx=5, pady=3)
         self.btn_salvar_notas = ttk.Button(self.frame_edicao_notas, text="Salvar Notas", command=self.salvar_notas_aluno, state="disabled")
         self.btn_salvar_notas.grid(row=5, column=0, columnspan=2, pady=10)
+        self.btn_cancelar_matricula = ttk.Button(self.frame_edicao_notas, text="Cancelar Matrícula", command=self.cancelar_matricula_selecionada, state="disabled")
+        self.btn_cancelar_matricula.grid(row=6, column=0, columnspan=2)
 
     # Evento de filtro para Notas (Atualiza matérias baseado na turma)
     def on_turma_select_notas(self, event=None):
@@ -487,7 +763,7 @@ class App(tk.Tk):
         id_turma = self._get_id_from_combo(self.combo_turma_notas.get())
         if not id_turma: return self.combo_materia_notas.config(values=[])
             
-        id_materias_filtradas = self.cache_grade.get(id_turma, [])
+        id_materias_filtradas = self.cache_grade.get(id_turma, {})
         lista_nomes_materias = []
         for id_mat in id_materias_filtradas:
             nome = self.cache_materias.get(id_mat, f"ID {id_mat}")
@@ -497,24 +773,30 @@ class App(tk.Tk):
         if lista_nomes_materias: self.combo_materia_notas.current(0)
         
     def carregar_matriculas_para_tree(self):
-        for row in self.tree_notas.get_children(): self.tree_notas.delete(row)
+        if self.alteracoes_notas and not messagebox.askyesno(
+                "Alterações pendentes", "Há notas editadas que não foram salvas. Descartar e recarregar?"):
+            return
+        self.alteracoes_notas.clear()
+        self.btn_salvar_todas.config(state="disabled", text="Salvar Todas as Alterações")
+        self.tabela_notas.limpar()
+        self.filtro_notas = None
         id_turma_filtro = self._get_id_from_combo(self.combo_turma_notas.get())
         id_materia_filtro = self._get_id_from_combo(self.combo_materia_notas.get())
         
         if not id_turma_filtro or not id_materia_filtro:
             return messagebox.showwarning("Filtro Incompleto", "Selecione uma Turma E uma Matéria.")
+        self.filtro_notas = (id_turma_filtro, id_materia_filtro)
 
-        MatriculaArray = Matricula * self.MAX_REGISTROS
-        buffer_matriculas = MatriculaArray()
-        num_matriculas = lib_c.carregarMatriculas(buffer_matriculas, self.MAX_REGISTROS)
-        
-        for i in range(num_matriculas):
-            matricula = buffer_matriculas[i]
-            if (matricula.id_turma == id_turma_filtro and matricula.id_materia == id_materia_filtro):
-                ra, nome = matricula.ra_aluno, self.cache_alunos.get(matricula.ra_aluno, "...")
-                self.tree_notas.insert("", "end", iid=ra, values=( 
-                    ra, nome, f"{matricula.np1:.1f}", f"{matricula.np2:.1f}", f"{matricula.pim:.1f}",
-                    matricula.faltas, f"{matricula.media_final:.2f}", matricula.status.decode('utf-8') ))
+        # Roda na thread de consultas: não pode mexer nos widgets, só monta as linhas
+        def consulta(tarefa):
+            # Só as matrículas da turma+matéria, direto do índice (sem varrer o arquivo)
+            matriculas = consultar_matriculas(lib_c.matriculasPorTurmaMateria, id_turma_filtro, id_materia_filtro)
+            return linhas_notas(self.cache, tarefa.acompanhar(matriculas))
+
+        def ao_terminar(linhas):
+            self.tabela_notas.preencher(linhas, iid=lambda valores: valores[0])  # iid = RA
+
+        self.executar_em_segundo_plano("notas", "Carregando matrículas...", consulta, ao_terminar)
     
     def on_tree_notas_select(self, event):
         selected_items = self.tree_notas.selection()
@@ -530,6 +812,7 @@ class App(tk.Tk):
             entry.delete(0, 'end')
             entry.insert(0, value)
         self.btn_salvar_notas.config(state="normal")
+        self.btn_cancelar_matricula.config(state="normal")
 
     def salvar_notas_aluno(self):
         if not self.matricula_selecionada: return messagebox.showerror("Erro", "Nenhum aluno selecionado.")
@@ -537,29 +820,119 @@ class App(tk.Tk):
             ra, np1, np2, pim, faltas = (
                 self.matricula_selecionada['ra'], float(self.entry_edit_np1.get()), float(self.entry_edit_np2.get()),
                 float(self.entry_edit_pim.get()), int(self.entry_edit_faltas.get()) )
-            id_turma = self._get_id_from_combo(self.combo_turma_notas.get())
-            id_materia = self._get_id_from_combo(self.combo_materia_notas.get())
-            if not id_turma or not id_materia:
+            if self.filtro_notas is None:
                 return messagebox.showerror("Erro", "Filtros de turma/matéria perdidos.")
+            id_turma, id_materia = self.filtro_notas
 
-            media, status = calcular_status(np1, np2, pim, faltas)
-            matricula_c = Matricula(
-                ra_aluno=ra, id_turma=id_turma, id_materia=id_materia,
-                np1=np1, np2=np2, pim=pim, faltas=faltas,
-                media_final=media, status=status.encode('utf-8') )
-            
-            lib_c.atualizarMatricula(matricula_c)
+            try: servico.lancar_notas(ra, id_turma, id_materia, np1, np2, pim, faltas)
+            except IOError as e: return messagebox.showerror("Erro", str(e))
             messagebox.showinfo("Sucesso", f"Notas de {self.matricula_selecionada['nome']} salvas!")
             
-            self.matricula_selecionada = None
-            for entry in [self.entry_edit_np1, self.entry_edit_np2, self.entry_edit_pim, self.entry_edit_faltas]:
-                entry.delete(0, 'end'); entry.config(state="disabled")
-            self.label_aluno_selecionado.config(text="Selecione um aluno na tabela")
-            self.btn_salvar_notas.config(state="disabled")
+            self.limpar_edicao_notas()
             self.carregar_matriculas_para_tree() # Recarrega a tabela
         except ValueError: messagebox.showerror("Erro de Entrada", "Notas e faltas devem ser números válidos.")
         except Exception as e: messagebox.showerror("Erro", f"Ocorreu um erro: {e}")
 
+    def limpar_edicao_notas(self):
+        self.matricula_selecionada = None
+        for entry in [self.entry_edit_np1, self.entry_edit_np2, self.entry_edit_pim, self.entry_edit_faltas]:
+            entry.delete(0, 'end'); entry.config(state="disabled")
+        self.label_aluno_selecionado.config(text="Selecione um aluno na tabela")
+        self.btn_salvar_notas.config(state="disabled")
+        self.btn_cancelar_matricula.config(state="disabled")
+
+    def cancelar_matricula_selecionada(self):
+        if not self.matricula_selecionada: return messagebox.showerror("Erro", "Nenhum aluno selecionado.")
+        if self.filtro_notas is None:
+            return messagebox.showerror("Erro", "Filtros de turma/matéria perdidos.")
+        id_turma, id_materia = self.filtro_notas
+        nome = self.matricula_selecionada['nome']
+        if not messagebox.askyesno("Cancelar Matrícula", f"Cancelar a matrícula de {nome} nesta matéria? As notas serão apagadas."):
+            return
+        try: servico.cancelar_matricula(int(self.matricula_selecionada['ra']), id_turma, id_materia)
+        except IOError as e: return messagebox.showerror("Erro", str(e))
+        self.limpar_edicao_notas()
+        self.carregar_matriculas_para_tree()
+
+    # --- Edição direto na tabela + "Salvar Todas" ---
+    COLUNAS_EDITAVEIS_NOTAS = ('np1', 'np2', 'pim', 'faltas')
+
+    def editar_celula_notas(self, event):
+        if self.tree_notas.identify_region(event.x, event.y) != "cell": return
+        ra = self.tree_notas.identify_row(event.y)
+        coluna_id = self.tree_notas.identify_column(event.x)  # "#1", "#2", ...
+        coluna = self.tree_notas['columns'][int(coluna_id[1:]) - 1]
+        if not ra or coluna not in self.COLUNAS_EDITAVEIS_NOTAS: return
+
+        x, y, largura, altura = self.tree_notas.bbox(ra, coluna_id)
+        valor_atual = self.tree_notas.set(ra, coluna)
+        self.cancelar_edicao_celula()
+        self.entry_celula_notas = ttk.Entry(self.tree_notas)
+        self.entry_celula_notas.place(x=x, y=y, width=largura, height=altura)
+        self.entry_celula_notas.insert(0, valor_atual)
+        self.entry_celula_notas.select_range(0, 'end')
+        self.entry_celula_notas.focus_set()
+        confirmar = lambda e: self.confirmar_edicao_celula(ra, coluna)
+        self.entry_celula_notas.bind('<Return>', confirmar)
+        self.entry_celula_notas.bind('<FocusOut>', confirmar)
+        self.entry_celula_notas.bind('<Escape>', lambda e: self.cancelar_edicao_celula())
+
+    def cancelar_edicao_celula(self):
+        if self.entry_celula_notas is not None:
+            self.entry_celula_notas.destroy()
+            self.entry_celula_notas = None
+
+    def confirmar_edicao_celula(self, ra, coluna):
+        if self.entry_celula_notas is None: return
+        texto = self.entry_celula_notas.get()
+        self.cancelar_edicao_celula()
+        try:
+            valor = int(texto) if coluna == 'faltas' else float(texto)
+        except ValueError:
+            return messagebox.showerror("Erro de Entrada", "Notas e faltas devem ser números válidos.")
+
+        self.tree_notas.set(ra, coluna, valor if coluna == 'faltas' else f"{valor:.1f}")
+        np1, np2, pim = (float(self.tree_notas.set(ra, c)) for c in ('np1', 'np2', 'pim'))
+        faltas = int(self.tree_notas.set(ra, 'faltas'))
+        media, status = calcular_status(np1, np2, pim, faltas)
+        self.tree_notas.set(ra, 'media', f"{media:.2f}")
+        self.tree_notas.set(ra, 'status', status)
+        self.tree_notas.item(ra, tags=('alterado',))
+
+        self.alteracoes_notas[int(ra)] = (np1, np2, pim, faltas)
+        self.btn_salvar_todas.config(state="normal", text=f"Salvar Todas as Alterações ({len(self.alteracoes_notas)})")
+
+    def salvar_todas_notas(self):
+        if not self.alteracoes_notas: return messagebox.showinfo("Aviso", "Nenhuma alteração pendente.")
+        if self.filtro_notas is None:
+            return messagebox.showerror("Erro", "Filtros de turma/matéria perdidos.")
+        id_turma, id_materia = self.filtro_notas  # a turma/matéria da grade, não a dos combos agora
+
+        lote = []
+        for ra, (np1, np2, pim, faltas) in self.alteracoes_notas.items():
+            lote.append(montar_matricula(ra, id_turma, id_materia, np1, np2, pim, faltas))
+
+        if not atualizar_matriculas_lote(lote):
+            return messagebox.showerror("Erro", "Não foi possível gravar as notas. Nenhuma alteração foi salva.")
+        messagebox.showinfo("Sucesso", f"Notas de {len(lote)} alunos salvas!")
+        self.alteracoes_notas.clear()  # já gravadas: recarregar não pergunta nem grava de novo
+        self.btn_salvar_todas.config(state="disabled", text="Salvar Todas as Alterações")
+        self.carregar_matriculas_para_tree()
+
+    # Fechamento do semestre: recalcula média/status da turma (e matéria) escolhida,
+    # ou de todas as matrículas se nenhuma turma estiver selecionada
+    def recalcular_status_turma(self):
+        id_turma = self._get_id_from_combo(self.combo_turma_notas.get())
+        id_materia = self._get_id_from_combo(self.combo_materia_notas.get()) if id_turma else None
+        if not id_turma and not messagebox.askyesno("Recalcular", "Nenhuma turma selecionada. Recalcular TODAS as matrículas?"):
+            return
+        try:
+            alteradas = recalcular_matriculas(self.visao_matriculas.atualizar(), id_turma, id_materia)
+        except IOError as e:
+            return messagebox.showerror("Erro", str(e))
+        messagebox.showinfo("Recalcular", f"{alteradas} matrículas tiveram média/status atualizados.")
+        if id_turma and id_materia: self.carregar_matriculas_para_tree()
+
 
     # --- NOVO (Request 2 e 3): ABA BOLETIM ALUNO ---
     def criar_aba_boletim(self):
@@ -599,32 +972,39 @@ class App(tk.Tk):
         self.tree_boletim.column('turma', width=120)
         self.tree_boletim.column('materia', width=120)
         self.tree_boletim.pack(fill="both", expand=True)
+        self.tabela_boletim = TabelaEmBlocos(self.tree_boletim)
 
     def buscar_boletim_ra(self):
         try: ra = int(self.entry_boletim_busca.get())
         except ValueError: return messagebox.showerror("Erro", "RA inválido. Digite apenas números.")
         
-        aluno_encontrado = Aluno()
-        resultado = lib_c.buscarAlunoPorRA(ra, ctypes.byref(aluno_encontrado))
-        self.processar_busca_boletim(resultado, aluno_encontrado)
+        self.buscar_boletim(servico.buscar_aluno_por_ra, ra)
 
     def buscar_boletim_cpf(self):
         cpf = self.entry_boletim_busca.get()
         if not cpf: return messagebox.showerror("Erro", "Digite um CPF.")
             
-        aluno_encontrado = Aluno()
-        resultado = lib_c.buscarAlunoPorCPF(cpf.encode('utf-8'), ctypes.byref(aluno_encontrado))
-        self.processar_busca_boletim(resultado, aluno_encontrado)
-
-    def processar_busca_boletim(self, resultado, aluno_c):
+        self.buscar_boletim(servico.buscar_aluno_por_cpf, cpf)
+
+    def buscar_boletim(self, buscar_aluno, chave):
+        def consulta(tarefa):
+            with servico.sessao():  # busca do aluno + matrículas com os mesmos arquivos abertos
+                aluno_c = buscar_aluno(chave)
+                if aluno_c is None or tarefa.cancelada: return aluno_c, []
+                # Só as matrículas deste aluno, direto do índice por RA
+                return aluno_c, servico.boletim(aluno_c.ra)
+        self.executar_em_segundo_plano("boletim", "Buscando boletim...", consulta,
+                                       lambda resultado: self.processar_busca_boletim(*resultado))
+
+    def processar_busca_boletim(self, aluno_c, matriculas):
         # Limpa os campos e a tabela
         self.lbl_boletim_nome.config(text="Nome: N/A")
         self.lbl_boletim_ra.config(text="RA: N/A")
         self.lbl_boletim_cpf.config(text="CPF: N/A")
         self.lbl_boletim_tel.config(text="Telefone: N/A")
-        for row in self.tree_boletim.get_children(): self.tree_boletim.delete(row)
+        self.tabela_boletim.limpar()
 
-        if resultado == 0:
+        if aluno_c is None:
             messagebox.showinfo("Busca", "Aluno não encontrado.")
             return
 
@@ -634,35 +1014,11 @@ class App(tk.Tk):
         self.lbl_boletim_cpf.config(text=f"CPF: {aluno_c.cpf.decode('utf-8')}")
         self.lbl_boletim_tel.config(text=f"Telefone: {aluno_c.telefone.decode('utf-8')}")
 
-        # 2. Busca e preenche a situação acadêmica
-        MatriculaArray = Matricula * self.MAX_REGISTROS
-        buffer_matriculas = MatriculaArray()
-        num_matriculas = lib_c.carregarMatriculas(buffer_matriculas, self.MAX_REGISTROS)
-        
-        encontrou_matricula = False
-        for i in range(num_matriculas):
-            matricula = buffer_matriculas[i]
-            
-            # Filtra apenas as matrículas deste aluno
-            if matricula.ra_aluno == aluno_c.ra:
-                encontrou_matricula = True
-                # Busca os nomes nos caches
-                nome_turma = self.cache_turmas.get(matricula.id_turma, f"ID {matricula.id_turma}")
-                nome_materia = self.cache_materias.get(matricula.id_materia, f"ID {matricula.id_materia}")
-                
-                self.tree_boletim.insert("", "end", values=(
-                    nome_turma,
-                    nome_materia,
-                    f"{matricula.np1:.1f}",
-                    f"{matricula.np2:.1f}",
-                    f"{matricula.pim:.1f}",
-                    matricula.faltas,
-                    f"{matricula.media_final:.2f}",
-                    matricula.status.decode('utf-8')
-                ))
-        
-        if not encontrou_matricula:
-            self.tree_boletim.insert("", "end", values=("Aluno ainda não matriculado em turmas.", "", "", "", "", "", "", ""))
+        # 2. Situação acadêmica, com os nomes de turma e matéria do cache
+        linhas = linhas_boletim(self.cache, matriculas)
+        if not linhas:
+            linhas.append(("Aluno ainda não matriculado em turmas.", "", "", "", "", "", "", ""))
+        self.tabela_boletim.preencher(linhas)
 
         # --- NOVO: ABA ALUNOS EM EXAME ---
     def criar_aba_exames(self):
@@ -672,7 +1028,7 @@ class App(tk.Tk):
         ttk.Label(frame_top, text="Turma:").grid(row=0, column=0, padx=5, sticky="w")
         self.combo_exame_turma = ttk.Combobox(frame_top, width=40, state="readonly")
         self.combo_exame_turma.grid(row=0, column=1, padx=5)
-        self.combo_exame_turma['values'] = [f"{nome} (ID: {id})" for id, nome in self.cache_turmas.items()]
+        self.combo_exame_turma['values'] = self.lista_turmas()
 
         ttk.Button(frame_top, text="Carregar Alunos em Exame", command=self.carregar_exames).grid(row=0, column=2, padx=10)
 
@@ -688,34 +1044,204 @@ class App(tk.Tk):
         self.tree_exames.column('turma', width=130)
         self.tree_exames.column('materia', width=130)
         self.tree_exames.pack(fill="both", expand=True)
+        self.tabela_exames = TabelaEmBlocos(self.tree_exames)
 
     def carregar_exames(self):
-        for row in self.tree_exames.get_children():
-            self.tree_exames.delete(row)
+        self.tabela_exames.limpar()
 
         id_turma_filtro = self._get_id_from_combo(self.combo_exame_turma.get()) if self.combo_exame_turma.get() else None
 
-        MatriculaArray = Matricula * self.MAX_REGISTROS
-        buffer_matriculas = MatriculaArray()
-        num_matriculas = lib_c.carregarMatriculas(buffer_matriculas, self.MAX_REGISTROS)
+        def consulta(tarefa):
+            # Só as matrículas com status "Exame", direto do índice de status
+            return linhas_exames(self.cache, tarefa.acompanhar(consultar_matriculas(lib_c.matriculasEmExame)), id_turma_filtro)
 
-        count = 0
-        for i in range(num_matriculas):
-            m = buffer_matriculas[i]
-            status = m.status.decode('utf-8')
-            if status.lower() == "exame".lower() and (id_turma_filtro is None or m.id_turma == id_turma_filtro):
-                nome_aluno = self.cache_alunos.get(m.ra_aluno, "Desconhecido")
-                nome_turma = self.cache_turmas.get(m.id_turma, f"ID {m.id_turma}")
-                nome_materia = self.cache_materias.get(m.id_materia, f"ID {m.id_materia}")
-                self.tree_exames.insert("", "end", values=(
-                    m.ra_aluno, nome_aluno, nome_turma, nome_materia,
-                    f"{m.media_final:.2f}", m.faltas, status
-                ))
-                count += 1
+        def ao_terminar(linhas):
+            self.tabela_exames.preencher(linhas)
+            messagebox.showinfo("Resultado", f"Foram encontrados {len(linhas)} alunos em exame.")
 
-        messagebox.showinfo("Resultado", f"Foram encontrados {count} alunos em exame.")
+        self.executar_em_segundo_plano("exames", "Carregando alunos em exame...", consulta, ao_terminar)
+
+
+    # --- ABA ESTATÍSTICAS (painel por turma e matéria) ---
+    # Lê os totais que o motor mantém a cada gravação de matrícula: abrir a aba não percorre
+    # as matrículas (só a primeira vez depois de uma compactação, que refaz os totais)
+    def criar_aba_estatisticas(self):
+        frame_top = ttk.LabelFrame(self.tab_estatisticas, text="Filtrar por Turma (opcional)", padding=10)
+        frame_top.pack(fill="x", side="top", pady=5, padx=5)
+
+        ttk.Label(frame_top, text="Turma:").grid(row=0, column=0, padx=5, sticky="w")
+        self.combo_estatisticas_turma = ttk.Combobox(frame_top, width=40, state="readonly")
+        self.combo_estatisticas_turma.grid(row=0, column=1, padx=5)
+        self.combo_estatisticas_turma['values'] = self.lista_turmas()
+        self.combo_estatisticas_turma.bind("<<ComboboxSelected>>", lambda e: self.carregar_estatisticas())
+        ttk.Button(frame_top, text="Todas", command=self.limpar_filtro_estatisticas).grid(row=0, column=2, padx=5)
+        ttk.Button(frame_top, text="Atualizar", command=self.carregar_estatisticas).grid(row=0, column=3, padx=5)
+
+        frame_resumo = ttk.LabelFrame(self.tab_estatisticas, text="Todas as Matrículas por Situação", padding=10)
+        frame_resumo.pack(fill="x", pady=5, padx=5)
+        self.lbl_resumo_situacoes = {}
+        for i, situacao in enumerate(SITUACOES):
+            self.lbl_resumo_situacoes[situacao] = ttk.Label(frame_resumo, text=f"{situacao}: -")
+            self.lbl_resumo_situacoes[situacao].grid(row=0, column=i, padx=10, sticky="w")
+
+        frame_lista = ttk.LabelFrame(self.tab_estatisticas, text="Por Turma e Matéria", padding=10)
+        frame_lista.pack(fill="both", expand=True, pady=5, padx=5)
+        cols = ('turma', 'materia', 'matriculas', 'media', 'aprovados', 'exame', 'reprovados', 'np1', 'np2', 'pim', 'faltas')
+        titulos = ('Turma', 'Matéria', 'Matrículas', 'Média', 'Aprovados', 'Exame', 'Reprov. Faltas',
+                   'Média NP1', 'Média NP2', 'Média PIM', 'Média Faltas')
+        self.tree_estatisticas = ttk.Treeview(frame_lista, columns=cols, show='headings')
+        for col, titulo in zip(cols, titulos):
+            self.tree_estatisticas.heading(col, text=titulo)
+            self.tree_estatisticas.column(col, width=70)
+        self.tree_estatisticas.column('turma', width=130)
+        self.tree_estatisticas.column('materia', width=130)
+        self.tree_estatisticas.pack(fill="both", expand=True)
+        self.tabela_estatisticas = TabelaEmBlocos(self.tree_estatisticas)
+        self.tree_estatisticas.bind('<<TreeviewSelect>>', self.mostrar_faixas_estatistica)
+        self.estatisticas_listadas = []  # Estatistica de cada linha, na ordem da tabela
+
+        frame_faixas = ttk.LabelFrame(self.tab_estatisticas, text="Distribuição das Notas (selecione uma linha)", padding=10)
+        frame_faixas.pack(fill="x", pady=5, padx=5)
+        cols = ('faixa', 'np1', 'np2', 'pim')
+        self.tree_faixas = ttk.Treeview(frame_faixas, columns=cols, show='headings', height=10)
+        for col, titulo in zip(cols, ('Faixa', 'NP1', 'NP2', 'PIM')):
+            self.tree_faixas.heading(col, text=titulo)
+            self.tree_faixas.column(col, width=90)
+        self.tree_faixas.pack(fill="x")
+
+    def limpar_filtro_estatisticas(self):
+        self.combo_estatisticas_turma.set('')
+        self.carregar_estatisticas()
+
+    def carregar_estatisticas(self):
+        id_turma_filtro = self._get_id_from_combo(self.combo_estatisticas_turma.get()) if self.combo_estatisticas_turma.get() else None
+
+        def consulta(tarefa):
+            return estatisticas_situacoes(), estatisticas_turmas(id_turma_filtro)
+
+        def ao_terminar(resultado):
+            situacoes, grupos = resultado
+            total = sum(e.matriculas for e in situacoes)
+            for situacao, e in zip(SITUACOES, situacoes):
+                r = resumo_estatistica(e)
+                parte = f"{100.0 * e.matriculas / total:.1f}%" if total else "0%"
+                self.lbl_resumo_situacoes[situacao].config(text=f"{situacao}: {e.matriculas} ({parte}), média {r['media']:.2f}")
+            self.estatisticas_listadas = grupos
+            self.tabela_estatisticas.preencher(linhas_estatisticas(self.cache, grupos))
+            self.tree_faixas.delete(*self.tree_faixas.get_children())
+
+        self.executar_em_segundo_plano("estatisticas", "Carregando estatísticas...", consulta, ao_terminar)
+
+    def mostrar_faixas_estatistica(self, event=None):
+        selecao = self.tree_estatisticas.selection()
+        if not selecao: return
+        e = self.estatisticas_listadas[self.tree_estatisticas.index(selecao[0])]
+        self.tree_faixas.delete(*self.tree_faixas.get_children())
+        for linha in linhas_faixas(e): self.tree_faixas.insert("", "end", values=linha)
+
+    # --- ABA DIAGNÓSTICO (instrumentação das chamadas ao motor e das telas) ---
+    # Liga e desliga a medição (SGA_INSTRUMENTACAO=1 já abre ligada), mostra o que foi
+    # medido desde a última vez que zerou e grava o relatório em JSON
+    def criar_aba_diagnostico(self):
+        frame_top = ttk.Frame(self.tab_diagnostico, padding=10)
+        frame_top.pack(fill="x", side="top", pady=5, padx=5)
+        self.var_instrumentacao = tk.BooleanVar(value=instrumentacao.ativa)
+        ttk.Checkbutton(frame_top, text="Medir chamadas", variable=self.var_instrumentacao,
+                        command=self.alternar_instrumentacao).pack(side="left", padx=5)
+        ttk.Button(frame_top, text="Atualizar", command=self.mostrar_diagnostico).pack(side="left", padx=5)
+        ttk.Button(frame_top, text="Zerar", command=self.zerar_diagnostico).pack(side="left", padx=5)
+        ttk.Button(frame_top, text="Salvar JSON...", command=self.salvar_diagnostico).pack(side="left", padx=5)
+        self.lbl_diagnostico = ttk.Label(frame_top, text="")
+        self.lbl_diagnostico.pack(side="left", padx=10)
+
+        frame_lista = ttk.LabelFrame(self.tab_diagnostico, text="Chamadas (mais tempo total primeiro)", padding=10)
+        frame_lista.pack(fill="both", expand=True, pady=5, padx=5)
+        cols = ('nome', 'chamadas', 'total', 'media', 'p50', 'p95', 'maximo', 'lidos', 'gravados', 'examinados', 'devolvidos')
+        titulos = ('Chamada', 'Chamadas', 'Total (ms)', 'Média (µs)', 'p50 (µs)', 'p95 (µs)', 'Máx. (µs)',
+                   'KB lidos', 'KB gravados', 'Examinados', 'Devolvidos')
+        self.tree_diagnostico = ttk.Treeview(frame_lista, columns=cols, show='headings')
+        for col, titulo in zip(cols, titulos):
+            self.tree_diagnostico.heading(col, text=titulo)
+            self.tree_diagnostico.column(col, width=80)
+        self.tree_diagnostico.column('nome', width=220)
+        self.tree_diagnostico.pack(fill="both", expand=True)
+        self.tabela_diagnostico = TabelaEmBlocos(self.tree_diagnostico)
+        self.tree_diagnostico.bind('<<TreeviewSelect>>', self.mostrar_histograma_diagnostico)
+        self.medidas_listadas = []  # resumo de cada linha, na ordem da tabela
+
+        frame_hist = ttk.LabelFrame(self.tab_diagnostico, text="Tempos da Chamada (selecione uma linha)", padding=10)
+        frame_hist.pack(fill="x", pady=5, padx=5)
+        cols = ('faixa', 'chamadas', 'parte')
+        self.tree_histograma = ttk.Treeview(frame_hist, columns=cols, show='headings', height=8)
+        for col, titulo in zip(cols, ('Faixa (µs)', 'Chamadas', '%')):
+            self.tree_histograma.heading(col, text=titulo)
+            self.tree_histograma.column(col, width=110)
+        self.tree_histograma.pack(fill="x")
+
+    def alternar_instrumentacao(self):
+        instrumentacao.ativar(self.var_instrumentacao.get())
+        self.mostrar_diagnostico()
+
+    def zerar_diagnostico(self):
+        instrumentacao.zerar()
+        self.mostrar_diagnostico()
+
+    def mostrar_diagnostico(self):
+        relatorio = instrumentacao.relatorio()
+        estado = "ligada" if instrumentacao.ativa else "desligada"
+        self.lbl_diagnostico.config(text=f"Medição {estado} | motor {relatorio['motor']} | "
+                                         f"{relatorio['duracao_segundos']:.0f} s desde que zerou")
+        self.medidas_listadas = list(relatorio["medidas"].items())
+        self.tabela_diagnostico.preencher(
+            (nome, m["chamadas"], f"{m['segundos'] * 1000:.1f}", f"{m['media_us']:.1f}", m["p50_us"], m["p95_us"],
+             f"{m['maximo_us']:.0f}", f"{m['bytes_lidos'] / 1024:.1f}", f"{m['bytes_gravados'] / 1024:.1f}",
+             m["registros_examinados"], m["registros_devolvidos"])
+            for nome, m in self.medidas_listadas)
+        self.tree_histograma.delete(*self.tree_histograma.get_children())
+
+    def mostrar_histograma_diagnostico(self, event=None):
+        selecao = self.tree_diagnostico.selection()
+        if not selecao: return
+        _, m = self.medidas_listadas[self.tree_diagnostico.index(selecao[0])]
+        self.tree_histograma.delete(*self.tree_histograma.get_children())
+        for faixa, n in m["histograma_us"].items():
+            self.tree_histograma.insert("", "end", values=(faixa, n, f"{100.0 * n / m['chamadas']:.1f}"))
+
+    def salvar_diagnostico(self):
+        caminho = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON", "*.json")],
+                                               initialfile="instrumentacao.json")
+        if not caminho: return
+        try:
+            instrumentacao.salvar_json(caminho)
+        except OSError as e:
+            return messagebox.showerror("Erro", f"Não foi possível gravar {caminho}: {e}")
+        messagebox.showinfo("Sucesso", f"Relatório gravado em {caminho}.")
 
 
 if __name__ == "__main__":
-    app = App()
+    # python app.py --medir-abertura: mostra no terminal quanto levou cada fase da abertura
+    # e fecha sozinho quando os cadastros estiverem na tela
+    tempos = TemposAbertura(INICIO_PROGRAMA, ativo="--medir-abertura" in sys.argv[1:])
+    tempos.marcar("importação dos módulos")
+    # Motor de armazenamento: SGA_MOTOR=c (padrão, database.c compilado) ou python
+    try:
+        servico.carregar_biblioteca()
+    except (OSError, ValueError) as e:
+        messagebox.showerror("Erro Crítico", str(e))
+        exit()
+    tempos.marcar(f"carga do motor ({servico.motor})")
+    # Arquivos da versão anterior (sem cabeçalho) são convertidos antes de abrir a tela.
+    # Gravados em outro sistema (long de outro tamanho): python cli.py migrar --long 4|8
+    try:
+        convertidos = servico.migrar_formato()
+    except IOError as e:
+        messagebox.showerror("Erro Crítico", str(e))  # a mensagem já diz qual --long usar
+        exit()
+    if convertidos:
+        arquivos = ", ".join(ARQUIVOS_TABELAS[t][0] for t in convertidos)
+        messagebox.showinfo("Migração", f"Arquivos convertidos para o formato novo: {arquivos}.")
+    tempos.marcar("conferência do formato dos .dat")
+    app = App(tempos)
+    tempos.marcar("janela e primeira aba")
     app.mainloop()
+    if tempos.ativo: print(tempos.relatorio())
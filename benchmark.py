@@ -0,0 +1,286 @@
+# Mede o desempenho do SGA com dados sintéticos, sem abrir a interface: carga, buscas pelos
+# índices, atualização de notas, carga do cache da tela (dos .dat e da cópia em disco), as
+# consultas de boletim, notas e exames (pela biblioteca e pelo índice da api.py), a busca por
+# nome e as estatísticas por turma/matéria.
+# Cada motor (biblioteca C e Python puro) e cada tamanho roda num processo e numa pasta
+# temporária novos:
+#
+#   python benchmark.py                                  # 1k e 100k alunos, os dois motores
+#   python benchmark.py --tamanhos 1k 100k 1M --json resultados.json
+#   python benchmark.py --motores c --comparar resultados.json   # avisa o que ficou mais lento
+#   python benchmark.py --gerar dados_teste --tamanhos 100k       # só gera os .dat numa pasta
+#
+# Cada aluno tem MATERIAS_POR_TURMA matrículas (na sua turma), então matriculas.dat fica
+# com 4x o tamanho pedido. O JSON guarda a máquina e os parâmetros junto com os tempos,
+# para comparar uma versão com a outra ou dimensionar o servidor.
+import argparse
+import ctypes
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import servico
+from servico import (Aluno, Turma, Materia, Matricula, TurmaMateria, TABELA_ALUNOS, TABELA_MATRICULAS,
+                     CacheCadastros, consultar_matriculas, montar_matricula, linhas_boletim, linhas_notas,
+                     linhas_exames, estatisticas_turmas, estatistica_turma_materia)
+from api import MontadorIndice
+
+ALUNOS_POR_TURMA = 40
+MATERIAS = 50
+MATERIAS_POR_TURMA = 4
+RA_INICIAL = 100000
+LOTE_CARGA = 10000
+REPETICOES_EXAMES = 3
+TAMANHOS_PADRAO = ("1k", "100k")
+
+# --- 1. Dados sintéticos ---
+# Tudo sai do número do aluno (e da semente, para as notas): nada fica guardado em memória,
+# então 1M de alunos é gerado em lotes, e as amostras das medições são refeitas na hora
+def ler_tamanho(texto):
+    multiplicador = {"k": 1000, "m": 1000000}.get(texto[-1:].lower(), 1)
+    numero = texto[:-1] if multiplicador > 1 else texto
+    try:
+        total = int(numero) * multiplicador
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"tamanho inválido: {texto} (ex.: 1000, 100k, 1M)")
+    if total <= 0: raise argparse.ArgumentTypeError(f"tamanho inválido: {texto}")
+    return total
+
+def total_turmas(total_alunos): return (total_alunos + ALUNOS_POR_TURMA - 1) // ALUNOS_POR_TURMA
+
+def turma_do_aluno(i): return 1 + i // ALUNOS_POR_TURMA
+
+def materias_da_turma(id_turma):
+    return [1 + (id_turma + k * 7) % MATERIAS for k in range(MATERIAS_POR_TURMA)]
+
+def aluno_sintetico(i):
+    return Aluno(ra=RA_INICIAL + i, nome=f"Aluno Sintético {i}".encode('utf-8'), cpf=f"{i:011d}".encode(),
+                 telefone=b"(11) 90000-0000")
+
+def notas_aleatorias(aleatorio):
+    return (round(aleatorio.uniform(0, 10), 1), round(aleatorio.uniform(0, 10), 1),
+            round(aleatorio.uniform(0, 10), 1), aleatorio.randint(0, 25))
+
+def matriculas_sinteticas(total_alunos, aleatorio):
+    for i in range(total_alunos):
+        id_turma = turma_do_aluno(i)
+        for id_materia in materias_da_turma(id_turma):
+            yield montar_matricula(RA_INICIAL + i, id_turma, id_materia, *notas_aleatorias(aleatorio))
+
+def gravar_em_lotes(salvar_lote, tipo, registros):
+    registros, total = iter(registros), 0
+    while True:
+        parte = list(islice(registros, LOTE_CARGA))
+        if not parte: return total
+        salvar_lote((tipo * len(parte))(*parte), len(parte))
+        total += len(parte)
+
+# Grava os .dat na pasta atual pelo motor carregado. Retorna quantos registros foram para cada arquivo
+def gerar_arquivos(total_alunos, semente):
+    lib, turmas = servico.lib_c, total_turmas(total_alunos)
+    with servico.sessao():
+        return {
+            "turmas.dat": gravar_em_lotes(lib.salvarTurmasLote, Turma,
+                                          (Turma(id=t, nome=f"Turma {t}".encode()) for t in range(1, turmas + 1))),
+            "materias.dat": gravar_em_lotes(lib.salvarMateriasLote, Materia,
+                                            (Materia(id=m, nome=f"Matéria {m}".encode('utf-8')) for m in range(1, MATERIAS + 1))),
+            "grade.dat": gravar_em_lotes(lib.salvarTurmaMateriaLote, TurmaMateria,
+                                         (TurmaMateria(t, m) for t in range(1, turmas + 1) for m in materias_da_turma(t))),
+            "alunos.dat": gravar_em_lotes(lib.salvarAlunosLote, Aluno, (aluno_sintetico(i) for i in range(total_alunos))),
+            "matriculas.dat": gravar_em_lotes(lib.salvarMatriculasLote, Matricula,
+                                              matriculas_sinteticas(total_alunos, random.Random(semente))),
+        }
+
+# --- 2. Medições ---
+def medir(resultados, nome, operacoes, funcao):
+    inicio = time.perf_counter()
+    funcao()
+    segundos = time.perf_counter() - inicio
+    resultados.append({"operacao": nome, "operacoes": operacoes, "segundos": round(segundos, 6),
+                       "op_por_segundo": round(operacoes / segundos, 1) if segundos else None})
+
+def rodar_medicoes(total_alunos, total_buscas, semente):
+    lib = servico.lib_c
+    aleatorio = random.Random(semente)
+    resultados = []
+    arquivos = {}
+    medir(resultados, "carga", total_alunos * (1 + MATERIAS_POR_TURMA),
+          lambda: arquivos.update(gerar_arquivos(total_alunos, semente)))
+    medir(resultados, "reconstruirIndices", 2,
+          lambda: (lib.reconstruirIndices(TABELA_ALUNOS), lib.reconstruirIndices(TABELA_MATRICULAS)))
+
+    total_matriculas = arquivos["matriculas.dat"]
+    buffer = (Matricula * total_matriculas)()
+    medir(resultados, "carregarMatriculas", total_matriculas, lambda b=buffer: lib.carregarMatriculas(b, total_matriculas))
+    del buffer  # 1M de alunos = 4M de matrículas: não segura o buffer até o fim
+
+    amostra = [aleatorio.randrange(total_alunos) for _ in range(total_buscas)]
+    saida = Aluno()
+    medir(resultados, "buscarAlunoPorRA", total_buscas,
+          lambda: [lib.buscarAlunoPorRA(RA_INICIAL + i, ctypes.byref(saida)) for i in amostra])
+    medir(resultados, "buscarAlunoPorCPF", total_buscas,
+          lambda: [lib.buscarAlunoPorCPF(f"{i:011d}".encode(), ctypes.byref(saida)) for i in amostra])
+
+    # Cache da tela (o mesmo da interface, que a interface faz ao abrir)
+    cache = CacheCadastros()
+    medir(resultados, "carregar_dados_para_cache", sum(arquivos[a] for a in ("alunos.dat", "turmas.dat", "materias.dat", "grade.dat")),
+          cache.carregar)
+    medir(resultados, "indice_nomes (montagem)", len(cache.indice_nomes.novos), cache.indice_nomes.consolidar)
+    # Abertura seguinte da interface: cópia em disco + sincronizar (nada mudou nos .dat)
+    medir(resultados, "copia_cache (gravar)", len(cache.alunos), cache.salvar_copia)
+    copia = CacheCadastros()
+    medir(resultados, "copia_cache (ler)", len(cache.alunos), lambda: (copia.carregar_copia(), copia.sincronizar()))
+    medir(resultados, "busca_nome", total_buscas,
+          lambda: [cache.indice_nomes.buscar(f"sint {i}", 20) for i in amostra])
+
+    # Consultas das abas, do jeito que a interface monta as linhas
+    def consultar_boletins():
+        for i in amostra:
+            aluno_c = servico.buscar_aluno_por_ra(RA_INICIAL + i)
+            linhas_boletim(cache, servico.boletim(aluno_c.ra))
+    medir(resultados, "consulta_boletim", total_buscas, consultar_boletins)
+
+    turmas_amostra = [turma_do_aluno(i) for i in amostra]
+    pares = [(t, aleatorio.choice(materias_da_turma(t))) for t in turmas_amostra]
+    medir(resultados, "consulta_notas", total_buscas,
+          lambda: [linhas_notas(cache, consultar_matriculas(lib.matriculasPorTurmaMateria, t, m)) for t, m in pares])
+    medir(resultados, "consulta_exames", REPETICOES_EXAMES,
+          lambda: [linhas_exames(cache, consultar_matriculas(lib.matriculasEmExame)) for _ in range(REPETICOES_EXAMES)])
+
+    # Índice da API HTTP: montagem e o JSON de cada pedido (sem a rede; pedido repetido sai pronto)
+    api = {}
+    medir(resultados, "api (montar índice)", total_matriculas, lambda: api.update(indice=MontadorIndice().montar()))
+    medir(resultados, "api (boletim)", total_buscas,
+          lambda: [api["indice"].responder(f"/boletim/ra/{RA_INICIAL + i}") for i in amostra])
+    medir(resultados, "api (notas)", total_buscas,
+          lambda: [api["indice"].responder(f"/turmas/{t}/materias/{m}") for t, m in pares])
+
+    alteradas = [montar_matricula(RA_INICIAL + i, t, m, *notas_aleatorias(aleatorio))
+                 for i, (t, m) in zip(amostra, pares)]
+    medir(resultados, "atualizarMatricula", total_buscas, lambda: [lib.atualizarMatricula(m) for m in alteradas])
+    lote = (Matricula * len(alteradas))(*alteradas)
+    medir(resultados, "atualizarMatriculasLote", len(alteradas), lambda: lib.atualizarMatriculasLote(lote, len(lote)))
+
+    # Estatísticas: um lote grande deixa o matriculas.est para ser refeito na primeira leitura
+    medir(resultados, "estatisticas (refazer)", total_matriculas, estatisticas_turmas)
+    medir(resultados, "estatisticas_turmas", REPETICOES_EXAMES,
+          lambda: [estatisticas_turmas() for _ in range(REPETICOES_EXAMES)])
+    medir(resultados, "estatistica_turma_materia", total_buscas,
+          lambda: [estatistica_turma_materia(t, m) for t, m in pares])
+    return {"arquivos": arquivos, "medicoes": resultados}
+
+# Roda num processo novo (a biblioteca C guarda sga.lock e a sessão da pasta em que
+# começou, e o motor só é escolhido uma vez por processo) e numa pasta temporária própria
+def rodar_em_pasta(nome_motor, total_alunos, total_buscas, semente):
+    servico.escolher_motor(nome_motor)
+    servico.carregar_biblioteca()
+    pasta = tempfile.mkdtemp(prefix=f"sga_bench_{nome_motor}_")
+    try:
+        os.chdir(pasta)
+        return rodar_medicoes(total_alunos, total_buscas, semente)
+    finally:
+        os.chdir(tempfile.gettempdir())
+        shutil.rmtree(pasta, ignore_errors=True)
+
+def rodar_em_processo(*args):
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(rodar_em_pasta, *args).result()
+
+def gerar_em_pasta(pasta, nome_motor, total_alunos, semente):
+    os.makedirs(pasta, exist_ok=True)
+    if any(os.path.exists(os.path.join(pasta, arquivo)) for arquivo, _ in servico.ARQUIVOS_TABELAS.values()):
+        raise FileExistsError(f"A pasta {pasta} já tem arquivos .dat; use uma pasta vazia.")
+    os.chdir(pasta)
+    servico.escolher_motor(nome_motor)
+    return gerar_arquivos(total_alunos, semente)
+
+# --- 3. Saída ---
+def descrever_maquina():
+    return {"plataforma": platform.platform(), "processador": platform.processor() or platform.machine(),
+            "cpus": os.cpu_count(), "python": platform.python_version()}
+
+def imprimir(execucoes):
+    for tamanho in sorted({e["alunos"] for e in execucoes}):
+        do_tamanho = [e for e in execucoes if e["alunos"] == tamanho]
+        print(f"\n{tamanho} alunos")
+        print(f"{'operação':28}" + "".join(f"{e['motor'] + ' (s)':>14}{e['motor'] + ' (op/s)':>16}" for e in do_tamanho))
+        for i, medicao in enumerate(do_tamanho[0]["medicoes"]):
+            linha = f"{medicao['operacao']:28}"
+            for e in do_tamanho:
+                m = e["medicoes"][i]
+                linha += f"{m['segundos']:14.3f}{m['op_por_segundo'] or 0:16,.0f}"
+            print(linha)
+
+# Operações que ficaram mais lentas que a execução anterior (mesmo motor e tamanho)
+def comparar(execucoes, caminho_anterior, tolerancia):
+    with open(caminho_anterior, encoding="utf-8") as f:
+        anterior = json.load(f)
+    tempos = {(e["motor"], e["alunos"], m["operacao"]): m["segundos"]
+              for e in anterior["execucoes"] for m in e["medicoes"]}
+    piores = []
+    for e in execucoes:
+        for m in e["medicoes"]:
+            antes = tempos.get((e["motor"], e["alunos"], m["operacao"]))
+            if antes and m["segundos"] > antes * (1 + tolerancia):
+                piores.append((e["motor"], e["alunos"], m["operacao"], antes, m["segundos"]))
+    for motor, alunos, operacao, antes, depois in piores:
+        print(f"Mais lento: {motor}, {alunos} alunos, {operacao}: {antes:.3f} s -> {depois:.3f} s", file=sys.stderr)
+    return piores
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mede o desempenho do SGA com dados sintéticos.")
+    parser.add_argument("--tamanhos", nargs="+", type=ler_tamanho, default=[ler_tamanho(t) for t in TAMANHOS_PADRAO],
+                        help="quantidades de alunos, ex.: 1k 100k 1M (padrão: 1k 100k)")
+    parser.add_argument("--buscas", type=int, default=2000, help="buscas, consultas e atualizações medidas (padrão: 2000)")
+    parser.add_argument("--motores", nargs="+", choices=servico.MOTORES, default=list(servico.MOTORES))
+    parser.add_argument("--semente", type=int, default=1)
+    parser.add_argument("--json", help="grava os resultados em JSON neste arquivo ('-' = saída padrão)")
+    parser.add_argument("--comparar", metavar="JSON", help="resultados anteriores: avisa as operações que ficaram mais lentas")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="folga da comparação (padrão: 0.2 = 20%%)")
+    parser.add_argument("--gerar", metavar="PASTA", help="só gera os .dat nesta pasta (um tamanho, primeiro motor) e sai")
+    args = parser.parse_args(argv)
+
+    if args.gerar:
+        try:
+            arquivos = gerar_em_pasta(args.gerar, args.motores[0], args.tamanhos[0], args.semente)
+        except OSError as e:
+            print(f"Erro: {e}", file=sys.stderr)
+            return 1
+        for arquivo, n in arquivos.items(): print(f"{arquivo}: {n} registros.")
+        return 0
+
+    execucoes = []
+    for total_alunos in args.tamanhos:
+        for nome_motor in args.motores:
+            try:
+                resultado = rodar_em_processo(nome_motor, total_alunos, args.buscas, args.semente)
+            except OSError as e:
+                print(f"Motor {nome_motor} indisponível: {e}", file=sys.stderr)
+                continue
+            execucoes.append({"motor": nome_motor, "alunos": total_alunos, **resultado})
+    if not execucoes: return 1
+
+    # Compara antes de gravar: --comparar e --json podem ser o mesmo arquivo
+    piores = comparar(execucoes, args.comparar, args.tolerancia) if args.comparar else []
+    if args.json:
+        relatorio = {"maquina": descrever_maquina(), "data": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                     "parametros": {"buscas": args.buscas, "semente": args.semente}, "execucoes": execucoes}
+        if args.json == "-":
+            json.dump(relatorio, sys.stdout, ensure_ascii=False, indent=2)
+            print()
+        else:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(relatorio, f, ensure_ascii=False, indent=2)
+    if args.json != "-": imprimir(execucoes)
+    return 3 if piores else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
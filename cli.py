@@ -0,0 +1,241 @@
+# Linha de comando do SGA: roda as tarefas em lote (importação, exportação, recálculo e
+# relatório) sem abrir a interface, por exemplo agendada num servidor sem tela.
+#
+#   python cli.py importar alunos alunos.csv
+#   python cli.py exportar matriculas matriculas.csv
+#   python cli.py recalcular --turma 123
+#   python cli.py relatorio --saida relatorio.csv
+#   python cli.py relatorio --por-situacao --completo
+#   python cli.py compactar matriculas
+#   python cli.py migrar --long 4
+#   python cli.py verificar
+#   python cli.py buscar maria silva
+#   python cli.py --medir medidas.json recalcular
+#
+# Os arquivos .dat são lidos/gravados na pasta atual (ou na indicada por --pasta).
+# --motor python usa o motor em Python puro no lugar da biblioteca C (padrão: SGA_MOTOR ou c).
+# --medir grava em JSON o tempo, os bytes e os registros de cada chamada ao motor (ver servico.Instrumentacao).
+import argparse
+import csv
+import os
+import sys
+
+import servico
+from servico import (NOMES_TABELAS, ARQUIVOS_TABELAS, TABELA_ALUNOS, TABELA_TURMAS, TABELA_MATERIAS,
+                     TABELA_MATRICULAS, FAIXAS_NOTA, SITUACOES, Aluno, Turma, Materia, IndiceNomes, VisaoMapeada,
+                     iterar_registros, campos, registro_para_dict, recalcular_matriculas, estatisticas_turmas,
+                     estatisticas_situacoes, resumo_estatistica)
+
+def abrir_saida(caminho):
+    if caminho in (None, "-"): return sys.stdout
+    return open(caminho, "w", newline="", encoding="utf-8")
+
+# Quantas linhas com erro são listadas na tela (o total aparece sempre)
+MAXIMO_ERROS_LISTADOS = 20
+
+# --- 1. Importar ---
+def comando_importar(args):
+    importados, erros = servico.importar_csv(NOMES_TABELAS[args.tabela], args.arquivo, args.separador)
+    print(f"{importados} registros importados em {args.tabela}.")
+    if erros:
+        print(f"{len(erros)} linhas com erro foram puladas:", file=sys.stderr)
+        for numero, mensagem in erros[:MAXIMO_ERROS_LISTADOS]:
+            print(f"  linha {numero}: {mensagem}", file=sys.stderr)
+        if len(erros) > MAXIMO_ERROS_LISTADOS:
+            print(f"  ... e mais {len(erros) - MAXIMO_ERROS_LISTADOS}.", file=sys.stderr)
+
+# --- 2. Exportar ---
+def comando_exportar(args):
+    tabela = NOMES_TABELAS[args.tabela]
+    tipo = ARQUIVOS_TABELAS[tabela][1]
+    saida = abrir_saida(args.arquivo)
+    try:
+        escritor = csv.DictWriter(saida, fieldnames=campos(tipo), delimiter=args.separador)
+        escritor.writeheader()
+        for registro in iterar_registros(tabela, tipo):
+            escritor.writerow(registro_para_dict(registro))
+    finally:
+        if saida is not sys.stdout: saida.close()
+
+# --- 3. Recalcular médias e status ---
+def comando_recalcular(args):
+    registros = VisaoMapeada(TABELA_MATRICULAS).atualizar()
+    alteradas = recalcular_matriculas(registros, args.turma, args.materia)
+    print(f"{alteradas} matrículas tiveram média/status atualizados.")
+
+# --- 4. Relatório por turma e matéria ---
+# Lê os totais que o motor mantém a cada gravação de matrícula (não percorre as matrículas).
+# --completo acrescenta porcentagens, médias de cada nota e das faltas e quantas notas caem
+# em cada faixa (np1_0 = de 0 a 1, ..., np1_9 = de 9 a 10); --por-situacao soma por situação
+COLUNAS_RELATORIO = ["turma", "materia", "matriculas", "aprovados", "exame", "reprovados_faltas", "pendentes", "media"]
+COLUNAS_SITUACAO = ["situacao", "matriculas", "media"]
+COLUNAS_COMPLETAS = ["perc_aprovados", "perc_exame", "perc_reprovados_faltas", "media_np1", "media_np2", "media_pim",
+                     "media_faltas"]
+COLUNAS_FAIXAS = [f"{nota}_{faixa}" for nota in ("np1", "np2", "pim") for faixa in range(FAIXAS_NOTA)]
+
+def colunas_relatorio(por_situacao=False, completo=False):
+    colunas = COLUNAS_SITUACAO if por_situacao else COLUNAS_RELATORIO
+    return colunas + COLUNAS_COMPLETAS + COLUNAS_FAIXAS if completo else colunas
+
+def linha_estatistica(e, colunas):
+    resumo = resumo_estatistica(e)
+    linha = {c: resumo[c] for c in colunas if c in resumo}
+    for c in ("media", "media_np1", "media_np2", "media_pim", "media_faltas"):
+        if c in linha: linha[c] = f"{linha[c]:.2f}"
+    for c in ("perc_aprovados", "perc_exame", "perc_reprovados_faltas"):
+        if c in linha: linha[c] = f"{linha[c]:.1f}"
+    for c in COLUNAS_FAIXAS:
+        if c in colunas:
+            nota, faixa = c.rsplit("_", 1)
+            linha[c] = resumo[f"faixas_{nota}"][int(faixa)]
+    return linha
+
+def montar_relatorio(id_turma=None, completo=False):
+    nomes_turmas = {t.id: t.nome.decode('utf-8') for t in iterar_registros(TABELA_TURMAS, Turma)}
+    nomes_materias = {m.id: m.nome.decode('utf-8') for m in iterar_registros(TABELA_MATERIAS, Materia)}
+    colunas = colunas_relatorio(completo=completo)
+    return [{"turma": nomes_turmas.get(e.id_turma, f"ID {e.id_turma}"),
+             "materia": nomes_materias.get(e.id_materia, f"ID {e.id_materia}"),
+             **linha_estatistica(e, colunas)} for e in estatisticas_turmas(id_turma)]
+
+def montar_relatorio_situacoes(completo=False):
+    colunas = colunas_relatorio(por_situacao=True, completo=completo)
+    return [{"situacao": nome, **linha_estatistica(e, colunas)}
+            for nome, e in zip(SITUACOES, estatisticas_situacoes())]
+
+def comando_relatorio(args):
+    if args.por_situacao and args.turma is not None:
+        raise ValueError("--por-situacao soma todas as turmas (não use com --turma)")
+    if args.por_situacao: linhas = montar_relatorio_situacoes(args.completo)
+    else: linhas = montar_relatorio(args.turma, args.completo)
+    saida = abrir_saida(args.saida)
+    try:
+        escritor = csv.DictWriter(saida, fieldnames=colunas_relatorio(args.por_situacao, args.completo),
+                                  delimiter=args.separador)
+        escritor.writeheader()
+        escritor.writerows(linhas)
+    finally:
+        if saida is not sys.stdout: saida.close()
+
+# --- 5. Compactar ---
+# Tira do arquivo os registros apagados (e as matrículas/ligações repetidas) na hora, sem
+# esperar o limite de espaço morto. Sem tabela, compacta todas
+def comando_compactar(args):
+    conferir_tabelas(args.tabelas)
+    for nome in args.tabelas or NOMES_TABELAS:
+        removidos = servico.compactar(NOMES_TABELAS[nome])
+        print(f"{nome}: {removidos} registros removidos.")
+
+# --- 6. Migrar e verificar o formato dos .dat ---
+# Converte os .dat da versão anterior (sem cabeçalho). --long diz o tamanho do long de
+# quem gravou: 4 para arquivos vindos do Windows, 8 do Linux (padrão: o deste computador)
+def comando_migrar(args):
+    convertidos = servico.migrar_formato(args.long)
+    if not convertidos: print("Todos os arquivos já estão no formato atual.")
+    for tabela, n in convertidos.items():
+        print(f"{ARQUIVOS_TABELAS[tabela][0]}: {n} registros convertidos.")
+
+def comando_verificar(args):
+    conferir_tabelas(args.tabelas)
+    estragadas = 0
+    for nome in args.tabelas or NOMES_TABELAS:
+        ruins = servico.verificar(NOMES_TABELAS[nome])
+        if not ruins: print(f"{nome}: ok.")
+        else: estragadas += 1
+        for de, ate in ruins[:MAXIMO_ERROS_LISTADOS]:
+            print(f"{nome}: registros {de} a {ate} não conferem com a soma de verificação.", file=sys.stderr)
+    return 2 if estragadas else 0
+
+# --- 7. Buscar alunos por parte do nome ---
+# Sem acento e sem diferença de maiúsculas; cada palavra pode ser só o começo ("mar sil")
+def comando_buscar(args):
+    indice = IndiceNomes()
+    for aluno in iterar_registros(TABELA_ALUNOS, Aluno):
+        indice.adicionar(aluno.ra, aluno.nome.decode('utf-8'))
+    achados = indice.buscar(" ".join(args.nome), args.limite)
+    if not achados:
+        print("Nenhum aluno encontrado.", file=sys.stderr)
+        return 1
+    for ra, nome in achados: print(f"{ra}{args.separador}{nome}")
+
+def conferir_tabelas(nomes):
+    desconhecidas = [nome for nome in nomes if nome not in NOMES_TABELAS]
+    if desconhecidas:
+        raise ValueError(f"tabela desconhecida: {', '.join(desconhecidas)} (use {', '.join(NOMES_TABELAS)})")
+
+def criar_parser():
+    parser = argparse.ArgumentParser(description="Tarefas em lote do Sistema de Gestão Acadêmica (SGA).")
+    parser.add_argument("--pasta", help="pasta com os arquivos .dat (padrão: pasta atual)")
+    parser.add_argument("--separador", default=",", help="separador dos arquivos CSV (padrão: ',')")
+    parser.add_argument("--motor", choices=servico.MOTORES, help=f"motor de armazenamento (padrão: {servico.motor})")
+    parser.add_argument("--medir", metavar="ARQUIVO", help="grava em ARQUIVO (JSON) as medidas de cada chamada ao motor")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p = sub.add_parser("importar", help="importa registros de um CSV (cabeçalho com os nomes dos campos); RAs e IDs em branco são gerados")
+    p.add_argument("tabela", choices=NOMES_TABELAS)
+    p.add_argument("arquivo")
+    p.set_defaults(funcao=comando_importar)
+
+    p = sub.add_parser("exportar", help="exporta uma tabela inteira para CSV")
+    p.add_argument("tabela", choices=NOMES_TABELAS)
+    p.add_argument("arquivo", nargs="?", help="arquivo de saída (padrão: saída padrão)")
+    p.set_defaults(funcao=comando_exportar)
+
+    p = sub.add_parser("recalcular", help="recalcula média e status das matrículas")
+    p.add_argument("--turma", type=int)
+    p.add_argument("--materia", type=int)
+    p.set_defaults(funcao=comando_recalcular)
+
+    p = sub.add_parser("relatorio", help="resumo de situação por turma e matéria (CSV)")
+    p.add_argument("--turma", type=int)
+    p.add_argument("--por-situacao", action="store_true", help="uma linha por situação, somando todas as turmas")
+    p.add_argument("--completo", action="store_true", help="inclui porcentagens, médias das notas e faixas de notas")
+    p.add_argument("--saida", help="arquivo de saída (padrão: saída padrão)")
+    p.set_defaults(funcao=comando_relatorio)
+
+    p = sub.add_parser("compactar", help="remove do arquivo os registros apagados e as matrículas repetidas")
+    p.add_argument("tabelas", nargs="*", metavar="tabela", help="tabelas a compactar (padrão: todas)")
+    p.set_defaults(funcao=comando_compactar)
+
+    p = sub.add_parser("migrar", help="converte os arquivos .dat da versão anterior para o formato atual")
+    p.add_argument("--long", type=int, choices=(4, 8), default=0,
+                   help="tamanho do long de quem gravou: 4 (Windows) ou 8 (Linux); padrão: o deste computador")
+    p.set_defaults(funcao=comando_migrar, formato_antigo=True)
+
+    p = sub.add_parser("verificar", help="confere as somas de verificação dos arquivos .dat")
+    p.add_argument("tabelas", nargs="*", metavar="tabela", help="tabelas a verificar (padrão: todas)")
+    p.set_defaults(funcao=comando_verificar)
+
+    p = sub.add_parser("buscar", help="procura alunos por parte do nome (imprime RA e nome)")
+    p.add_argument("nome", nargs="+")
+    p.add_argument("--limite", type=int, default=50, help="máximo de alunos listados (padrão: 50)")
+    p.set_defaults(funcao=comando_buscar)
+    return parser
+
+def main(argv=None):
+    args = criar_parser().parse_args(argv)
+    medidas = os.path.abspath(args.medir) if args.medir else None  # relativo à pasta de onde foi chamado
+    if medidas: servico.instrumentacao.ativar()
+    try:
+        if args.pasta: os.chdir(args.pasta)
+        if args.motor: servico.escolher_motor(args.motor)
+        servico.carregar_biblioteca()
+        with servico.instrumentacao.medir(f"comando: {args.comando}"), servico.sessao():
+            if not getattr(args, "formato_antigo", False): servico.conferir_formato()
+            codigo = args.funcao(args)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Erro: {e}", file=sys.stderr)
+        return 1
+    finally:
+        if medidas: salvar_medidas(medidas)
+    return codigo or 0
+
+# Grava mesmo quando o comando falhou: as medidas ajudam a ver onde parou
+def salvar_medidas(caminho):
+    try:
+        servico.instrumentacao.salvar_json(caminho)
+    except OSError as e:
+        print(f"Erro ao gravar as medidas em {caminho}: {e}", file=sys.stderr)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,18 @@
 #include <stdio.h>
 #include <string.h>
 #include <stdlib.h> 
+#include <limits.h>
+#include <stdint.h>
+#ifdef _WIN32
+#include <io.h>
+#include <process.h>
+#include <windows.h>
+#else
+#include <unistd.h>
+#include <fcntl.h>
+#include <errno.h>
+#include <sys/stat.h>
+#endif
 
 // --- 1. DEFINIÇÃO DAS ESTRUTURAS ---
 // (Idênticas à versão 3)
@@ -39,163 +51,2652 @@ typedef struct {
     int id_materia;
 } TurmaMateria;
 
+// Cabe um registro de qualquer tabela (exclusão, compactação, migração)
+typedef union {
+    Aluno aluno;
+    Turma turma;
+    Materia materia;
+    Matricula matricula;
+    TurmaMateria tm;
+} RegistroQualquer;
 
 // --- 2. NOMES DOS ARQUIVOS DE DADOS ---
 // (Idênticos à versão 3)
-const char* ALUNOS_DB = "alunos.dat";
-const char* TURMAS_DB = "turmas.dat";
-const char* MATERIAS_DB = "materias.dat";
-const char* MATRICULAS_DB = "matriculas.dat";
-const char* GRADE_DB = "grade.dat"; 
+const char ALUNOS_DB[] = "alunos.dat";
+const char TURMAS_DB[] = "turmas.dat";
+const char MATERIAS_DB[] = "materias.dat";
+const char MATRICULAS_DB[] = "matriculas.dat";
+const char GRADE_DB[] = "grade.dat";
+
+// Número de cada tabela (cursor, travas) - mesma ordem usada no Python
+enum { TABELA_ALUNOS = 0, TABELA_TURMAS, TABELA_MATERIAS, TABELA_MATRICULAS, TABELA_GRADE, TOTAL_TABELAS };
+
+// Índices (gerados automaticamente a partir dos .dat)
+const char ALUNOS_RA_IDX[] = "alunos_ra.idx";
+const char ALUNOS_CPF_IDX[] = "alunos_cpf.idx";
+const char MATRICULAS_CHAVE_IDX[] = "matriculas_chave.idx";
+const char MATRICULAS_ALUNO_IDX[] = "matriculas_aluno.idx";
+const char MATRICULAS_TURMA_IDX[] = "matriculas_turma.idx";
+const char MATRICULAS_STATUS_IDX[] = "matriculas_status.idx";
+
+// Journal de escrita das matrículas (existe só durante uma atualização)
+const char MATRICULAS_JNL[] = "matriculas.jnl";
+
+// Estatísticas por turma/matéria e por situação (geradas a partir do matriculas.dat, ver 2.7)
+const char MATRICULAS_EST[] = "matriculas.est";
+
+// Travas entre processos (vários SGA usando a mesma pasta)
+const char TRAVAS_DB[] = "sga.lock";
+
+// Próximo RA/ID livre de cada tabela (gerado a partir dos .dat se não existir)
+const char SEQUENCIAS_DB[] = "sequencias.dat";
+
+// Somas de verificação dos blocos de cada .dat (ver 2.2)
+const char ALUNOS_SOMAS[] = "alunos.sum";
+const char TURMAS_SOMAS[] = "turmas.sum";
+const char MATERIAS_SOMAS[] = "materias.sum";
+const char MATRICULAS_SOMAS[] = "matriculas.sum";
+const char GRADE_SOMAS[] = "grade.sum";
+
+// Arquivos e tamanho do registro de cada tabela (mesma ordem do enum)
+typedef struct {
+    const char* arquivo;
+    const char* arquivo_somas;
+    size_t tam_registro;
+    int chave_long;   // o primeiro campo é long: o registro muda de tamanho entre Windows e Linux
+} Tabela;
+
+static const Tabela TABELAS[TOTAL_TABELAS] = {
+    { ALUNOS_DB, ALUNOS_SOMAS, sizeof(Aluno), 1 },
+    { TURMAS_DB, TURMAS_SOMAS, sizeof(Turma), 0 },
+    { MATERIAS_DB, MATERIAS_SOMAS, sizeof(Materia), 0 },
+    { MATRICULAS_DB, MATRICULAS_SOMAS, sizeof(Matricula), 1 },
+    { GRADE_DB, GRADE_SOMAS, sizeof(TurmaMateria), 0 },
+};
+
+
+// --- 2.1 FUNÇÕES AUXILIARES DE ARQUIVO ---
+
+// Contadores de E/S para a instrumentação do Python (ver lerContadores): bytes lidos e
+// gravados em qualquer arquivo do banco e registros dos .dat examinados. As macros fazem
+// todo fread/fwrite deste arquivo passar pelas funções abaixo
+typedef struct {
+    unsigned long long bytes_lidos;
+    unsigned long long bytes_gravados;
+    unsigned long long registros_examinados;
+} ContadoresES;
+
+static ContadoresES contadores;
+
+static size_t freadContado(void* destino, size_t tam, size_t n, FILE *f) {
+    size_t lidos = fread(destino, tam, n, f);
+    contadores.bytes_lidos += lidos * tam;
+    return lidos;
+}
+
+static size_t fwriteContado(const void* origem, size_t tam, size_t n, FILE *f) {
+    size_t gravados = fwrite(origem, tam, n, f);
+    contadores.bytes_gravados += gravados * tam;
+    return gravados;
+}
+
+#define fread freadContado
+#define fwrite fwriteContado
+
+// Leitura de registros de um .dat (varreduras e leituras pela posição do índice)
+static size_t lerRegistros(void* destino, size_t tam, size_t n, FILE *f) {
+    size_t lidos = fread(destino, tam, n, f);
+    contadores.registros_examinados += lidos;
+    return lidos;
+}
+
+// Sessão: fora dela cada função abre e fecha os arquivos que usa. Entre abrirBanco() e
+// fecharBanco() os .dat e .idx abertos ficam guardados aqui e as chamadas seguintes
+// reaproveitam o mesmo FILE* (descritor e buffer de leitura) em vez de abrir de novo.
+// Todo acesso a arquivo do banco passa por abrirArquivo/fecharArquivo/removerArquivo
+#define MAX_ARQUIVOS_SESSAO 24
+#define TAMANHO_BUFFER_SESSAO (64 * 1024)
+
+typedef struct {
+    char nome[64];
+    FILE *f;
+    int em_uso;   // emprestado para uma função que ainda não chamou fecharArquivo
+} ArquivoSessao;
+
+static int profundidade_sessao = 0;   // abrirBanco pode ser chamado de novo dentro de uma sessão
+static ArquivoSessao arquivos_sessao[MAX_ARQUIVOS_SESSAO];
+static int total_arquivos_sessao = 0;
+
+static ArquivoSessao* procurarArquivoSessao(const char* arquivo) {
+    for (int i = 0; i < total_arquivos_sessao; i++) {
+        if (strcmp(arquivos_sessao[i].nome, arquivo) == 0) return &arquivos_sessao[i];
+    }
+    return NULL;
+}
+
+// Fecha o FILE* guardado do arquivo (antes de apagar, renomear ou truncar). Se ele está
+// emprestado (ex.: cursor aberto), só sai da sessão: quem pegou fecha com fclose normal
+static void esquecerArquivo(const char* arquivo) {
+    ArquivoSessao* a = procurarArquivoSessao(arquivo);
+    if (a == NULL) return;
+    if (!a->em_uso) fclose(a->f);
+    *a = arquivos_sessao[--total_arquivos_sessao];
+}
+
+// O FILE* guardado ainda é o arquivo que está no disco com esse nome? Outro processo pode
+// ter apagado ou trocado o arquivo (ex.: índice reconstruído). No Windows um arquivo
+// aberto não pode ser apagado nem trocado, então não há o que conferir
+static int mesmoArquivoNoDisco(FILE *f, const char* arquivo) {
+#ifdef _WIN32
+    (void)f; (void)arquivo;
+    return 1;
+#else
+    struct stat no_disco, aberto;
+    return stat(arquivo, &no_disco) == 0 && fstat(fileno(f), &aberto) == 0
+           && no_disco.st_ino == aberto.st_ino && no_disco.st_dev == aberto.st_dev;
+#endif
+}
+
+// Mesmo uso do fopen ("rb", "r+b", "ab" ou "wb"). Numa sessão, "rb", "r+b" e "ab" devolvem
+// o FILE* guardado (aberto em "r+b") já posicionado como um fopen novo: no início, ou no
+// fim para "ab". "wb" (temporários e journal) nunca fica guardado
+static FILE* abrirArquivo(const char* arquivo, const char* modo) {
+    if (modo[0] == 'w') esquecerArquivo(arquivo);
+    if (profundidade_sessao == 0 || modo[0] == 'w' || strlen(arquivo) >= sizeof(arquivos_sessao[0].nome)) {
+        return fopen(arquivo, modo);
+    }
+    ArquivoSessao* a = procurarArquivoSessao(arquivo);
+    if (a != NULL && a->em_uso) return fopen(arquivo, modo);  // já emprestado: abre outro
+    if (a != NULL && !mesmoArquivoNoDisco(a->f, arquivo)) {
+        esquecerArquivo(arquivo);
+        a = NULL;
+    }
+    if (a == NULL) {
+        if (total_arquivos_sessao >= MAX_ARQUIVOS_SESSAO) return fopen(arquivo, modo);
+        FILE *f = fopen(arquivo, "r+b");
+        if (f == NULL && modo[0] == 'a') {
+            FILE *novo = fopen(arquivo, "ab");  // cria o arquivo
+            if (novo != NULL) fclose(novo);
+            f = fopen(arquivo, "r+b");
+        }
+        if (f == NULL) return fopen(arquivo, modo);  // não existe ou é só leitura
+        setvbuf(f, NULL, _IOFBF, TAMANHO_BUFFER_SESSAO);
+        a = &arquivos_sessao[total_arquivos_sessao++];
+        strcpy(a->nome, arquivo);
+        a->f = f;
+    } else {
+        // O arquivo pode ter sido alterado por outro FILE* desde o último uso
+        fflush(a->f);
+    }
+    a->em_uso = 1;
+    fseek(a->f, 0, modo[0] == 'a' ? SEEK_END : SEEK_SET);
+    return a->f;
+}
+
+// Mesmo retorno do fclose. O FILE* da sessão só é devolvido (com o buffer gravado)
+static int fecharArquivo(FILE *f) {
+    for (int i = 0; i < total_arquivos_sessao; i++) {
+        if (arquivos_sessao[i].f == f) {
+            arquivos_sessao[i].em_uso = 0;
+            return fflush(f);
+        }
+    }
+    return fclose(f);
+}
+
+static int removerArquivo(const char* arquivo) {
+    esquecerArquivo(arquivo);
+    return remove(arquivo);
+}
+
+// Buffer dos arquivos gravados de ponta a ponta num temporário (compactação, migração)
+#define TAMANHO_BUFFER_ESCRITA (1 << 20)
+
+// Troca 'destino' por 'origem' (no Windows o rename não sobrescreve). Retorna 1 se trocou
+static int substituirArquivo(const char* origem, const char* destino) {
+    esquecerArquivo(origem);
+    esquecerArquivo(destino);
+#ifdef _WIN32
+    remove(destino);
+#endif
+    return rename(origem, destino) == 0;
+}
+
+// Nome de arquivo temporário só deste processo ("<arquivo>.<pid>.tmp"): dois SGA
+// reconstruindo o mesmo índice ao mesmo tempo não escrevem um no temporário do outro
+static void nomeTemporario(char* destino, size_t tam, const char* arquivo) {
+#ifdef _WIN32
+    snprintf(destino, tam, "%s.%d.tmp", arquivo, _getpid());
+#else
+    snprintf(destino, tam, "%s.%ld.tmp", arquivo, (long)getpid());
+#endif
+}
+
+// Exclusão lógica: o registro apagado fica no .dat (até a compactação) com a chave, que é
+// o primeiro campo de toda struct, trocada por APAGADO. Leituras, cursores e índices
+// pulam esses registros
+#define APAGADO (-1)
+
+static int registroApagado(int tabela, const void* registro) {
+    switch (tabela) {
+        case TABELA_ALUNOS: return ((const Aluno*)registro)->ra == APAGADO;
+        case TABELA_TURMAS: return ((const Turma*)registro)->id == APAGADO;
+        case TABELA_MATERIAS: return ((const Materia*)registro)->id == APAGADO;
+        case TABELA_MATRICULAS: return ((const Matricula*)registro)->ra_aluno == APAGADO;
+        case TABELA_GRADE: return ((const TurmaMateria*)registro)->id_turma == APAGADO;
+        default: return 0;
+    }
+}
+
+// Grava o que está no buffer e pede ao sistema para mandar para o disco
+static void sincronizarArquivo(FILE *f) {
+    fflush(f);
+#ifdef _WIN32
+    _commit(_fileno(f));
+#else
+    fsync(fileno(f));
+#endif
+}
+
+// Hash FNV-1a. 'h' é o valor inicial (FNV_INICIAL ou o hash de um pedaço anterior)
+#define FNV_INICIAL 2166136261u
+
+static unsigned int hashBytes(unsigned int h, const void* dados, size_t tam) {
+    const unsigned char* p = (const unsigned char*)dados;
+    for (size_t i = 0; i < tam; i++) {
+        h ^= p[i];
+        h *= 16777619u;
+    }
+    return h;
+}
+
+// Hash FNV-1a de até 'max' bytes (para antes do '\0')
+static unsigned int hashTexto(const char* texto, size_t max) {
+    return hashBytes(FNV_INICIAL, texto, strnlen(texto, max));
+}
+
+
+// --- 2.2 FORMATO DOS .dat: CABEÇALHO E SOMAS DE VERIFICAÇÃO ---
+// Todo .dat começa com um cabeçalho de 64 bytes: mágica, versão do formato, tabela,
+// tamanho do registro de quem gravou (o long tem 4 bytes no Windows e 8 no Linux, o que
+// muda sizeof(Aluno) e sizeof(Matricula)) e quantos registros estão completos. Os
+// registros vêm logo depois, então achar um registro continua sendo uma conta.
+// Quem acrescenta grava os registros, depois as somas e só no fim a nova contagem: o que
+// estiver além da contagem é resto de uma escrita interrompida, fica invisível e é
+// sobrescrito pela próxima. Um .dat sem cabeçalho (versão anterior) ou gravado com outro
+// tamanho de registro não é lido nem alterado até passar por migrarTabela.
+// O .sum de cada tabela guarda uma soma FNV por bloco de REGISTROS_POR_BLOCO registros,
+// refeita a cada escrita no bloco; verificarTabela confere todas.
+#define MAGICA_DADOS "SGA1"
+#define VERSAO_FORMATO 1
+#define REGISTROS_POR_BLOCO 256
+
+typedef struct {
+    char magica[4];          // "SGA1"
+    uint32_t versao;         // VERSAO_FORMATO
+    uint32_t tabela;
+    uint32_t tam_registro;   // sizeof da struct no programa que gravou
+    int64_t registros;       // registros completos, contando os apagados
+    uint32_t soma;           // FNV do cabeçalho com este campo zerado
+    uint32_t geracao;        // muda a cada gravação: quem guarda o .dat em memória (motor em
+                             // Python) percebe até as escritas no meio do arquivo
+    char reservado[32];
+} CabecalhoDados;
+
+#define TAMANHO_CABECALHO ((long)sizeof(CabecalhoDados))
+_Static_assert(sizeof(CabecalhoDados) == 64, "o cabeçalho dos .dat tem 64 bytes");
+
+// Situação do .dat de uma tabela (formatoTabela)
+#define FORMATO_ATUAL 0            // formato desta versão (ou arquivo ainda vazio)
+#define FORMATO_ANTIGO 1           // sem cabeçalho, ou registro com long de outro tamanho: migrarTabela converte
+#define FORMATO_DESCONHECIDO (-1)  // versão mais nova que esta biblioteca ou cabeçalho estragado
+
+typedef struct {
+    char magica[4];                // "SUM1"
+    uint32_t registros_por_bloco;
+    int64_t registros;             // quantos registros do .dat as somas cobrem
+} CabecalhoSomas;
+
+#define MAGICA_SOMAS "SUM1"
+
+// Onde começa o registro número 'pos' (começando em 0) no .dat
+static long inicioRegistro(long pos, size_t tam) {
+    return TAMANHO_CABECALHO + pos * (long)tam;
+}
+
+// Tamanho do registro da tabela num programa em que o long tem 'tam_long' bytes. Em Aluno
+// e Matricula o long é o primeiro campo e o resto da struct tem o mesmo tamanho nos dois
+static size_t tamanhoComLong(const Tabela* t, size_t tam_long) {
+    return t->chave_long ? t->tam_registro - sizeof(long) + tam_long : t->tam_registro;
+}
+
+static uint32_t somaCabecalho(const CabecalhoDados* cab) {
+    CabecalhoDados copia = *cab;
+    copia.soma = 0;
+    return hashBytes(FNV_INICIAL, &copia, sizeof(copia));
+}
+
+static void novoCabecalho(int tabela, CabecalhoDados* cab) {
+    memset(cab, 0, sizeof(CabecalhoDados));
+    memcpy(cab->magica, MAGICA_DADOS, 4);
+    cab->versao = VERSAO_FORMATO;
+    cab->tabela = (uint32_t)tabela;
+    cab->tam_registro = (uint32_t)TABELAS[tabela].tam_registro;
+}
+
+// Lê o cabeçalho e diz em que formato o arquivo está. 'cab' recebe o cabeçalho lido (ou um
+// novo, sem registros, se o arquivo está vazio ou não tem cabeçalho)
+static int lerCabecalhoDados(FILE *f, int tabela, CabecalhoDados* cab) {
+    novoCabecalho(tabela, cab);
+    if (fseek(f, 0, SEEK_END) != 0) return FORMATO_DESCONHECIDO;
+    if (ftell(f) == 0) return FORMATO_ATUAL;  // recém-criado: o cabeçalho entra com o primeiro registro
+    CabecalhoDados lido;
+    if (fseek(f, 0, SEEK_SET) != 0 || fread(&lido, sizeof(lido), 1, f) != 1
+        || memcmp(lido.magica, MAGICA_DADOS, 4) != 0) return FORMATO_ANTIGO;
+    *cab = lido;
+    if (lido.soma != somaCabecalho(&lido) || lido.versao != VERSAO_FORMATO
+        || lido.tabela != (uint32_t)tabela || lido.registros < 0) return FORMATO_DESCONHECIDO;
+    const Tabela* t = &TABELAS[tabela];
+    if (lido.tam_registro == t->tam_registro) return FORMATO_ATUAL;
+    return lido.tam_registro == tamanhoComLong(t, 4) || lido.tam_registro == tamanhoComLong(t, 8)
+           ? FORMATO_ANTIGO : FORMATO_DESCONHECIDO;
+}
+
+static int gravarCabecalhoDados(FILE *f, CabecalhoDados* cab) {
+    cab->geracao++;
+    cab->soma = somaCabecalho(cab);
+    return fseek(f, 0, SEEK_SET) == 0 && fwrite(cab, sizeof(CabecalhoDados), 1, f) == 1;
+}
+
+// Formato do .dat da tabela como está no disco (FORMATO_ATUAL se ainda não existe)
+static int formatoArquivo(int tabela) {
+    FILE *f = abrirArquivo(TABELAS[tabela].arquivo, "rb");
+    if (f == NULL) return FORMATO_ATUAL;
+    CabecalhoDados cab;
+    int formato = lerCabecalhoDados(f, tabela, &cab);
+    fecharArquivo(f);
+    return formato;
+}
+
+// Abre o .dat da tabela ("rb" ou "r+b") posicionado no primeiro registro e lê o cabeçalho.
+// Com 'criar', um arquivo que não existe é criado (vazio). Retorna NULL se o arquivo não
+// existe ou não está no formato atual: nada é lido nem gravado num arquivo antigo
+static FILE* abrirDados(int tabela, const char* modo, int criar, CabecalhoDados* cab) {
+    const char* arquivo = TABELAS[tabela].arquivo;
+    FILE *f = abrirArquivo(arquivo, modo);
+    if (f == NULL && criar) {
+        FILE *novo = abrirArquivo(arquivo, "ab");
+        if (novo != NULL) fecharArquivo(novo);
+        f = abrirArquivo(arquivo, modo);
+    }
+    if (f == NULL) return NULL;
+    if (lerCabecalhoDados(f, tabela, cab) != FORMATO_ATUAL) {
+        fecharArquivo(f);
+        return NULL;
+    }
+    fseek(f, TAMANHO_CABECALHO, SEEK_SET);
+    return f;
+}
+
+// Registros gravados na tabela, contando os apagados (0 se o arquivo não existe ou não
+// está no formato atual). Só lê o cabeçalho
+static long contarRegistrosTabela(int tabela) {
+    CabecalhoDados cab;
+    FILE *f = abrirDados(tabela, "rb", 0, &cab);
+    if (f == NULL) return 0;
+    fecharArquivo(f);
+    return (long)cab.registros;
+}
+
+// Lê o registro número 'pos' de um .dat. Retorna 1 se conseguiu ler
+static int lerRegistro(FILE *f, long pos, void* out, size_t tam) {
+    if (fseek(f, inicioRegistro(pos, tam), SEEK_SET) != 0) return 0;
+    return lerRegistros(out, tam, 1, f) == 1;
+}
+
+static int lerCabecalhoSomas(FILE *f, CabecalhoSomas* cab) {
+    if (fseek(f, 0, SEEK_SET) != 0 || fread(cab, sizeof(CabecalhoSomas), 1, f) != 1) return 0;
+    return memcmp(cab->magica, MAGICA_SOMAS, 4) == 0 && cab->registros_por_bloco == REGISTROS_POR_BLOCO;
+}
+
+static long totalBlocos(long registros) {
+    return (registros + REGISTROS_POR_BLOCO - 1) / REGISTROS_POR_BLOCO;
+}
+
+// Soma dos registros do bloco (só os que estão antes de 'registros'). Retorna 0 se não
+// conseguiu ler o bloco inteiro (.dat truncado)
+static int somarBloco(FILE *dados, const Tabela* t, long bloco, long registros, char* buffer, uint32_t* soma) {
+    long de = bloco * REGISTROS_POR_BLOCO;
+    long qtd = registros - de < REGISTROS_POR_BLOCO ? registros - de : REGISTROS_POR_BLOCO;
+    if (fseek(dados, inicioRegistro(de, t->tam_registro), SEEK_SET) != 0
+        || lerRegistros(buffer, t->tam_registro, qtd, dados) != (size_t)qtd) return 0;
+    *soma = hashBytes(FNV_INICIAL, buffer, t->tam_registro * (size_t)qtd);
+    return 1;
+}
+
+// Refaz o .sum inteiro a partir do .dat ('registros' = contagem do cabeçalho). Um bloco
+// que não dá para ler fica com soma 0, para verificarTabela acusar
+static int reconstruirSomas(int tabela, FILE *dados, long registros) {
+    const Tabela* t = &TABELAS[tabela];
+    char* buffer = malloc(t->tam_registro * REGISTROS_POR_BLOCO);
+    if (buffer == NULL) return 0;
+    char temp[260];
+    nomeTemporario(temp, sizeof(temp), t->arquivo_somas);
+    FILE *out = abrirArquivo(temp, "wb");
+    if (out == NULL) { free(buffer); return 0; }
+
+    CabecalhoSomas cab;
+    memcpy(cab.magica, MAGICA_SOMAS, 4);
+    cab.registros_por_bloco = REGISTROS_POR_BLOCO;
+    cab.registros = registros;
+    int ok = fwrite(&cab, sizeof(cab), 1, out) == 1;
+    for (long b = 0; ok && b < totalBlocos(registros); b++) {
+        uint32_t soma = 0;
+        somarBloco(dados, t, b, registros, buffer, &soma);
+        ok = fwrite(&soma, sizeof(soma), 1, out) == 1;
+    }
+    if (fecharArquivo(out) != 0) ok = 0;
+    free(buffer);
+    if (!ok || !substituirArquivo(temp, t->arquivo_somas)) {
+        remove(temp);
+        return 0;
+    }
+    return 1;
+}
+
+// Depois de uma escrita no .dat: refaz as somas dos blocos com as posições alteradas
+// ('posicoes' em ordem crescente; NULL = de 'antes' até 'depois', um acréscimo no fim),
+// relendo esses blocos de 'dados'. 'antes' e 'depois' são a contagem do cabeçalho antes e
+// depois da escrita; um .sum que não estava em dia com 'antes' é refeito inteiro
+static void atualizarSomas(int tabela, FILE *dados, long antes, long depois, const long* posicoes, long n) {
+    const Tabela* t = &TABELAS[tabela];
+    FILE *f = abrirArquivo(t->arquivo_somas, "r+b");
+    if (f == NULL && antes == 0) {
+        FILE *novo = abrirArquivo(t->arquivo_somas, "ab");
+        if (novo != NULL) fecharArquivo(novo);
+        f = abrirArquivo(t->arquivo_somas, "r+b");
+    }
+    CabecalhoSomas cab;
+    int em_dia = 0;
+    if (f != NULL) {
+        if (lerCabecalhoSomas(f, &cab)) {
+            em_dia = cab.registros == antes;
+        } else if (antes == 0) {  // .sum novo
+            memcpy(cab.magica, MAGICA_SOMAS, 4);
+            cab.registros_por_bloco = REGISTROS_POR_BLOCO;
+            em_dia = 1;
+        }
+    }
+    char* buffer = em_dia ? malloc(t->tam_registro * REGISTROS_POR_BLOCO) : NULL;
+    if (buffer == NULL) {
+        if (f != NULL) fecharArquivo(f);
+        reconstruirSomas(tabela, dados, depois);
+        return;
+    }
+
+    long ultimo = -1;
+    long alteradas = posicoes != NULL ? n : depois - antes;
+    for (long i = 0; i < alteradas; i++) {
+        long bloco = (posicoes != NULL ? posicoes[i] : antes + i) / REGISTROS_POR_BLOCO;
+        if (bloco == ultimo) continue;
+        ultimo = bloco;
+        uint32_t soma = 0;
+        somarBloco(dados, t, bloco, depois, buffer, &soma);
+        fseek(f, (long)sizeof(CabecalhoSomas) + bloco * (long)sizeof(uint32_t), SEEK_SET);
+        fwrite(&soma, sizeof(soma), 1, f);
+    }
+    cab.registros = depois;
+    fseek(f, 0, SEEK_SET);
+    fwrite(&cab, sizeof(cab), 1, f);
+    fecharArquivo(f);
+    free(buffer);
+}
+
+// Refaz o .sum da tabela depois que o .dat foi trocado inteiro (compactação, migração)
+static void refazerSomasTabela(int tabela) {
+    CabecalhoDados cab;
+    FILE *dados = abrirDados(tabela, "rb", 0, &cab);
+    if (dados == NULL) return;
+    reconstruirSomas(tabela, dados, (long)cab.registros);
+    fecharArquivo(dados);
+}
+
+// Acrescenta 'n' registros depois do último completo (por cima do resto de uma escrita
+// interrompida), numa escrita só, e depois atualiza as somas e a contagem do cabeçalho.
+// Retorna a posição do primeiro (-1 se falhar)
+static long anexarRegistros(int tabela, const void* registros, long n) {
+    const Tabela* t = &TABELAS[tabela];
+    CabecalhoDados cab;
+    FILE *f = abrirDados(tabela, "r+b", 1, &cab);
+    if (f == NULL) return -1;
+    long pos = (long)cab.registros;
+    int ok = fseek(f, inicioRegistro(pos, t->tam_registro), SEEK_SET) == 0
+             && fwrite(registros, t->tam_registro, n, f) == (size_t)n;
+    if (ok) {
+        atualizarSomas(tabela, f, pos, pos + n, NULL, 0);
+        cab.registros = pos + n;
+        ok = gravarCabecalhoDados(f, &cab);
+    }
+    if (fecharArquivo(f) != 0) ok = 0;
+    return ok ? pos : -1;
+}
+
+
+// --- 2.3 ÍNDICES EM DISCO ---
+// Todo índice começa com um cabeçalho que diz quantos registros do .dat ele cobre.
+// Se o .dat tiver outro número de registros (ou o índice não existir), o índice
+// é considerado velho e é reconstruído na próxima busca.
+
+typedef struct {
+    char magica[4];   // "IDX1"
+    long registros;   // quantos registros do .dat o índice cobre
+    long entradas;    // quantas entradas estão gravadas (ou ocupadas, no hash)
+    long capacidade;  // só no índice hash: número de posições da tabela
+} CabecalhoIndice;
+
+#define MAGICA_INDICE "IDX1"
+#define BLOCO_INDICE 256
+
+// Índice ordenado: entradas (chave, pos) ordenadas por chave -> busca binária O(log n)
+typedef struct {
+    long long chave;
+    long pos;
+} EntradaOrdenada;
+
+typedef struct {
+    int tabela;       // para reconhecer os registros apagados
+    const char* arquivo_dados;
+    const char* arquivo_indice;
+    size_t tam_registro;
+    long long (*chave)(const void* registro);
+} IndiceOrdenado;
+
+// Índice hash: tabela com endereçamento aberto (sondagem linear) -> busca O(1)
+typedef struct {
+    unsigned int hash;
+    long pos;         // -1 = posição vazia
+} EntradaHash;
+
+typedef struct {
+    int tabela;
+    const char* arquivo_dados;
+    const char* arquivo_indice;
+    size_t tam_registro;
+    unsigned int (*hash)(const void* registro);
+    int (*mesma_chave)(const void* a, const void* b);
+} IndiceHash;
+
+static int lerCabecalhoIndice(FILE *f, CabecalhoIndice* cab) {
+    if (fseek(f, 0, SEEK_SET) != 0) return 0;
+    if (fread(cab, sizeof(CabecalhoIndice), 1, f) != 1) return 0;
+    return memcmp(cab->magica, MAGICA_INDICE, 4) == 0;
+}
+
+static void gravarCabecalhoIndice(FILE *f, const CabecalhoIndice* cab) {
+    fseek(f, 0, SEEK_SET);
+    fwrite(cab, sizeof(CabecalhoIndice), 1, f);
+}
+
+// Apaga o índice para ser reconstruído na próxima consulta. Se não der para apagar
+// (no Windows, outro processo com ele aberto), marca o cabeçalho como velho
+static void descartarIndice(const char* arquivo_indice) {
+    if (removerArquivo(arquivo_indice) == 0) return;
+    FILE *f = abrirArquivo(arquivo_indice, "r+b");
+    if (f == NULL) return;
+    CabecalhoIndice cab;
+    if (lerCabecalhoIndice(f, &cab)) {
+        cab.registros = -1;
+        gravarCabecalhoIndice(f, &cab);
+    }
+    fecharArquivo(f);
+}
+
+static int compararEntradasOrdenadas(const void* a, const void* b) {
+    const EntradaOrdenada* ea = (const EntradaOrdenada*)a;
+    const EntradaOrdenada* eb = (const EntradaOrdenada*)b;
+    if (ea->chave != eb->chave) return ea->chave < eb->chave ? -1 : 1;
+    if (ea->pos != eb->pos) return ea->pos < eb->pos ? -1 : 1;
+    return 0;
+}
+
+static int reconstruirIndiceOrdenado(const IndiceOrdenado* idx) {
+    CabecalhoDados cab_dados;
+    FILE *f = abrirDados(idx->tabela, "rb", 0, &cab_dados);
+    long n = f != NULL ? (long)cab_dados.registros : 0;
+    EntradaOrdenada* entradas = malloc(sizeof(EntradaOrdenada) * (n > 0 ? n : 1));
+    void* registro = malloc(idx->tam_registro);
+    if (entradas == NULL || registro == NULL) {
+        free(entradas); free(registro);
+        if (f != NULL) fecharArquivo(f);
+        return 0;
+    }
+
+    long lidos = 0, validas = 0;
+    if (f != NULL) {
+        while (lidos < n && lerRegistros(registro, idx->tam_registro, 1, f)) {
+            if (!registroApagado(idx->tabela, registro)) {
+                entradas[validas].chave = idx->chave(registro);
+                entradas[validas].pos = lidos;
+                validas++;
+            }
+            lidos++;
+        }
+        fecharArquivo(f);
+    }
+    qsort(entradas, validas, sizeof(EntradaOrdenada), compararEntradasOrdenadas);
+
+    char temp[260];
+    nomeTemporario(temp, sizeof(temp), idx->arquivo_indice);
+    FILE *out = abrirArquivo(temp, "wb");
+    if (out == NULL) { free(entradas); free(registro); return 0; }
+    CabecalhoIndice cab;
+    memcpy(cab.magica, MAGICA_INDICE, 4);
+    cab.registros = lidos;
+    cab.entradas = validas;
+    cab.capacidade = 0;
+    fwrite(&cab, sizeof(cab), 1, out);
+    fwrite(entradas, sizeof(EntradaOrdenada), validas, out);
+    fecharArquivo(out);
+    substituirArquivo(temp, idx->arquivo_indice);
+
+    free(entradas);
+    free(registro);
+    return 1;
+}
+
+// Abre o índice para leitura, reconstruindo antes se estiver faltando ou velho
+static FILE* abrirIndiceOrdenado(const IndiceOrdenado* idx, CabecalhoIndice* cab) {
+    long n = contarRegistrosTabela(idx->tabela);
+    FILE *f = abrirArquivo(idx->arquivo_indice, "rb");
+    if (f != NULL && lerCabecalhoIndice(f, cab) && cab->registros == n) return f;
+    if (f != NULL) fecharArquivo(f);
+
+    if (!reconstruirIndiceOrdenado(idx)) return NULL;
+    f = abrirArquivo(idx->arquivo_indice, "rb");
+    if (f == NULL) return NULL;
+    if (!lerCabecalhoIndice(f, cab)) { fecharArquivo(f); return NULL; }
+    return f;
+}
+
+static int lerEntradaOrdenada(FILE *f, long i, EntradaOrdenada* e) {
+    if (fseek(f, (long)sizeof(CabecalhoIndice) + i * (long)sizeof(EntradaOrdenada), SEEK_SET) != 0) return 0;
+    return fread(e, sizeof(EntradaOrdenada), 1, f) == 1;
+}
+
+// Primeira entrada com (chave, pos) >= ('chave', 'pos'). Com pos = -1 é a primeira entrada
+// com aquela chave; com pos = LONG_MAX é a primeira entrada depois dela
+static long limiteIndiceOrdenado(FILE *f, long n, long long chave, long pos) {
+    long ini = 0, fim = n;
+    EntradaOrdenada e;
+    while (ini < fim) {
+        long meio = ini + (fim - ini) / 2;
+        if (!lerEntradaOrdenada(f, meio, &e)) break;
+        if (e.chave < chave || (e.chave == chave && e.pos < pos)) ini = meio + 1;
+        else fim = meio;
+    }
+    return ini;
+}
+
+// Desloca as entradas [ini, fim) uma posição para frente (delta = 1) ou para trás (delta = -1)
+static void deslocarEntradasOrdenadas(FILE *f, long ini, long fim, int delta) {
+    EntradaOrdenada bloco[BLOCO_INDICE];
+    while (ini < fim) {
+        // Para frente copia de trás para frente (e vice-versa) para não sobrescrever o que falta mover
+        long de = delta > 0 ? (fim - BLOCO_INDICE > ini ? fim - BLOCO_INDICE : ini) : ini;
+        long qtd = delta > 0 ? fim - de : (fim - ini < BLOCO_INDICE ? fim - ini : BLOCO_INDICE);
+        fseek(f, (long)sizeof(CabecalhoIndice) + de * (long)sizeof(EntradaOrdenada), SEEK_SET);
+        fread(bloco, sizeof(EntradaOrdenada), qtd, f);
+        fseek(f, (long)sizeof(CabecalhoIndice) + (de + delta) * (long)sizeof(EntradaOrdenada), SEEK_SET);
+        fwrite(bloco, sizeof(EntradaOrdenada), qtd, f);
+        if (delta > 0) fim = de; else ini = de + qtd;
+    }
+}
+
+static void gravarEntradaOrdenada(FILE *f, long i, const EntradaOrdenada* e) {
+    fseek(f, (long)sizeof(CabecalhoIndice) + i * (long)sizeof(EntradaOrdenada), SEEK_SET);
+    fwrite(e, sizeof(EntradaOrdenada), 1, f);
+}
+
+// Mantém o índice em dia depois que 'registro' foi gravado na posição 'pos' do .dat.
+// Se o índice já estava velho, não mexe (ele será reconstruído na próxima busca).
+static void inserirIndiceOrdenado(const IndiceOrdenado* idx, const void* registro, long pos) {
+    FILE *f = abrirArquivo(idx->arquivo_indice, "r+b");
+    if (f == NULL) return;
+    CabecalhoIndice cab;
+    if (!lerCabecalhoIndice(f, &cab) || cab.registros != pos) { fecharArquivo(f); return; }
+
+    EntradaOrdenada nova = { idx->chave(registro), pos };
+    long i = limiteIndiceOrdenado(f, cab.entradas, nova.chave, pos);
+    deslocarEntradasOrdenadas(f, i, cab.entradas, 1);
+    gravarEntradaOrdenada(f, i, &nova);
+
+    cab.registros = pos + 1;
+    cab.entradas++;
+    gravarCabecalhoIndice(f, &cab);
+    fecharArquivo(f);
+}
+
+// O registro da posição 'pos' foi sobrescrito e a chave dele mudou: tira a entrada antiga
+// e põe a nova no lugar certo, deslocando só as entradas que ficam entre as duas
+static void moverIndiceOrdenado(const IndiceOrdenado* idx, long long chave_antiga, long long chave_nova, long pos) {
+    if (chave_antiga == chave_nova) return;
+    FILE *f = abrirArquivo(idx->arquivo_indice, "r+b");
+    if (f == NULL) return;
+    CabecalhoIndice cab;
+    if (!lerCabecalhoIndice(f, &cab) || cab.registros != contarRegistrosTabela(idx->tabela)) {
+        fecharArquivo(f);
+        return;
+    }
+    long i = limiteIndiceOrdenado(f, cab.entradas, chave_antiga, pos);
+    EntradaOrdenada e;
+    if (i >= cab.entradas || !lerEntradaOrdenada(f, i, &e) || e.chave != chave_antiga || e.pos != pos) {
+        // Índice não bate com o arquivo: descarta para ser reconstruído
+        fecharArquivo(f);
+        descartarIndice(idx->arquivo_indice);
+        return;
+    }
+    EntradaOrdenada nova = { chave_nova, pos };
+    long j = limiteIndiceOrdenado(f, cab.entradas, chave_nova, pos);
+    if (j > i) {
+        deslocarEntradasOrdenadas(f, i + 1, j, -1);
+        gravarEntradaOrdenada(f, j - 1, &nova);
+    } else {
+        deslocarEntradasOrdenadas(f, j, i, 1);
+        gravarEntradaOrdenada(f, j, &nova);
+    }
+    fecharArquivo(f);
+}
+
+// Procura 'chave' no índice e lê o primeiro registro com essa chave. Retorna a posição ou -1
+static long buscarIndiceOrdenado(const IndiceOrdenado* idx, long long chave, void* out) {
+    CabecalhoIndice cab;
+    FILE *f = abrirIndiceOrdenado(idx, &cab);
+    if (f == NULL) return -1;
+    long i = limiteIndiceOrdenado(f, cab.entradas, chave, -1);
+    EntradaOrdenada e;
+    int achou = i < cab.entradas && lerEntradaOrdenada(f, i, &e) && e.chave == chave;
+    fecharArquivo(f);
+    if (!achou) return -1;
+
+    FILE *dados = abrirArquivo(idx->arquivo_dados, "rb");
+    if (dados == NULL) return -1;
+    int ok = lerRegistro(dados, e.pos, out, idx->tam_registro);
+    fecharArquivo(dados);
+    return ok ? e.pos : -1;
+}
+
+// Lê os registros cujas chaves estão entre 'de' e 'ate' (inclusive), na ordem do índice.
+// 'aceita' (opcional) descarta registros que só colidiram na chave (ex.: hash do status).
+// Grava até 'max' registros em 'buffer' e retorna quantos existem no total; o custo é
+// proporcional ao tamanho do resultado, não ao tamanho do arquivo
+static int consultarIndiceOrdenado(const IndiceOrdenado* idx, long long de, long long ate,
+                                   int (*aceita)(const void* registro, const void* modelo), const void* modelo,
+                                   void* buffer, int max) {
+    CabecalhoIndice cab;
+    FILE *f = abrirIndiceOrdenado(idx, &cab);
+    if (f == NULL) return 0;
+    FILE *dados = abrirArquivo(idx->arquivo_dados, "rb");
+    char* registro = malloc(idx->tam_registro);
+    if (dados == NULL || registro == NULL) {
+        if (dados != NULL) fecharArquivo(dados);
+        free(registro);
+        fecharArquivo(f);
+        return 0;
+    }
+
+    int total = 0;
+    long i = limiteIndiceOrdenado(f, cab.entradas, de, -1);
+    EntradaOrdenada e;
+    for (; i < cab.entradas; i++) {
+        if (!lerEntradaOrdenada(f, i, &e) || e.chave > ate) break;
+        if (aceita == NULL && total >= max) { total++; continue; }  // só contando
+        char* destino = total < max ? (char*)buffer + (size_t)total * idx->tam_registro : registro;
+        if (!lerRegistro(dados, e.pos, destino, idx->tam_registro)) continue;
+        if (aceita != NULL && !aceita(destino, modelo)) continue;
+        total++;
+    }
+    free(registro);
+    fecharArquivo(dados);
+    fecharArquivo(f);
+    return total;
+}
+
+static long capacidadeHash(long n) {
+    long cap = 64;
+    while (cap < n * 2) cap *= 2;
+    return cap;
+}
+
+static int reconstruirIndiceHash(const IndiceHash* idx) {
+    CabecalhoDados cab_dados;
+    FILE *f = abrirDados(idx->tabela, "rb", 0, &cab_dados);
+    long n = f != NULL ? (long)cab_dados.registros : 0;
+    long cap = capacidadeHash(n + 1);
+    EntradaHash* tabela = malloc(sizeof(EntradaHash) * cap);
+    void* registro = malloc(idx->tam_registro);
+    void* existente = malloc(idx->tam_registro);
+    if (tabela == NULL || registro == NULL || existente == NULL) {
+        free(tabela); free(registro); free(existente);
+        if (f != NULL) fecharArquivo(f);
+        return 0;
+    }
+    for (long i = 0; i < cap; i++) { tabela[i].hash = 0; tabela[i].pos = -1; }
+
+    long lidos = 0, ocupadas = 0;
+    FILE *conferir = abrirArquivo(idx->arquivo_dados, "rb");
+    if (f != NULL && conferir != NULL) {
+        while (lidos < n && lerRegistros(registro, idx->tam_registro, 1, f)) {
+            if (registroApagado(idx->tabela, registro)) { lidos++; continue; }
+            unsigned int h = idx->hash(registro);
+            long s = (long)(h & (unsigned int)(cap - 1));
+            int repetido = 0;
+            while (tabela[s].pos != -1) {
+                // Chave repetida: fica valendo o primeiro registro do arquivo
+                if (tabela[s].hash == h && lerRegistro(conferir, tabela[s].pos, existente, idx->tam_registro)
+                    && idx->mesma_chave(registro, existente)) { repetido = 1; break; }
+                s = (s + 1) & (cap - 1);
+            }
+            if (!repetido) {
+                tabela[s].hash = h;
+                tabela[s].pos = lidos;
+                ocupadas++;
+            }
+            lidos++;
+        }
+    }
+    if (f != NULL) fecharArquivo(f);
+    if (conferir != NULL) fecharArquivo(conferir);
+
+    char temp[260];
+    nomeTemporario(temp, sizeof(temp), idx->arquivo_indice);
+    FILE *out = abrirArquivo(temp, "wb");
+    if (out == NULL) { free(tabela); free(registro); free(existente); return 0; }
+    CabecalhoIndice cab;
+    memcpy(cab.magica, MAGICA_INDICE, 4);
+    cab.registros = lidos;
+    cab.entradas = ocupadas;
+    cab.capacidade = cap;
+    fwrite(&cab, sizeof(cab), 1, out);
+    fwrite(tabela, sizeof(EntradaHash), cap, out);
+    fecharArquivo(out);
+    substituirArquivo(temp, idx->arquivo_indice);
+
+    free(tabela);
+    free(registro);
+    free(existente);
+    return 1;
+}
+
+static FILE* abrirIndiceHash(const IndiceHash* idx, CabecalhoIndice* cab, const char* modo) {
+    long n = contarRegistrosTabela(idx->tabela);
+    FILE *f = abrirArquivo(idx->arquivo_indice, modo);
+    if (f != NULL && lerCabecalhoIndice(f, cab) && cab->registros == n) return f;
+    if (f != NULL) fecharArquivo(f);
+
+    if (!reconstruirIndiceHash(idx)) return NULL;
+    f = abrirArquivo(idx->arquivo_indice, modo);
+    if (f == NULL) return NULL;
+    if (!lerCabecalhoIndice(f, cab)) { fecharArquivo(f); return NULL; }
+    return f;
+}
+
+static int lerEntradaHash(FILE *f, long s, EntradaHash* e) {
+    if (fseek(f, (long)sizeof(CabecalhoIndice) + s * (long)sizeof(EntradaHash), SEEK_SET) != 0) return 0;
+    return fread(e, sizeof(EntradaHash), 1, f) == 1;
+}
+
+static long procurarIndiceHash(const IndiceHash* idx, FILE *f, FILE *dados, const CabecalhoIndice* cab,
+                               const void* modelo, void* out) {
+    unsigned int h = idx->hash(modelo);
+    long s = (long)(h & (unsigned int)(cab->capacidade - 1));
+    EntradaHash e;
+    for (long tentativas = 0; tentativas < cab->capacidade; tentativas++) {
+        if (!lerEntradaHash(f, s, &e) || e.pos == -1) break;
+        if (e.hash == h && lerRegistro(dados, e.pos, out, idx->tam_registro) && idx->mesma_chave(modelo, out)) {
+            return e.pos;
+        }
+        s = (s + 1) & (cab->capacidade - 1);
+    }
+    return -1;
+}
+
+// Procura um registro com a mesma chave de 'modelo'. Retorna a posição (e preenche 'out') ou -1
+static long buscarIndiceHash(const IndiceHash* idx, const void* modelo, void* out) {
+    CabecalhoIndice cab;
+    FILE *f = abrirIndiceHash(idx, &cab, "rb");
+    if (f == NULL) return -1;
+    FILE *dados = abrirArquivo(idx->arquivo_dados, "rb");
+    if (dados == NULL) { fecharArquivo(f); return -1; }
+    long achou = procurarIndiceHash(idx, f, dados, &cab, modelo, out);
+    fecharArquivo(dados);
+    fecharArquivo(f);
+    return achou;
+}
+
+// Igual a buscarIndiceHash, mas para 'n' modelos de uma vez (abre os arquivos uma vez só).
+// posicoes[i] recebe a posição do modelo i ou -1 e, se 'encontrados' não for NULL, o
+// registro i dele recebe o registro achado. Retorna 0 se não conseguiu abrir o índice
+static int buscarVariosIndiceHash(const IndiceHash* idx, const void* modelos, long n, long* posicoes, void* encontrados) {
+    CabecalhoIndice cab;
+    FILE *f = abrirIndiceHash(idx, &cab, "rb");
+    if (f == NULL) return 0;
+    FILE *dados = abrirArquivo(idx->arquivo_dados, "rb");
+    void* lido = malloc(idx->tam_registro);
+    if (lido == NULL) {
+        if (dados != NULL) fecharArquivo(dados);
+        fecharArquivo(f);
+        return 0;
+    }
+    for (long i = 0; i < n; i++) {
+        // Sem .dat ainda: nenhum registro existe
+        posicoes[i] = dados == NULL ? -1
+                      : procurarIndiceHash(idx, f, dados, &cab, (const char*)modelos + i * idx->tam_registro, lido);
+        if (posicoes[i] >= 0 && encontrados != NULL) memcpy((char*)encontrados + i * idx->tam_registro, lido, idx->tam_registro);
+    }
+    free(lido);
+    if (dados != NULL) fecharArquivo(dados);
+    fecharArquivo(f);
+    return 1;
+}
+
+// Mantém o índice hash em dia depois que 'registro' foi gravado na posição 'pos' do .dat
+static void inserirIndiceHash(const IndiceHash* idx, const void* registro, long pos) {
+    FILE *f = abrirArquivo(idx->arquivo_indice, "r+b");
+    if (f == NULL) return;
+    CabecalhoIndice cab;
+    if (!lerCabecalhoIndice(f, &cab) || cab.registros != pos) { fecharArquivo(f); return; }
+
+    // Tabela ficando cheia: reconstrói com o dobro do tamanho
+    if ((cab.entradas + 1) * 2 > cab.capacidade) {
+        fecharArquivo(f);
+        reconstruirIndiceHash(idx);
+        return;
+    }
+
+    FILE *dados = abrirArquivo(idx->arquivo_dados, "rb");
+    if (dados == NULL) { fecharArquivo(f); return; }
+    void* existente = malloc(idx->tam_registro);
+    if (existente == NULL) { fecharArquivo(dados); fecharArquivo(f); return; }
+
+    unsigned int h = idx->hash(registro);
+    long s = (long)(h & (unsigned int)(cab.capacidade - 1));
+    int repetido = 0;
+    EntradaHash e;
+    while (lerEntradaHash(f, s, &e) && e.pos != -1) {
+        if (e.hash == h && lerRegistro(dados, e.pos, existente, idx->tam_registro)
+            && idx->mesma_chave(registro, existente)) { repetido = 1; break; }
+        s = (s + 1) & (cab.capacidade - 1);
+    }
+    if (!repetido) {
+        e.hash = h;
+        e.pos = pos;
+        fseek(f, (long)sizeof(CabecalhoIndice) + s * (long)sizeof(EntradaHash), SEEK_SET);
+        fwrite(&e, sizeof(EntradaHash), 1, f);
+        cab.entradas++;
+    }
+    cab.registros = pos + 1;
+    gravarCabecalhoIndice(f, &cab);
+
+    free(existente);
+    fecharArquivo(dados);
+    fecharArquivo(f);
+}
+
+
+// --- 2.4 JOURNAL DE ESCRITA (WRITE-AHEAD) ---
+// Antes de sobrescrever registros no meio de um .dat, as novas versões são gravadas
+// com checksum num arquivo .jnl e sincronizadas no disco. Só depois o .dat é alterado
+// e o journal apagado. Se o programa cair no meio, a próxima operação encontra o
+// journal completo e refaz as escritas; um journal incompleto é descartado (nesse caso
+// o .dat ainda não tinha sido tocado).
+
+typedef struct {
+    char magica[4];     // "JNL1"
+    long quantidade;    // quantos pares (pos, registro) vêm depois do cabeçalho
+    long tam_registro;
+} CabecalhoJournal;
+
+#define MAGICA_JOURNAL "JNL1"
+
+static int gravarJournal(const char* arquivo_journal, size_t tam, long n, const long* posicoes, const void* registros) {
+    FILE *f = abrirArquivo(arquivo_journal, "wb");
+    if (f == NULL) return 0;
+    CabecalhoJournal cab;
+    memcpy(cab.magica, MAGICA_JOURNAL, 4);
+    cab.quantidade = n;
+    cab.tam_registro = (long)tam;
+
+    unsigned int soma = hashBytes(FNV_INICIAL, &cab, sizeof(cab));
+    int ok = fwrite(&cab, sizeof(cab), 1, f) == 1;
+    for (long i = 0; ok && i < n; i++) {
+        const char* registro = (const char*)registros + i * tam;
+        soma = hashBytes(soma, &posicoes[i], sizeof(long));
+        soma = hashBytes(soma, registro, tam);
+        ok = fwrite(&posicoes[i], sizeof(long), 1, f) == 1 && fwrite(registro, tam, 1, f) == 1;
+    }
+    ok = ok && fwrite(&soma, sizeof(soma), 1, f) == 1;
+    sincronizarArquivo(f);
+    fecharArquivo(f);
+    if (!ok) removerArquivo(arquivo_journal);
+    return ok;
+}
+
+// Refaz no .dat da tabela as escritas de um journal completo (posições além do fim
+// aumentam a contagem do cabeçalho). Quem chamou apaga o journal depois de terminar o
+// resto do trabalho (ex.: índices). Retorna 1 se aplicou, 0 se não havia journal (ou ele
+// estava incompleto, e nesse caso já foi apagado) ou se o .dat ainda está no formato
+// antigo (o journal fica para depois da migração)
+static int aplicarJournal(const char* arquivo_journal, int tabela) {
+    FILE *f = abrirArquivo(arquivo_journal, "rb");
+    if (f == NULL) return 0;
+
+    CabecalhoJournal cab;
+    long* posicoes = NULL;
+    char* registros = NULL;
+    int valido = fread(&cab, sizeof(cab), 1, f) == 1 && memcmp(cab.magica, MAGICA_JOURNAL, 4) == 0
+                 && cab.quantidade >= 0 && cab.tam_registro == (long)TABELAS[tabela].tam_registro;
+    if (valido) {
+        posicoes = malloc(sizeof(long) * (cab.quantidade > 0 ? cab.quantidade : 1));
+        registros = malloc((size_t)cab.tam_registro * (cab.quantidade > 0 ? cab.quantidade : 1));
+        valido = posicoes != NULL && registros != NULL;
+    }
+    if (valido) {
+        unsigned int soma = hashBytes(FNV_INICIAL, &cab, sizeof(cab)), soma_gravada;
+        for (long i = 0; valido && i < cab.quantidade; i++) {
+            char* registro = registros + i * cab.tam_registro;
+            valido = fread(&posicoes[i], sizeof(long), 1, f) == 1 && fread(registro, cab.tam_registro, 1, f) == 1;
+            soma = hashBytes(soma, &posicoes[i], sizeof(long));
+            soma = hashBytes(soma, registro, cab.tam_registro);
+        }
+        valido = valido && fread(&soma_gravada, sizeof(soma_gravada), 1, f) == 1 && soma == soma_gravada;
+    }
+    fecharArquivo(f);
+
+    int aplicado = 0;
+    if (valido) {
+        // Cria o arquivo se ainda não existe (lote só com registros novos)
+        CabecalhoDados cab_dados;
+        FILE *dados = abrirDados(tabela, "r+b", 1, &cab_dados);
+        if (dados != NULL) {
+            long antes = (long)cab_dados.registros, depois = antes;
+            for (long i = 0; i < cab.quantidade; i++) {
+                fseek(dados, inicioRegistro(posicoes[i], cab.tam_registro), SEEK_SET);
+                fwrite(registros + i * cab.tam_registro, cab.tam_registro, 1, dados);
+                if (posicoes[i] >= depois) depois = posicoes[i] + 1;
+            }
+            atualizarSomas(tabela, dados, antes, depois, posicoes, cab.quantidade);
+            cab_dados.registros = depois;
+            gravarCabecalhoDados(dados, &cab_dados);
+            sincronizarArquivo(dados);
+            fecharArquivo(dados);
+            aplicado = 1;
+        }
+    }
+    // Journal incompleto (queda durante a gravação dele) não vale nada: o .dat está intacto
+    if (!valido) removerArquivo(arquivo_journal);
+    free(posicoes);
+    free(registros);
+    return aplicado;
+}
+
+
+// --- 2.5 TRAVAS ENTRE PROCESSOS ---
+// Cada tabela tem um byte no arquivo sga.lock. Quem só lê pega a trava compartilhada
+// (vários leitores ao mesmo tempo); quem grava pega a exclusiva. As travas valem só
+// durante uma chamada da biblioteca (e, no cursor, durante um lote), então uma leitura
+// longa não segura quem quer gravar, e gravações em tabelas diferentes não se esperam.
+// Linux: fcntl (liberada sozinha se o processo morrer). Windows: LockFileEx.
+// Dentro do mesmo processo as travas só são contadas (chamadas aninhadas)
+#ifdef _WIN32
+static HANDLE arquivo_travas = INVALID_HANDLE_VALUE;
+#else
+static int arquivo_travas = -1;
+#endif
+// Depois do byte de cada tabela vem o das sequências de RA/ID
+#define TRAVA_SEQUENCIAS TOTAL_TABELAS
+static int contagem_travas[TOTAL_TABELAS + 1];
+
+// Retorna 0 se não deu para abrir sga.lock (ex.: pasta só leitura): segue sem travas
+static int abrirArquivoTravas(void) {
+#ifdef _WIN32
+    if (arquivo_travas == INVALID_HANDLE_VALUE) {
+        arquivo_travas = CreateFileA(TRAVAS_DB, GENERIC_READ | GENERIC_WRITE, FILE_SHARE_READ | FILE_SHARE_WRITE,
+                                     NULL, OPEN_ALWAYS, FILE_ATTRIBUTE_NORMAL, NULL);
+    }
+    return arquivo_travas != INVALID_HANDLE_VALUE;
+#else
+    if (arquivo_travas < 0) arquivo_travas = open(TRAVAS_DB, O_RDWR | O_CREAT, 0644);
+    return arquivo_travas >= 0;
+#endif
+}
+
+static void travar(int tabela, int exclusiva) {
+    if (contagem_travas[tabela]++ > 0 || !abrirArquivoTravas()) return;
+#ifdef _WIN32
+    OVERLAPPED ov;
+    memset(&ov, 0, sizeof(ov));
+    ov.Offset = (DWORD)tabela;
+    LockFileEx(arquivo_travas, exclusiva ? LOCKFILE_EXCLUSIVE_LOCK : 0, 0, 1, 0, &ov);
+#else
+    struct flock trava;
+    memset(&trava, 0, sizeof(trava));
+    trava.l_type = exclusiva ? F_WRLCK : F_RDLCK;
+    trava.l_whence = SEEK_SET;
+    trava.l_start = tabela;
+    trava.l_len = 1;
+    while (fcntl(arquivo_travas, F_SETLKW, &trava) == -1 && errno == EINTR) {}
+#endif
+}
+
+static void destravar(int tabela) {
+    if (contagem_travas[tabela] == 0 || --contagem_travas[tabela] > 0 || !abrirArquivoTravas()) return;
+#ifdef _WIN32
+    OVERLAPPED ov;
+    memset(&ov, 0, sizeof(ov));
+    ov.Offset = (DWORD)tabela;
+    UnlockFileEx(arquivo_travas, 0, 1, 0, &ov);
+#else
+    struct flock trava;
+    memset(&trava, 0, sizeof(trava));
+    trava.l_type = F_UNLCK;
+    trava.l_whence = SEEK_SET;
+    trava.l_start = tabela;
+    trava.l_len = 1;
+    fcntl(arquivo_travas, F_SETLK, &trava);
+#endif
+}
+
+static void travarLeitura(int tabela) { travar(tabela, 0); }
+static void travarEscrita(int tabela) { travar(tabela, 1); }
+
+// --- 2.6 SEQUÊNCIAS DE RA E ID ---
+// sequencias.dat guarda, para cada tabela com chave gerada (RA dos alunos, ID de turmas e
+// matérias), o próximo valor livre como long long na posição do número da tabela. Uma
+// reserva avança o contador sob a trava das sequências: dois processos nunca recebem o
+// mesmo valor e a importação reserva um bloco inteiro numa chamada só.
+// Contador zerado (arquivo novo, ou dados de uma versão anterior) começa logo depois da
+// maior chave que já está no .dat. Ordem das travas: a da tabela antes da das sequências
+#define PRIMEIRO_RA 100000LL
+#define PRIMEIRO_ID 1LL
+
+static const char* arquivoComSequencia(int tabela) {
+    switch (tabela) {
+        case TABELA_ALUNOS: return ALUNOS_DB;
+        case TABELA_TURMAS: return TURMAS_DB;
+        case TABELA_MATERIAS: return MATERIAS_DB;
+        default: return NULL;
+    }
+}
+
+// Maior RA/ID gravado na tabela (0 se vazia, -1 se o .dat ainda está no formato antigo:
+// a sequência não pode começar antes da migração). A chave é o primeiro campo das três structs
+static long long maiorChave(int tabela) {
+    union { Aluno aluno; Turma turma; Materia materia; } registro;
+    size_t tam = tabela == TABELA_ALUNOS ? sizeof(Aluno) : tabela == TABELA_TURMAS ? sizeof(Turma) : sizeof(Materia);
+    long long maior = 0;
+    CabecalhoDados cab;
+    FILE *f = abrirDados(tabela, "rb", 0, &cab);
+    if (f == NULL) return formatoArquivo(tabela) == FORMATO_ATUAL ? 0 : -1;
+    for (long lidos = 0; lidos < cab.registros && lerRegistros(&registro, tam, 1, f) == 1; lidos++) {
+        long long chave = tabela == TABELA_ALUNOS ? registro.aluno.ra : registro.turma.id;
+        if (chave > maior) maior = chave;
+    }
+    fecharArquivo(f);
+    return maior;
+}
+
+static FILE* abrirSequencias(void) {
+    FILE *f = abrirArquivo(SEQUENCIAS_DB, "r+b");
+    if (f == NULL) {
+        FILE *novo = abrirArquivo(SEQUENCIAS_DB, "ab");  // cria o arquivo vazio
+        if (novo == NULL) return NULL;
+        fecharArquivo(novo);
+        f = abrirArquivo(SEQUENCIAS_DB, "r+b");
+    }
+    return f;
+}
+
+// 0 = contador ainda não iniciado
+static long long lerSequencia(FILE *f, int tabela) {
+    long long proximo = 0;
+    if (fseek(f, tabela * (long)sizeof(long long), SEEK_SET) != 0 || fread(&proximo, sizeof(proximo), 1, f) != 1) return 0;
+    return proximo;
+}
+
+static int gravarSequencia(FILE *f, int tabela, long long proximo) {
+    long long zero = 0;
+    fseek(f, 0, SEEK_END);  // completa com zeros as tabelas anteriores ainda sem contador
+    for (long fim = ftell(f); fim < tabela * (long)sizeof(long long); fim += sizeof(long long)) {
+        fwrite(&zero, sizeof(zero), 1, f);
+    }
+    if (fseek(f, tabela * (long)sizeof(long long), SEEK_SET) != 0) return 0;
+    return fwrite(&proximo, sizeof(proximo), 1, f) == 1;
+}
+
+// Um RA/ID escolhido por quem chamou (informado no CSV ou no cadastro) passa a contar
+// como usado: a sequência pula para depois dele. Chamado com a trava da tabela
+static void avancarSequencia(int tabela, long long chave) {
+    travarEscrita(TRAVA_SEQUENCIAS);
+    FILE *f = abrirSequencias();
+    if (f != NULL) {
+        long long proximo = lerSequencia(f, tabela);
+        if (proximo > 0 && chave >= proximo) gravarSequencia(f, tabela, chave + 1);
+        fecharArquivo(f);
+    }
+    destravar(TRAVA_SEQUENCIAS);
+}
+
+
+// --- 2.7 ESTATÍSTICAS DAS MATRÍCULAS ---
+// matriculas.est guarda já somados os números de cada (turma, matéria) e de cada situação:
+// quantas matrículas, quantas em cada situação, somas das notas, da média e das faltas e
+// quantas notas caem em cada faixa de um ponto (0 a 1, 1 a 2, ..., 9 a 10). O painel e o
+// relatório leem só esses totais, sem percorrer o matriculas.dat.
+// Cada gravação de matrícula tira dos totais a versão antiga do registro e soma a nova. O
+// cabeçalho diz a que geração e contagem do .dat os números correspondem: se o .dat mudou
+// por outro caminho (compactação, journal recuperado, migração, lote grande), o .est é
+// refeito numa passada pelo .dat na próxima leitura, como os índices.
+// Depois do cabeçalho vêm TOTAL_SITUACOES linhas (uma por situação) e uma tabela hash com
+// sondagem linear, uma linha por (turma, matéria)
+#define MAGICA_ESTATISTICAS "EST1"
+#define FAIXAS_NOTA 10
+// Acima disso um lote deixa o .est velho (refeito de uma vez) em vez de ajustar linha a linha
+#define LIMITE_AJUSTES_ESTATISTICAS 1024
+
+// Situação pelo status da matrícula (a mesma divisão do relatório)
+enum { SITUACAO_PENDENTE = 0, SITUACAO_EXAME, SITUACAO_APROVADO, SITUACAO_REPROVADO, TOTAL_SITUACOES };
+
+typedef struct {
+    int id_turma;
+    int id_materia;
+    int usado;                           // posição ocupada da tabela hash
+    int matriculas;
+    int por_situacao[TOTAL_SITUACOES];
+    double soma_np1;
+    double soma_np2;
+    double soma_pim;
+    double soma_media;
+    long long soma_faltas;
+    int faixas_np1[FAIXAS_NOTA];
+    int faixas_np2[FAIXAS_NOTA];
+    int faixas_pim[FAIXAS_NOTA];
+} Estatistica;
+
+typedef struct {
+    char magica[4];        // "EST1"
+    uint32_t geracao;      // geração do matriculas.dat que os números cobrem
+    int64_t registros;     // contagem do matriculas.dat (-1 = velho)
+    int32_t capacidade;    // posições da tabela hash (potência de 2)
+    int32_t grupos;        // posições ocupadas
+    char reservado[8];
+} CabecalhoEstatisticas;
+
+_Static_assert(sizeof(Estatistica) == 192, "mesmo layout da Estatistica de servico.py");
+
+static int situacaoMatricula(const Matricula* m) {
+    if (strncmp(m->status, "Aprovado", sizeof(m->status)) == 0) return SITUACAO_APROVADO;
+    if (strncmp(m->status, "Exame", sizeof(m->status)) == 0) return SITUACAO_EXAME;
+    if (strncmp(m->status, "Reprovado", 9) == 0) return SITUACAO_REPROVADO;
+    return SITUACAO_PENDENTE;
+}
+
+static int faixaNota(float nota) {
+    if (!(nota >= 0)) return 0;  // negativa ou NaN
+    return nota >= FAIXAS_NOTA ? FAIXAS_NOTA - 1 : (int)nota;
+}
+
+// Soma (sinal = 1) ou tira (sinal = -1) uma matrícula dos totais
+static void somarEstatistica(Estatistica* e, const Matricula* m, int sinal) {
+    e->matriculas += sinal;
+    e->por_situacao[situacaoMatricula(m)] += sinal;
+    e->soma_np1 += sinal * (double)m->np1;
+    e->soma_np2 += sinal * (double)m->np2;
+    e->soma_pim += sinal * (double)m->pim;
+    e->soma_media += sinal * (double)m->media_final;
+    e->soma_faltas += sinal * (long long)m->faltas;
+    e->faixas_np1[faixaNota(m->np1)] += sinal;
+    e->faixas_np2[faixaNota(m->np2)] += sinal;
+    e->faixas_pim[faixaNota(m->pim)] += sinal;
+}
+
+static unsigned int hashGrupo(int id_turma, int id_materia) {
+    int chave[2] = { id_turma, id_materia };
+    return hashBytes(FNV_INICIAL, chave, sizeof(chave));
+}
+
+// Linha 0 a TOTAL_SITUACOES - 1: situações; depois, as posições da tabela hash
+static long inicioEstatistica(long linha) {
+    return (long)sizeof(CabecalhoEstatisticas) + linha * (long)sizeof(Estatistica);
+}
+
+static int lerEstatistica(FILE *f, long linha, Estatistica* e) {
+    return fseek(f, inicioEstatistica(linha), SEEK_SET) == 0 && fread(e, sizeof(Estatistica), 1, f) == 1;
+}
+
+static int gravarEstatistica(FILE *f, long linha, const Estatistica* e) {
+    return fseek(f, inicioEstatistica(linha), SEEK_SET) == 0 && fwrite(e, sizeof(Estatistica), 1, f) == 1;
+}
+
+static int lerCabecalhoEstatisticas(FILE *f, CabecalhoEstatisticas* cab) {
+    if (fseek(f, 0, SEEK_SET) != 0 || fread(cab, sizeof(CabecalhoEstatisticas), 1, f) != 1) return 0;
+    return memcmp(cab->magica, MAGICA_ESTATISTICAS, 4) == 0 && cab->capacidade > 0;
+}
+
+// Cabeçalho atual do matriculas.dat (um .dat que ainda não existe conta como vazio).
+// Retorna 0 se o .dat não está no formato atual
+static int cabecalhoMatriculas(CabecalhoDados* cab) {
+    FILE *f = abrirDados(TABELA_MATRICULAS, "rb", 0, cab);
+    if (f != NULL) {
+        fecharArquivo(f);
+        return 1;
+    }
+    novoCabecalho(TABELA_MATRICULAS, cab);
+    return formatoArquivo(TABELA_MATRICULAS) == FORMATO_ATUAL;
+}
+
+static int estatisticasEmDia(const CabecalhoEstatisticas* cab, const CabecalhoDados* dados) {
+    return cab->registros == dados->registros && cab->geracao == dados->geracao;
+}
+
+// Posição da (turma, matéria) numa tabela hash em memória: a ocupada por ela ou a vazia
+// onde ela entraria
+static long procurarGrupo(const Estatistica* grupos, long cap, int id_turma, int id_materia) {
+    long s = (long)(hashGrupo(id_turma, id_materia) & (unsigned int)(cap - 1));
+    while (grupos[s].usado && (grupos[s].id_turma != id_turma || grupos[s].id_materia != id_materia)) {
+        s = (s + 1) & (cap - 1);
+    }
+    return s;
+}
+
+// Copia os grupos para uma tabela de 'nova_cap' posições (NULL se faltar memória)
+static Estatistica* redistribuirGrupos(const Estatistica* grupos, long cap, long nova_cap) {
+    Estatistica* novos = calloc(nova_cap, sizeof(Estatistica));
+    if (novos == NULL) return NULL;
+    for (long i = 0; i < cap; i++) {
+        if (grupos[i].usado) novos[procurarGrupo(novos, nova_cap, grupos[i].id_turma, grupos[i].id_materia)] = grupos[i];
+    }
+    return novos;
+}
+
+// Refaz o matriculas.est numa passada pelo .dat. A tabela cresce enquanto lê e é gravada
+// com folga: só enche depois que o número de turmas/matérias dobrar
+static int reconstruirEstatisticas(void) {
+    CabecalhoDados cab_dados;
+    FILE *f = abrirDados(TABELA_MATRICULAS, "rb", 0, &cab_dados);
+    if (f == NULL) {
+        if (formatoArquivo(TABELA_MATRICULAS) != FORMATO_ATUAL) return 0;
+        novoCabecalho(TABELA_MATRICULAS, &cab_dados);
+    }
+    Estatistica situacoes[TOTAL_SITUACOES];
+    memset(situacoes, 0, sizeof(situacoes));
+    long cap = 64, ocupados = 0;
+    Estatistica* grupos = calloc(cap, sizeof(Estatistica));
+    int ok = grupos != NULL;
+    Matricula m;
+    for (long lidos = 0; ok && f != NULL && lidos < (long)cab_dados.registros && lerRegistros(&m, sizeof(m), 1, f) == 1; lidos++) {
+        if (registroApagado(TABELA_MATRICULAS, &m)) continue;
+        if ((ocupados + 1) * 2 > cap) {
+            Estatistica* maior = redistribuirGrupos(grupos, cap, cap * 2);
+            ok = maior != NULL;
+            if (!ok) break;
+            free(grupos);
+            grupos = maior;
+            cap *= 2;
+        }
+        long s = procurarGrupo(grupos, cap, m.id_turma, m.id_materia);
+        if (!grupos[s].usado) {
+            grupos[s].usado = 1;
+            grupos[s].id_turma = m.id_turma;
+            grupos[s].id_materia = m.id_materia;
+            ocupados++;
+        }
+        somarEstatistica(&grupos[s], &m, 1);
+        somarEstatistica(&situacoes[situacaoMatricula(&m)], &m, 1);
+    }
+    if (f != NULL) fecharArquivo(f);
+    long final = capacidadeHash(ocupados * 2);
+    if (ok && final != cap) {
+        Estatistica* folga = redistribuirGrupos(grupos, cap, final);
+        ok = folga != NULL;
+        if (ok) {
+            free(grupos);
+            grupos = folga;
+            cap = final;
+        }
+    }
+    if (!ok) { free(grupos); return 0; }
+
+    char temp[260];
+    nomeTemporario(temp, sizeof(temp), MATRICULAS_EST);
+    FILE *out = abrirArquivo(temp, "wb");
+    if (out == NULL) { free(grupos); return 0; }
+    CabecalhoEstatisticas cab;
+    memset(&cab, 0, sizeof(cab));
+    memcpy(cab.magica, MAGICA_ESTATISTICAS, 4);
+    cab.geracao = cab_dados.geracao;
+    cab.registros = cab_dados.registros;
+    cab.capacidade = (int32_t)cap;
+    cab.grupos = (int32_t)ocupados;
+    ok = fwrite(&cab, sizeof(cab), 1, out) == 1
+         && fwrite(situacoes, sizeof(Estatistica), TOTAL_SITUACOES, out) == TOTAL_SITUACOES
+         && fwrite(grupos, sizeof(Estatistica), cap, out) == (size_t)cap;
+    if (fecharArquivo(out) != 0) ok = 0;
+    free(grupos);
+    if (!ok || !substituirArquivo(temp, MATRICULAS_EST)) {
+        remove(temp);
+        return 0;
+    }
+    return 1;
+}
+
+// Abre o .est para leitura (com a trava das matrículas), refazendo antes se está velho
+static FILE* abrirEstatisticas(CabecalhoEstatisticas* cab) {
+    CabecalhoDados dados;
+    if (!cabecalhoMatriculas(&dados)) return NULL;
+    FILE *f = abrirArquivo(MATRICULAS_EST, "rb");
+    if (f != NULL && lerCabecalhoEstatisticas(f, cab) && estatisticasEmDia(cab, &dados)) return f;
+    if (f != NULL) fecharArquivo(f);
+
+    if (!reconstruirEstatisticas()) return NULL;
+    f = abrirArquivo(MATRICULAS_EST, "rb");
+    if (f == NULL) return NULL;
+    if (!lerCabecalhoEstatisticas(f, cab)) { fecharArquivo(f); return NULL; }
+    return f;
+}
+
+// Ajuste dos totais durante uma gravação de matrículas: iniciar antes de mexer no .dat,
+// ajustar com cada registro que saiu (-1) ou entrou (1) depois que a gravação deu certo e
+// terminar no fim. Só um .est em dia com o .dat de antes da gravação é ajustado
+typedef struct {
+    FILE *f;                     // NULL: o .est já estava velho (ou o lote é grande)
+    CabecalhoEstatisticas cab;
+    int falhou;
+} AjusteEstatisticas;
+
+static void iniciarAjusteEstatisticas(AjusteEstatisticas* a, long quantidade) {
+    CabecalhoDados dados;
+    a->falhou = 0;
+    a->f = quantidade <= LIMITE_AJUSTES_ESTATISTICAS ? abrirArquivo(MATRICULAS_EST, "r+b") : NULL;
+    if (a->f == NULL) return;
+    if (!lerCabecalhoEstatisticas(a->f, &a->cab) || !cabecalhoMatriculas(&dados) || !estatisticasEmDia(&a->cab, &dados)) {
+        fecharArquivo(a->f);
+        a->f = NULL;
+    }
+}
+
+static void ajustarEstatisticas(AjusteEstatisticas* a, const Matricula* m, int sinal) {
+    if (a->f == NULL || a->falhou) return;
+    Estatistica e;
+    int situacao = situacaoMatricula(m);
+    if (!lerEstatistica(a->f, situacao, &e)) { a->falhou = 1; return; }
+    somarEstatistica(&e, m, sinal);
+    if (!gravarEstatistica(a->f, situacao, &e)) { a->falhou = 1; return; }
+
+    long cap = a->cab.capacidade;
+    long s = (long)(hashGrupo(m->id_turma, m->id_materia) & (unsigned int)(cap - 1));
+    while (1) {
+        if (!lerEstatistica(a->f, TOTAL_SITUACOES + s, &e)) { a->falhou = 1; return; }
+        if (!e.usado || (e.id_turma == m->id_turma && e.id_materia == m->id_materia)) break;
+        s = (s + 1) & (cap - 1);
+    }
+    if (!e.usado) {
+        // Turma/matéria nova sem lugar na tabela (ou tirando de uma que não existe): o .est
+        // fica velho e é refeito, maior, na próxima leitura
+        if (sinal < 0 || (a->cab.grupos + 1) * 2 > cap) { a->falhou = 1; return; }
+        memset(&e, 0, sizeof(e));
+        e.usado = 1;
+        e.id_turma = m->id_turma;
+        e.id_materia = m->id_materia;
+        a->cab.grupos++;
+    }
+    somarEstatistica(&e, m, sinal);
+    if (!gravarEstatistica(a->f, TOTAL_SITUACOES + s, &e)) a->falhou = 1;
+}
+
+// 'gravou': o .dat foi alterado. O cabeçalho só passa para a nova geração do .dat se todos
+// os ajustes entraram; senão fica marcado como velho
+static void terminarAjusteEstatisticas(AjusteEstatisticas* a, int gravou) {
+    if (a->f == NULL) return;
+    CabecalhoDados dados;
+    if (gravou) {
+        if (!a->falhou && cabecalhoMatriculas(&dados)) {
+            a->cab.geracao = dados.geracao;
+            a->cab.registros = dados.registros;
+        } else {
+            a->cab.registros = -1;
+        }
+        if (fseek(a->f, 0, SEEK_SET) == 0) fwrite(&a->cab, sizeof(CabecalhoEstatisticas), 1, a->f);
+    }
+    fecharArquivo(a->f);
+    a->f = NULL;
+}
 
 
 // --- 3. FUNÇÕES DE ALUNOS ---
 
+// Chaves usadas pelos índices de alunos
+static long long chaveAlunoRA(const void* registro) { return ((const Aluno*)registro)->ra; }
+static unsigned int hashAlunoCPF(const void* registro) {
+    const Aluno* a = (const Aluno*)registro;
+    return hashTexto(a->cpf, sizeof(a->cpf));
+}
+static int mesmoCPF(const void* a, const void* b) {
+    return strncmp(((const Aluno*)a)->cpf, ((const Aluno*)b)->cpf, sizeof(((const Aluno*)a)->cpf)) == 0;
+}
+
+static const IndiceOrdenado INDICE_ALUNOS_RA = { TABELA_ALUNOS, ALUNOS_DB, ALUNOS_RA_IDX, sizeof(Aluno), chaveAlunoRA };
+static const IndiceHash INDICE_ALUNOS_CPF = { TABELA_ALUNOS, ALUNOS_DB, ALUNOS_CPF_IDX, sizeof(Aluno), hashAlunoCPF, mesmoCPF };
+
 void salvarAluno(Aluno aluno) {
-    FILE *f = fopen(ALUNOS_DB, "ab");
-    if (f == NULL) return;
-    fwrite(&aluno, sizeof(Aluno), 1, f);
-    fclose(f);
+    travarEscrita(TABELA_ALUNOS);
+    long pos = anexarRegistros(TABELA_ALUNOS, &aluno, 1);
+    if (pos >= 0) {
+        inserirIndiceOrdenado(&INDICE_ALUNOS_RA, &aluno, pos);
+        inserirIndiceHash(&INDICE_ALUNOS_CPF, &aluno, pos);
+        avancarSequencia(TABELA_ALUNOS, aluno.ra);
+    }
+    destravar(TABELA_ALUNOS);
 }
 
 int carregarAlunos(Aluno* buffer, int max_alunos) {
-    FILE *f = fopen(ALUNOS_DB, "rb");
-    if (f == NULL) return 0;
+    travarLeitura(TABELA_ALUNOS);
+    CabecalhoDados cab;
+    FILE *f = abrirDados(TABELA_ALUNOS, "rb", 0, &cab);
     int count = 0;
-    while(count < max_alunos && fread(&buffer[count], sizeof(Aluno), 1, f)) {
-        count++;
+    for (long lidos = 0; f != NULL && lidos < cab.registros && count < max_alunos && lerRegistros(&buffer[count], sizeof(Aluno), 1, f); lidos++) {
+        if (!registroApagado(TABELA_ALUNOS, &buffer[count])) count++;
     }
-    fclose(f);
+    if (f != NULL) fecharArquivo(f);
+    destravar(TABELA_ALUNOS);
     return count;
 }
 
 int buscarAlunoPorRA(long ra_buscado, Aluno* out_aluno) {
-    FILE *f = fopen(ALUNOS_DB, "rb");
-    if (f == NULL) return 0;
-    Aluno aluno_lido;
-    while(fread(&aluno_lido, sizeof(Aluno), 1, f)) {
-        if (aluno_lido.ra == ra_buscado) {
-            *out_aluno = aluno_lido; 
-            fclose(f);
-            return 1; 
-        }
-    }
-    fclose(f);
-    return 0; 
+    // Busca binária no índice ordenado por RA (alunos_ra.idx)
+    travarLeitura(TABELA_ALUNOS);
+    int achou = buscarIndiceOrdenado(&INDICE_ALUNOS_RA, ra_buscado, out_aluno) >= 0;
+    destravar(TABELA_ALUNOS);
+    return achou;
 }
 
 // --- NOVO: Função para buscar por CPF ---
 // Retorna 1 se achou, 0 se não
 int buscarAlunoPorCPF(char* cpf_buscado, Aluno* out_aluno) {
-    FILE *f = fopen(ALUNOS_DB, "rb");
-    if (f == NULL) return 0;
-
-    Aluno aluno_lido;
-    while(fread(&aluno_lido, sizeof(Aluno), 1, f)) {
-        // Usa strcmp (comparação de strings)
-        if (strcmp(aluno_lido.cpf, cpf_buscado) == 0) {
-            *out_aluno = aluno_lido; // Copia os dados
-            fclose(f);
-            return 1; // Encontrado
-        }
-    }
-    fclose(f);
-    return 0; // Não encontrado
+    // Monta um aluno "modelo" só com o CPF e consulta o índice hash (alunos_cpf.idx)
+    Aluno modelo;
+    memset(&modelo, 0, sizeof(Aluno));
+    strncpy(modelo.cpf, cpf_buscado, sizeof(modelo.cpf) - 1);
+    travarLeitura(TABELA_ALUNOS);
+    int achou = buscarIndiceHash(&INDICE_ALUNOS_CPF, &modelo, out_aluno) >= 0;
+    destravar(TABELA_ALUNOS);
+    return achou;
 }
 
 
 // --- 4. FUNÇÕES DE TURMAS (Sem mudanças) ---
 void salvarTurma(Turma turma) {
-    FILE *f = fopen(TURMAS_DB, "ab");
-    if (f == NULL) return;
-    fwrite(&turma, sizeof(Turma), 1, f);
-    fclose(f);
+    travarEscrita(TABELA_TURMAS);
+    if (anexarRegistros(TABELA_TURMAS, &turma, 1) >= 0) avancarSequencia(TABELA_TURMAS, turma.id);
+    destravar(TABELA_TURMAS);
 }
 int carregarTurmas(Turma* buffer, int max_turmas) {
-    FILE *f = fopen(TURMAS_DB, "rb");
-    if (f == NULL) return 0;
+    travarLeitura(TABELA_TURMAS);
+    CabecalhoDados cab;
+    FILE *f = abrirDados(TABELA_TURMAS, "rb", 0, &cab);
     int count = 0;
-    while(count < max_turmas && fread(&buffer[count], sizeof(Turma), 1, f)) {
-        count++;
+    for (long lidos = 0; f != NULL && lidos < cab.registros && count < max_turmas && lerRegistros(&buffer[count], sizeof(Turma), 1, f); lidos++) {
+        if (!registroApagado(TABELA_TURMAS, &buffer[count])) count++;
     }
-    fclose(f);
+    if (f != NULL) fecharArquivo(f);
+    destravar(TABELA_TURMAS);
     return count;
 }
 
 // --- 5. FUNÇÕES DE MATÉRIAS (Sem mudanças) ---
 void salvarMateria(Materia materia) {
-    FILE *f = fopen(MATERIAS_DB, "ab");
-    if (f == NULL) return;
-    fwrite(&materia, sizeof(Materia), 1, f);
-    fclose(f);
+    travarEscrita(TABELA_MATERIAS);
+    if (anexarRegistros(TABELA_MATERIAS, &materia, 1) >= 0) avancarSequencia(TABELA_MATERIAS, materia.id);
+    destravar(TABELA_MATERIAS);
 }
 int carregarMaterias(Materia* buffer, int max_materias) {
-    FILE *f = fopen(MATERIAS_DB, "rb");
-    if (f == NULL) return 0;
+    travarLeitura(TABELA_MATERIAS);
+    CabecalhoDados cab;
+    FILE *f = abrirDados(TABELA_MATERIAS, "rb", 0, &cab);
     int count = 0;
-    while(count < max_materias && fread(&buffer[count], sizeof(Materia), 1, f)) {
-        count++;
+    for (long lidos = 0; f != NULL && lidos < cab.registros && count < max_materias && lerRegistros(&buffer[count], sizeof(Materia), 1, f); lidos++) {
+        if (!registroApagado(TABELA_MATERIAS, &buffer[count])) count++;
     }
-    fclose(f);
+    if (f != NULL) fecharArquivo(f);
+    destravar(TABELA_MATERIAS);
     return count;
 }
 
-// --- 6. FUNÇÕES DE MATRÍCULA (NOTAS) (Sem mudanças) ---
+// --- 6. FUNÇÕES DE MATRÍCULA (NOTAS) ---
+
+// Chave primária de uma matrícula: (ra_aluno, id_turma, id_materia)
+static unsigned int hashMatriculaChave(const void* registro) {
+    const Matricula* m = (const Matricula*)registro;
+    long long chave[3] = { m->ra_aluno, m->id_turma, m->id_materia };
+    return hashBytes(FNV_INICIAL, chave, sizeof(chave));
+}
+static int mesmaMatricula(const void* a, const void* b) {
+    const Matricula* ma = (const Matricula*)a;
+    const Matricula* mb = (const Matricula*)b;
+    return ma->ra_aluno == mb->ra_aluno && ma->id_turma == mb->id_turma && ma->id_materia == mb->id_materia;
+}
+
+static const IndiceHash INDICE_MATRICULAS_CHAVE = { TABELA_MATRICULAS, MATRICULAS_DB, MATRICULAS_CHAVE_IDX, sizeof(Matricula), hashMatriculaChave, mesmaMatricula };
+
+// Índices secundários: por aluno, por (turma, matéria) e por status.
+// A chave de turma junta os dois ids num número só: os 32 bits de cima são a turma e
+// os de baixo a matéria. Assim o mesmo índice responde "turma" (intervalo) e
+// "turma + matéria" (chave exata). O status entra como hash do texto.
+static long long chaveTurmaMateria(int id_turma, int id_materia) {
+    return ((long long)id_turma << 32) | (unsigned int)id_materia;
+}
+static long long chaveMatriculaAluno(const void* registro) { return ((const Matricula*)registro)->ra_aluno; }
+static long long chaveMatriculaTurma(const void* registro) {
+    const Matricula* m = (const Matricula*)registro;
+    return chaveTurmaMateria(m->id_turma, m->id_materia);
+}
+static long long chaveMatriculaStatus(const void* registro) {
+    const Matricula* m = (const Matricula*)registro;
+    return hashTexto(m->status, sizeof(m->status));
+}
+static int mesmoStatus(const void* registro, const void* modelo) {
+    return strncmp(((const Matricula*)registro)->status, ((const Matricula*)modelo)->status, sizeof(((const Matricula*)modelo)->status)) == 0;
+}
+
+static const IndiceOrdenado INDICE_MATRICULAS_ALUNO = { TABELA_MATRICULAS, MATRICULAS_DB, MATRICULAS_ALUNO_IDX, sizeof(Matricula), chaveMatriculaAluno };
+static const IndiceOrdenado INDICE_MATRICULAS_TURMA = { TABELA_MATRICULAS, MATRICULAS_DB, MATRICULAS_TURMA_IDX, sizeof(Matricula), chaveMatriculaTurma };
+static const IndiceOrdenado INDICE_MATRICULAS_STATUS = { TABELA_MATRICULAS, MATRICULAS_DB, MATRICULAS_STATUS_IDX, sizeof(Matricula), chaveMatriculaStatus };
+
+// Acima disso, um lote descarta os índices secundários (reconstruídos de uma vez na
+// próxima consulta) em vez de corrigir entrada por entrada
+#define LIMITE_AJUSTES_INDICE 64
+
+static void indexarMatriculaNova(const Matricula* m, long pos) {
+    inserirIndiceHash(&INDICE_MATRICULAS_CHAVE, m, pos);
+    inserirIndiceOrdenado(&INDICE_MATRICULAS_ALUNO, m, pos);
+    inserirIndiceOrdenado(&INDICE_MATRICULAS_TURMA, m, pos);
+    inserirIndiceOrdenado(&INDICE_MATRICULAS_STATUS, m, pos);
+}
+
+// Só o status muda numa atualização (aluno, turma e matéria formam a chave)
+static void reindexarMatricula(const Matricula* antes, const Matricula* depois, long pos) {
+    moverIndiceOrdenado(&INDICE_MATRICULAS_STATUS, chaveMatriculaStatus(antes), chaveMatriculaStatus(depois), pos);
+}
+
+static void invalidarIndicesMatriculas(void) {
+    descartarIndice(MATRICULAS_CHAVE_IDX);
+    descartarIndice(MATRICULAS_ALUNO_IDX);
+    descartarIndice(MATRICULAS_TURMA_IDX);
+    descartarIndice(MATRICULAS_STATUS_IDX);
+}
+
+// Termina uma atualização que foi interrompida (queda do programa / da máquina).
+// A queda pode ter sido no meio do ajuste dos índices, então eles são refeitos
+static void recuperarMatriculas(void) {
+    if (aplicarJournal(MATRICULAS_JNL, TABELA_MATRICULAS)) {
+        invalidarIndicesMatriculas();
+        removerArquivo(MATRICULAS_JNL);
+    }
+}
+
+// Toda função pública de matrícula começa por uma destas. Gravar: trava exclusiva e
+// termina um journal que tenha ficado para trás. Ler: se ficou journal, ele é terminado
+// antes com a trava exclusiva (só quem grava mexe no .dat) e depois vem a compartilhada
+static void travarEscritaMatriculas(void) {
+    travarEscrita(TABELA_MATRICULAS);
+    recuperarMatriculas();
+}
+
+static void travarLeituraMatriculas(void) {
+    FILE *jnl = contagem_travas[TABELA_MATRICULAS] == 0 ? fopen(MATRICULAS_JNL, "rb") : NULL;
+    if (jnl != NULL) {
+        fclose(jnl);
+        travarEscritaMatriculas();
+        destravar(TABELA_MATRICULAS);
+    }
+    travarLeitura(TABELA_MATRICULAS);
+}
+
 void salvarMatricula(Matricula matricula) {
-    FILE *f = fopen(MATRICULAS_DB, "ab");
-    if (f == NULL) return;
-    fwrite(&matricula, sizeof(Matricula), 1, f);
-    fclose(f);
+    travarEscritaMatriculas();
+    AjusteEstatisticas est;
+    iniciarAjusteEstatisticas(&est, 1);
+    long pos = anexarRegistros(TABELA_MATRICULAS, &matricula, 1);
+    if (pos >= 0) {
+        indexarMatriculaNova(&matricula, pos);
+        ajustarEstatisticas(&est, &matricula, 1);
+    }
+    terminarAjusteEstatisticas(&est, pos >= 0);
+    destravar(TABELA_MATRICULAS);
 }
 int carregarMatriculas(Matricula* buffer, int max_matriculas) {
-    FILE *f = fopen(MATRICULAS_DB, "rb");
-    if (f == NULL) return 0;
+    travarLeituraMatriculas();
+    CabecalhoDados cab;
+    FILE *f = abrirDados(TABELA_MATRICULAS, "rb", 0, &cab);
     int count = 0;
-    while(count < max_matriculas && fread(&buffer[count], sizeof(Matricula), 1, f)) {
-        count++;
+    for (long lidos = 0; f != NULL && lidos < cab.registros && count < max_matriculas && lerRegistros(&buffer[count], sizeof(Matricula), 1, f); lidos++) {
+        if (!registroApagado(TABELA_MATRICULAS, &buffer[count])) count++;
     }
-    fclose(f);
+    if (f != NULL) fecharArquivo(f);
+    destravar(TABELA_MATRICULAS);
     return count;
 }
-void atualizarMatricula(Matricula matricula_atualizada) {
-    FILE *f_in = fopen(MATRICULAS_DB, "rb");
-    FILE *f_out = fopen("temp.dat", "wb"); 
-    if (f_in == NULL || f_out == NULL) return;
-    Matricula matricula_lida;
-    int encontrado = 0;
-    while(fread(&matricula_lida, sizeof(Matricula), 1, f_in)) {
-        if (matricula_lida.ra_aluno == matricula_atualizada.ra_aluno &&
-            matricula_lida.id_turma == matricula_atualizada.id_turma &&
-            matricula_lida.id_materia == matricula_atualizada.id_materia) {
-            fwrite(&matricula_atualizada, sizeof(Matricula), 1, f_out);
-            encontrado = 1;
+
+// Atualiza notas/faltas de uma matrícula sem reescrever o arquivo: acha a posição
+// pelo índice da chave e sobrescreve só aquele registro (protegido pelo journal).
+// Se a matrícula não existir, ela é acrescentada no fim. Retorna 1 se deu certo
+static int atualizarMatriculaTravada(Matricula matricula_atualizada) {
+    Matricula atual;
+    AjusteEstatisticas est;
+    iniciarAjusteEstatisticas(&est, 2);
+    long pos = buscarIndiceHash(&INDICE_MATRICULAS_CHAVE, &matricula_atualizada, &atual);
+    int ok;
+    if (pos < 0) {
+        pos = anexarRegistros(TABELA_MATRICULAS, &matricula_atualizada, 1);
+        ok = pos >= 0;
+        if (ok) indexarMatriculaNova(&matricula_atualizada, pos);
+    } else {
+        ok = gravarJournal(MATRICULAS_JNL, sizeof(Matricula), 1, &pos, &matricula_atualizada)
+             && aplicarJournal(MATRICULAS_JNL, TABELA_MATRICULAS);
+        if (ok) {
+            // O journal só sai depois dos índices: se cair antes, recuperarMatriculas refaz tudo
+            reindexarMatricula(&atual, &matricula_atualizada, pos);
+            removerArquivo(MATRICULAS_JNL);
+            ajustarEstatisticas(&est, &atual, -1);
+        }
+    }
+    if (ok) ajustarEstatisticas(&est, &matricula_atualizada, 1);
+    terminarAjusteEstatisticas(&est, ok);
+    return ok;
+}
+
+int atualizarMatricula(Matricula matricula_atualizada) {
+    travarEscritaMatriculas();
+    int ok = atualizarMatriculaTravada(matricula_atualizada);
+    destravar(TABELA_MATRICULAS);
+    return ok;
+}
+
+typedef struct {
+    long pos;
+    long ordem;   // posição no lote (para a última versão de uma mesma matrícula vencer)
+} PosicaoLote;
+
+static int compararPosicoesLote(const void* a, const void* b) {
+    const PosicaoLote* pa = (const PosicaoLote*)a;
+    const PosicaoLote* pb = (const PosicaoLote*)b;
+    if (pa->pos != pb->pos) return pa->pos < pb->pos ? -1 : 1;
+    return pa->ordem < pb->ordem ? -1 : (pa->ordem > pb->ordem);
+}
+
+// Atualiza 'n' matrículas de uma vez: uma consulta ao índice para todas, um único journal
+// e uma única passada (em ordem de posição) pelo matriculas.dat. Ou todas as alterações
+// ficam gravadas, ou nenhuma. Matrículas que não existem são acrescentadas no fim.
+// Retorna 1 se deu certo
+static int atualizarMatriculasLoteTravado(Matricula* matriculas, int n) {
+
+    long* posicoes = malloc(sizeof(long) * n);
+    PosicaoLote* ordem = malloc(sizeof(PosicaoLote) * n);
+    Matricula* registros = malloc(sizeof(Matricula) * n);
+    Matricula* anteriores = malloc(sizeof(Matricula) * n);
+    if (posicoes == NULL || ordem == NULL || registros == NULL || anteriores == NULL
+        || !buscarVariosIndiceHash(&INDICE_MATRICULAS_CHAVE, matriculas, n, posicoes, anteriores)) {
+        free(posicoes); free(ordem); free(registros); free(anteriores);
+        return 0;
+    }
+
+    // As que não existem ganham posições novas depois do fim do arquivo. Uma tabela hash
+    // temporária garante que a mesma matrícula nova repetida no lote ganhe uma só posição
+    long total = contarRegistrosTabela(TABELA_MATRICULAS);
+    long proxima = total;
+    long cap = capacidadeHash(n);
+    int* novas = malloc(sizeof(int) * cap);
+    if (novas == NULL) { free(posicoes); free(ordem); free(registros); free(anteriores); return 0; }
+    for (long s = 0; s < cap; s++) novas[s] = -1;
+    for (int i = 0; i < n; i++) {
+        if (posicoes[i] >= 0) continue;
+        long s = (long)(hashMatriculaChave(&matriculas[i]) & (unsigned int)(cap - 1));
+        while (novas[s] != -1 && !mesmaMatricula(&matriculas[i], &matriculas[novas[s]])) s = (s + 1) & (cap - 1);
+        if (novas[s] == -1) {
+            novas[s] = i;
+            posicoes[i] = proxima++;
+        } else {
+            posicoes[i] = posicoes[novas[s]];
+        }
+    }
+    free(novas);
+
+    for (int i = 0; i < n; i++) { ordem[i].pos = posicoes[i]; ordem[i].ordem = i; }
+    qsort(ordem, n, sizeof(PosicaoLote), compararPosicoesLote);
+    for (int i = 0; i < n; i++) {
+        posicoes[i] = ordem[i].pos;
+        registros[i] = matriculas[ordem[i].ordem];
+    }
+
+    AjusteEstatisticas est;
+    iniciarAjusteEstatisticas(&est, 2L * n);
+    int ok = gravarJournal(MATRICULAS_JNL, sizeof(Matricula), n, posicoes, registros)
+             && aplicarJournal(MATRICULAS_JNL, TABELA_MATRICULAS);
+    if (ok) {
+        // Índices: só a última versão de cada posição conta
+        long ajustes = 0;
+        for (int i = 0; i < n; i++) {
+            if (i + 1 < n && posicoes[i + 1] == posicoes[i]) continue;
+            if (posicoes[i] >= total || chaveMatriculaStatus(&anteriores[ordem[i].ordem]) != chaveMatriculaStatus(&registros[i])) ajustes++;
+        }
+        if (ajustes > LIMITE_AJUSTES_INDICE) {
+            invalidarIndicesMatriculas();
         } else {
-            fwrite(&matricula_lida, sizeof(Matricula), 1, f_out);
+            // Primeiro as novas (o índice só aceita ajustes quando cobre o arquivo todo)
+            for (int i = 0; i < n; i++) {
+                if (i + 1 < n && posicoes[i + 1] == posicoes[i]) continue;
+                if (posicoes[i] >= total) indexarMatriculaNova(&registros[i], posicoes[i]);
+            }
+            for (int i = 0; i < n; i++) {
+                if (i + 1 < n && posicoes[i + 1] == posicoes[i]) continue;
+                if (posicoes[i] < total) reindexarMatricula(&anteriores[ordem[i].ordem], &registros[i], posicoes[i]);
+            }
+        }
+        removerArquivo(MATRICULAS_JNL);
+        // Estatísticas: sai a versão anterior de cada matrícula que já existia, entra a última do lote
+        for (int i = 0; i < n; i++) {
+            if (i + 1 < n && posicoes[i + 1] == posicoes[i]) continue;
+            if (posicoes[i] < total) ajustarEstatisticas(&est, &anteriores[ordem[i].ordem], -1);
+            ajustarEstatisticas(&est, &registros[i], 1);
         }
     }
-    if (!encontrado) {
-        fwrite(&matricula_atualizada, sizeof(Matricula), 1, f_out);
+    terminarAjusteEstatisticas(&est, ok);
+    free(posicoes);
+    free(ordem);
+    free(registros);
+    free(anteriores);
+    return ok;
+}
+
+int atualizarMatriculasLote(Matricula* matriculas, int n) {
+    if (n <= 0) return 1;
+    travarEscritaMatriculas();
+    int ok = atualizarMatriculasLoteTravado(matriculas, n);
+    destravar(TABELA_MATRICULAS);
+    return ok;
+}
+
+// --- Consultas pelos índices secundários ---
+// Todas gravam até 'max' matrículas em 'buffer' e retornam quantas existem no total
+// (se o retorno for maior que 'max', chame de novo com um buffer desse tamanho)
+
+// Consulta um dos índices de matrícula com a trava de leitura
+static int consultarMatriculas(const IndiceOrdenado* idx, long long de, long long ate,
+                               int (*aceita)(const void* registro, const void* modelo), const void* modelo,
+                               Matricula* buffer, int max) {
+    travarLeituraMatriculas();
+    int total = consultarIndiceOrdenado(idx, de, ate, aceita, modelo, buffer, max);
+    destravar(TABELA_MATRICULAS);
+    return total;
+}
+
+int matriculasPorAluno(long ra_aluno, Matricula* buffer, int max) {
+    return consultarMatriculas(&INDICE_MATRICULAS_ALUNO, ra_aluno, ra_aluno, NULL, NULL, buffer, max);
+}
+
+int matriculasPorTurma(int id_turma, Matricula* buffer, int max) {
+    return consultarMatriculas(&INDICE_MATRICULAS_TURMA, chaveTurmaMateria(id_turma, 0),
+                               chaveTurmaMateria(id_turma, -1), NULL, NULL, buffer, max);
+}
+
+int matriculasPorTurmaMateria(int id_turma, int id_materia, Matricula* buffer, int max) {
+    long long chave = chaveTurmaMateria(id_turma, id_materia);
+    return consultarMatriculas(&INDICE_MATRICULAS_TURMA, chave, chave, NULL, NULL, buffer, max);
+}
+
+int matriculasPorStatus(char* status, Matricula* buffer, int max) {
+    Matricula modelo;
+    memset(&modelo, 0, sizeof(Matricula));
+    strncpy(modelo.status, status, sizeof(modelo.status) - 1);
+    long long chave = chaveMatriculaStatus(&modelo);
+    return consultarMatriculas(&INDICE_MATRICULAS_STATUS, chave, chave, mesmoStatus, &modelo, buffer, max);
+}
+
+int matriculasEmExame(Matricula* buffer, int max) {
+    return matriculasPorStatus("Exame", buffer, max);
+}
+
+// --- Estatísticas por turma/matéria e por situação (ver 2.7) ---
+// Leem só o matriculas.est (refeito antes se estiver velho). Retornam -1 se falhar
+
+// Uma linha por (turma, matéria) com matrículas, na ordem da tabela hash: grava até 'max'
+// em 'buffer' e retorna quantas existem
+int estatisticasMatriculas(Estatistica* buffer, int max) {
+    travarLeituraMatriculas();
+    CabecalhoEstatisticas cab;
+    FILE *f = abrirEstatisticas(&cab);
+    int total = f != NULL ? 0 : -1;
+    Estatistica e;
+    for (long s = 0; f != NULL && s < cab.capacidade && lerEstatistica(f, TOTAL_SITUACOES + s, &e); s++) {
+        if (!e.usado || e.matriculas == 0) continue;
+        if (total < max) buffer[total] = e;
+        total++;
+    }
+    if (f != NULL) fecharArquivo(f);
+    destravar(TABELA_MATRICULAS);
+    return total;
+}
+
+// Uma linha por situação (SITUACAO_PENDENTE, _EXAME, _APROVADO, _REPROVADO), com os totais
+// do arquivo inteiro. Retorna TOTAL_SITUACOES
+int estatisticasPorSituacao(Estatistica* buffer, int max) {
+    travarLeituraMatriculas();
+    CabecalhoEstatisticas cab;
+    FILE *f = abrirEstatisticas(&cab);
+    int total = f != NULL ? TOTAL_SITUACOES : -1;
+    for (int i = 0; f != NULL && i < TOTAL_SITUACOES && i < max; i++) {
+        if (!lerEstatistica(f, i, &buffer[i])) total = -1;
+    }
+    if (f != NULL) fecharArquivo(f);
+    destravar(TABELA_MATRICULAS);
+    return total;
+}
+
+// Uma (turma, matéria) direto pela tabela hash. Retorna 1 se ela tem matrículas
+int estatisticaTurmaMateria(int id_turma, int id_materia, Estatistica* saida) {
+    travarLeituraMatriculas();
+    CabecalhoEstatisticas cab;
+    FILE *f = abrirEstatisticas(&cab);
+    int achou = f != NULL ? 0 : -1;
+    if (f != NULL) {
+        long s = (long)(hashGrupo(id_turma, id_materia) & (unsigned int)(cab.capacidade - 1));
+        for (long tentativas = 0; tentativas < cab.capacidade && lerEstatistica(f, TOTAL_SITUACOES + s, saida) && saida->usado; tentativas++) {
+            if (saida->id_turma == id_turma && saida->id_materia == id_materia) {
+                achou = saida->matriculas > 0;
+                break;
+            }
+            s = (s + 1) & (cab.capacidade - 1);
+        }
+        fecharArquivo(f);
     }
-    fclose(f_in);
-    fclose(f_out);
-    remove(MATRICULAS_DB);
-    rename("temp.dat", MATRICULAS_DB);
+    if (achou != 1) memset(saida, 0, sizeof(Estatistica));
+    destravar(TABELA_MATRICULAS);
+    return achou;
 }
 
 // --- 7. FUNÇÕES DE GRADE (TURMA-MATÉRIA) (Sem mudanças) ---
 void salvarTurmaMateria(TurmaMateria tm) {
-    FILE *f = fopen(GRADE_DB, "ab");
-    if (f == NULL) return;
-    fwrite(&tm, sizeof(TurmaMateria), 1, f);
-    fclose(f);
+    travarEscrita(TABELA_GRADE);
+    anexarRegistros(TABELA_GRADE, &tm, 1);
+    destravar(TABELA_GRADE);
 }
 int carregarTurmaMateria(TurmaMateria* buffer, int max_registros) {
-    FILE *f = fopen(GRADE_DB, "rb");
-    if (f == NULL) return 0;
+    travarLeitura(TABELA_GRADE);
+    CabecalhoDados cab;
+    FILE *f = abrirDados(TABELA_GRADE, "rb", 0, &cab);
     int count = 0;
-    while(count < max_registros && fread(&buffer[count], sizeof(TurmaMateria), 1, f)) {
-        count++;
+    for (long lidos = 0; f != NULL && lidos < cab.registros && count < max_registros && lerRegistros(&buffer[count], sizeof(TurmaMateria), 1, f); lidos++) {
+        if (!registroApagado(TABELA_GRADE, &buffer[count])) count++;
     }
-    fclose(f);
+    if (f != NULL) fecharArquivo(f);
+    destravar(TABELA_GRADE);
     return count;
-}
\ No newline at end of file
+}
+
+
+// --- 8. LEITURA EM LOTES (CURSOR) ---
+// Substitui os carregarX(buffer, max) para arquivos de qualquer tamanho: o Python abre
+// um cursor e vai pedindo lotes de tamanho fixo até acabar, sem limite de registros
+// e sem precisar de um buffer do tamanho do arquivo inteiro.
+
+typedef struct {
+    FILE *f;
+    size_t tam_registro;
+    int tabela;
+    long proximo;   // posição do próximo registro a ler
+} CursorDB;
+
+static void travarLeituraTabela(int tabela) {
+    if (tabela == TABELA_MATRICULAS) travarLeituraMatriculas();
+    else travarLeitura(tabela);
+}
+
+// Quantos registros o arquivo da tabela tem, contando os apagados (é a posição onde
+// entra o próximo registro; serve para mapear o .dat inteiro). Vem do cabeçalho, sem varrer
+int contarRegistros(int tabela) {
+    if (tabela < 0 || tabela >= TOTAL_TABELAS) return 0;
+    travarLeituraTabela(tabela);
+    int total = (int)contarRegistrosTabela(tabela);
+    destravar(tabela);
+    return total;
+}
+
+// Retorna NULL se a tabela não existe ou o arquivo ainda não foi criado (ou está no
+// formato antigo). O cursor não segura trava entre um lote e outro: quem grava não espera
+// a leitura acabar
+CursorDB* abrirCursor(int tabela) {
+    if (tabela < 0 || tabela >= TOTAL_TABELAS) return NULL;
+    travarLeituraTabela(tabela);
+    CabecalhoDados cab;
+    FILE *f = abrirDados(tabela, "rb", 0, &cab);
+    destravar(tabela);
+    if (f == NULL) return NULL;
+    CursorDB* cursor = malloc(sizeof(CursorDB));
+    if (cursor == NULL) { fecharArquivo(f); return NULL; }
+    cursor->f = f;
+    cursor->tam_registro = TABELAS[tabela].tam_registro;
+    cursor->tabela = tabela;
+    cursor->proximo = 0;
+    return cursor;
+}
+
+// Lê até 'max' registros a partir de onde o lote anterior parou, sem os apagados.
+// A contagem do cabeçalho é relida a cada lote (pega o que foi acrescentado nesse meio
+// tempo e nunca o resto de uma escrita em andamento). Retorna 0 no fim
+int proximoLote(CursorDB* cursor, void* buffer, int max) {
+    if (cursor == NULL || max <= 0) return 0;
+    travarLeitura(cursor->tabela);
+    CabecalhoDados cab;
+    long registros = lerCabecalhoDados(cursor->f, cursor->tabela, &cab) == FORMATO_ATUAL ? (long)cab.registros : 0;
+    int vivos = 0, lidos;
+    do {  // um lote inteiro de apagados não pode parecer o fim do arquivo
+        long restantes = registros - cursor->proximo;
+        if (restantes <= 0) break;
+        lidos = restantes < max ? (int)restantes : max;
+        if (fseek(cursor->f, inicioRegistro(cursor->proximo, cursor->tam_registro), SEEK_SET) != 0) break;
+        lidos = (int)lerRegistros(buffer, cursor->tam_registro, lidos, cursor->f);
+        cursor->proximo += lidos;
+        vivos = 0;
+        for (int i = 0; i < lidos; i++) {
+            char* registro = (char*)buffer + (size_t)i * cursor->tam_registro;
+            if (registroApagado(cursor->tabela, registro)) continue;
+            if (vivos != i) memcpy((char*)buffer + (size_t)vivos * cursor->tam_registro, registro, cursor->tam_registro);
+            vivos++;
+        }
+    } while (vivos == 0 && lidos > 0);
+    destravar(cursor->tabela);
+    return vivos;
+}
+
+void fecharCursor(CursorDB* cursor) {
+    if (cursor == NULL) return;
+    fecharArquivo(cursor->f);
+    free(cursor);
+}
+
+
+// --- 9. IMPORTAÇÃO EM LOTE ---
+// Grava muitos registros numa única escrita. Lotes pequenos entram nos índices um a um;
+// nos grandes os índices são descartados e refeitos uma vez só (na próxima consulta ou
+// chamando reconstruirIndices no fim da importação). Retornam quantos foram gravados
+// (-1 se a escrita falhar)
+
+static void invalidarIndicesAlunos(void) {
+    descartarIndice(ALUNOS_RA_IDX);
+    descartarIndice(ALUNOS_CPF_IDX);
+}
+
+int salvarAlunosLote(Aluno* alunos, int n) {
+    if (n <= 0) return 0;
+    travarEscrita(TABELA_ALUNOS);
+    long pos = anexarRegistros(TABELA_ALUNOS, alunos, n);
+    if (pos < 0 || n > LIMITE_AJUSTES_INDICE) {
+        invalidarIndicesAlunos();
+    } else {
+        for (int i = 0; i < n; i++) {
+            inserirIndiceOrdenado(&INDICE_ALUNOS_RA, &alunos[i], pos + i);
+            inserirIndiceHash(&INDICE_ALUNOS_CPF, &alunos[i], pos + i);
+        }
+    }
+    if (pos >= 0) {
+        long maior_ra = alunos[0].ra;
+        for (int i = 1; i < n; i++) if (alunos[i].ra > maior_ra) maior_ra = alunos[i].ra;
+        avancarSequencia(TABELA_ALUNOS, maior_ra);
+    }
+    destravar(TABELA_ALUNOS);
+    return pos < 0 ? -1 : n;
+}
+
+// Tabelas sem índice: só a escrita, com a trava exclusiva
+static int anexarLoteTravado(int tabela, const void* registros, int n) {
+    if (n <= 0) return 0;
+    travarEscrita(tabela);
+    long pos = anexarRegistros(tabela, registros, n);
+    destravar(tabela);
+    return pos < 0 ? -1 : n;
+}
+
+// Turma e Materia têm o mesmo formato (id + nome): grava e avança a sequência do maior ID
+static int salvarCadastroLote(int tabela, const void* registros, size_t tam, int n) {
+    if (n <= 0) return 0;
+    travarEscrita(tabela);
+    long pos = anexarRegistros(tabela, registros, n);
+    if (pos >= 0) {
+        int maior_id = 0;
+        for (int i = 0; i < n; i++) {
+            int id;
+            memcpy(&id, (const char*)registros + i * tam, sizeof(id));  // id é o primeiro campo
+            if (id > maior_id) maior_id = id;
+        }
+        avancarSequencia(tabela, maior_id);
+    }
+    destravar(tabela);
+    return pos < 0 ? -1 : n;
+}
+
+int salvarTurmasLote(Turma* turmas, int n) {
+    return salvarCadastroLote(TABELA_TURMAS, turmas, sizeof(Turma), n);
+}
+
+int salvarMateriasLote(Materia* materias, int n) {
+    return salvarCadastroLote(TABELA_MATERIAS, materias, sizeof(Materia), n);
+}
+
+int salvarTurmaMateriaLote(TurmaMateria* ligacoes, int n) {
+    return anexarLoteTravado(TABELA_GRADE, ligacoes, n);
+}
+
+// Só acrescenta (como salvarMatricula): quem chama garante que as matrículas são novas.
+// Para corrigir matrículas que já existem use atualizarMatriculasLote
+int salvarMatriculasLote(Matricula* matriculas, int n) {
+    if (n <= 0) return 0;
+    travarEscritaMatriculas();
+    AjusteEstatisticas est;
+    iniciarAjusteEstatisticas(&est, n);
+    long pos = anexarRegistros(TABELA_MATRICULAS, matriculas, n);
+    if (pos < 0 || n > LIMITE_AJUSTES_INDICE) {
+        invalidarIndicesMatriculas();
+    } else {
+        for (int i = 0; i < n; i++) indexarMatriculaNova(&matriculas[i], pos + i);
+    }
+    for (int i = 0; pos >= 0 && i < n; i++) ajustarEstatisticas(&est, &matriculas[i], 1);
+    terminarAjusteEstatisticas(&est, pos >= 0);
+    destravar(TABELA_MATRICULAS);
+    return pos < 0 ? -1 : n;
+}
+
+// Refaz agora todos os índices da tabela (para a primeira consulta depois de uma
+// importação grande não pagar a reconstrução). Retorna 1 se deu certo
+int reconstruirIndices(int tabela) {
+    int ok = tabela >= 0 && tabela < TOTAL_TABELAS;  // as outras tabelas não têm índice
+    if (tabela == TABELA_ALUNOS) {
+        travarEscrita(TABELA_ALUNOS);
+        ok = reconstruirIndiceOrdenado(&INDICE_ALUNOS_RA) && reconstruirIndiceHash(&INDICE_ALUNOS_CPF);
+        destravar(TABELA_ALUNOS);
+    } else if (tabela == TABELA_MATRICULAS) {
+        travarEscritaMatriculas();
+        ok = reconstruirIndiceHash(&INDICE_MATRICULAS_CHAVE)
+             && reconstruirIndiceOrdenado(&INDICE_MATRICULAS_ALUNO)
+             && reconstruirIndiceOrdenado(&INDICE_MATRICULAS_TURMA)
+             && reconstruirIndiceOrdenado(&INDICE_MATRICULAS_STATUS)
+             && reconstruirEstatisticas();
+        destravar(TABELA_MATRICULAS);
+    }
+    return ok;
+}
+
+
+// --- 10. SEQUÊNCIAS: RESERVA DE RA/ID ---
+// Reserva 'quantidade' valores seguidos da sequência da tabela (TABELA_ALUNOS = RA,
+// TABELA_TURMAS/TABELA_MATERIAS = ID) e retorna o primeiro; -1 se falhar. Os valores
+// reservados e não usados (ex.: sobra de um bloco da importação) só ficam de fora
+long reservarIds(int tabela, int quantidade) {
+    if (arquivoComSequencia(tabela) == NULL || quantidade <= 0) return -1;
+    long long primeiro = -1;
+    travarLeitura(tabela);
+    travarEscrita(TRAVA_SEQUENCIAS);
+    FILE *f = abrirSequencias();
+    if (f != NULL) {
+        long long proximo = lerSequencia(f, tabela);
+        if (proximo <= 0) {
+            long long inicio = tabela == TABELA_ALUNOS ? PRIMEIRO_RA : PRIMEIRO_ID;
+            long long maior = maiorChave(tabela);
+            proximo = maior < 0 ? 0 : (maior + 1 < inicio ? inicio : maior + 1);
+        }
+        if (proximo > 0 && gravarSequencia(f, tabela, proximo + quantidade)) primeiro = proximo;
+        if (fecharArquivo(f) != 0) primeiro = -1;
+    }
+    destravar(TRAVA_SEQUENCIAS);
+    destravar(tabela);
+    return (long)primeiro;
+}
+
+// --- 11. EXCLUSÃO LÓGICA E COMPACTAÇÃO ---
+// apagar... marca os registros com APAGADO (matrículas passam pelo journal: tudo ou nada)
+// e descarta os índices da tabela. Quando os apagados passam de LIMITE_ESPACO_MORTO por
+// cento do arquivo, a tabela é compactada na mesma chamada: o .dat é reescrito num
+// temporário só com os registros vivos (e, em matrículas e grade, só com a primeira cópia
+// de cada chave repetida, a mesma que o índice usa) e troca o original.
+// Em todas, 0 num campo do filtro quer dizer "qualquer". Retornam quantos foram apagados
+// (-1 se falhar)
+#define LIMITE_ESPACO_MORTO 25
+#define MINIMO_COMPACTACAO 64
+
+static void marcarApagado(int tabela, RegistroQualquer* r) {
+    switch (tabela) {
+        case TABELA_ALUNOS: r->aluno.ra = APAGADO; break;
+        case TABELA_TURMAS: r->turma.id = APAGADO; break;
+        case TABELA_MATERIAS: r->materia.id = APAGADO; break;
+        case TABELA_MATRICULAS: r->matricula.ra_aluno = APAGADO; break;
+        case TABELA_GRADE: r->tm.id_turma = APAGADO; break;
+    }
+}
+
+#define CAMPO_CONFERE(filtro, valor) ((filtro) == 0 || (filtro) == (valor))
+
+static int confereFiltro(int tabela, const RegistroQualquer* r, const RegistroQualquer* filtro) {
+    switch (tabela) {
+        case TABELA_ALUNOS: return r->aluno.ra == filtro->aluno.ra;
+        case TABELA_TURMAS: return r->turma.id == filtro->turma.id;
+        case TABELA_MATERIAS: return r->materia.id == filtro->materia.id;
+        case TABELA_MATRICULAS:
+            return CAMPO_CONFERE(filtro->matricula.ra_aluno, r->matricula.ra_aluno)
+                   && CAMPO_CONFERE(filtro->matricula.id_turma, r->matricula.id_turma)
+                   && CAMPO_CONFERE(filtro->matricula.id_materia, r->matricula.id_materia);
+        case TABELA_GRADE:
+            return CAMPO_CONFERE(filtro->tm.id_turma, r->tm.id_turma) && CAMPO_CONFERE(filtro->tm.id_materia, r->tm.id_materia);
+        default: return 0;
+    }
+}
+
+static void invalidarIndicesTabela(int tabela) {
+    if (tabela == TABELA_ALUNOS) invalidarIndicesAlunos();
+    if (tabela == TABELA_MATRICULAS) invalidarIndicesMatriculas();
+}
+
+// Grade: 1 nas posições que repetem uma ligação (turma, matéria) que apareceu antes
+static char* marcarGradeRepetida(FILE *f, long n) {
+    EntradaOrdenada* entradas = malloc(sizeof(EntradaOrdenada) * (n > 0 ? n : 1));
+    char* repetida = calloc(n > 0 ? n : 1, 1);
+    if (entradas == NULL || repetida == NULL) { free(entradas); free(repetida); return NULL; }
+    TurmaMateria tm;
+    long lidos = 0;
+    while (lidos < n && lerRegistros(&tm, sizeof(tm), 1, f) == 1) {
+        entradas[lidos].chave = chaveTurmaMateria(tm.id_turma, tm.id_materia);
+        entradas[lidos].pos = lidos;
+        lidos++;
+    }
+    qsort(entradas, lidos, sizeof(EntradaOrdenada), compararEntradasOrdenadas);
+    for (long i = 1; i < lidos; i++) {
+        if (entradas[i].chave == entradas[i - 1].chave) repetida[entradas[i].pos] = 1;
+    }
+    free(entradas);
+    fseek(f, TAMANHO_CABECALHO, SEEK_SET);
+    return repetida;
+}
+
+// Reescreve a tabela sem apagados nem repetidos. Chamado com a trava exclusiva.
+// Retorna quantos registros saíram do arquivo (-1 se falhar)
+static long compactarTravado(int tabela) {
+    const Tabela* t = &TABELAS[tabela];
+    CabecalhoDados novo;
+    FILE *f = abrirDados(tabela, "rb", 0, &novo);
+    if (f == NULL) return formatoArquivo(tabela) == FORMATO_ATUAL ? 0 : -1;
+    long n = (long)novo.registros;
+
+    // Repetidas: em matrículas vale a posição que o índice da chave devolve
+    CabecalhoIndice cab;
+    FILE *indice = NULL, *conferir = NULL;
+    char* repetida = NULL;
+    if (tabela == TABELA_MATRICULAS) {
+        indice = abrirIndiceHash(&INDICE_MATRICULAS_CHAVE, &cab, "rb");
+        conferir = abrirArquivo(t->arquivo, "rb");
+        if (indice == NULL || conferir == NULL) {
+            if (indice != NULL) fecharArquivo(indice);
+            if (conferir != NULL) fecharArquivo(conferir);
+            fecharArquivo(f);
+            return -1;
+        }
+    } else if (tabela == TABELA_GRADE && (repetida = marcarGradeRepetida(f, n)) == NULL) {
+        fecharArquivo(f);
+        return -1;
+    }
+
+    char temp[260];
+    nomeTemporario(temp, sizeof(temp), t->arquivo);
+    FILE *out = fopen(temp, "wb");
+    long removidos = 0, lidos = 0;
+    int ok = out != NULL;
+    if (ok) {
+        setvbuf(out, NULL, _IOFBF, TAMANHO_BUFFER_ESCRITA);
+        ok = fwrite(&novo, sizeof(novo), 1, out) == 1;  // a contagem certa entra no fim
+    }
+    RegistroQualquer r, canonico;
+    while (ok && lidos < n && lerRegistros(&r, t->tam_registro, 1, f) == 1) {
+        int sai = registroApagado(tabela, &r)
+                  || (repetida != NULL && repetida[lidos])
+                  || (indice != NULL && procurarIndiceHash(&INDICE_MATRICULAS_CHAVE, indice, conferir, &cab, &r, &canonico) != lidos);
+        if (sai) removidos++;
+        else ok = fwrite(&r, t->tam_registro, 1, out) == 1;
+        lidos++;
+    }
+    if (indice != NULL) fecharArquivo(indice);
+    if (conferir != NULL) fecharArquivo(conferir);
+    fecharArquivo(f);
+    free(repetida);
+
+    if (out != NULL) {
+        novo.registros = n - removidos;
+        if (ok) ok = gravarCabecalhoDados(out, &novo);
+        sincronizarArquivo(out);
+        if (fclose(out) != 0) ok = 0;
+    }
+    // Nada a tirar (ou falhou): o original fica como está
+    if (!ok || removidos == 0 || !substituirArquivo(temp, t->arquivo)) {
+        remove(temp);
+        return ok && removidos == 0 ? 0 : -1;
+    }
+    refazerSomasTabela(tabela);
+    invalidarIndicesTabela(tabela);
+    return removidos;
+}
+
+// Marca os registros que conferem com 'filtro' e compacta se o espaço morto passou do limite
+static long apagarTravado(int tabela, const RegistroQualquer* filtro) {
+    const Tabela* t = &TABELAS[tabela];
+    CabecalhoDados cab;
+    FILE *f = abrirDados(tabela, "rb", 0, &cab);
+    if (f == NULL) return formatoArquivo(tabela) == FORMATO_ATUAL ? 0 : -1;  // vazia ou antiga
+    long total = 0, mortos = 0, quantos = 0, capacidade = 0;
+    long* posicoes = NULL;
+    RegistroQualquer* registros = NULL;
+    RegistroQualquer r;
+    int ok = 1;
+    while (ok && total < (long)cab.registros && lerRegistros(&r, t->tam_registro, 1, f) == 1) {
+        if (registroApagado(tabela, &r)) mortos++;
+        else if (confereFiltro(tabela, &r, filtro)) {
+            if (quantos == capacidade) {
+                capacidade = capacidade ? capacidade * 2 : 64;
+                long* p = realloc(posicoes, sizeof(long) * capacidade);
+                RegistroQualquer* novos = realloc(registros, sizeof(RegistroQualquer) * capacidade);
+                if (p != NULL) posicoes = p;
+                if (novos != NULL) registros = novos;
+                ok = p != NULL && novos != NULL;
+                if (!ok) break;
+            }
+            marcarApagado(tabela, &r);
+            posicoes[quantos] = total;
+            registros[quantos++] = r;
+        }
+        total++;
+    }
+    fecharArquivo(f);
+
+    if (ok && quantos > 0) {
+        if (tabela == TABELA_MATRICULAS) {
+            // Journal com registros do tamanho da struct (não da union). As cópias marcadas
+            // mantêm turma, matéria e notas: é delas que as estatísticas descontam
+            Matricula* apagadas = malloc(sizeof(Matricula) * quantos);
+            AjusteEstatisticas est;
+            iniciarAjusteEstatisticas(&est, quantos);
+            ok = apagadas != NULL;
+            for (long i = 0; ok && i < quantos; i++) apagadas[i] = registros[i].matricula;
+            ok = ok && gravarJournal(MATRICULAS_JNL, sizeof(Matricula), quantos, posicoes, apagadas)
+                    && aplicarJournal(MATRICULAS_JNL, TABELA_MATRICULAS);
+            if (ok) removerArquivo(MATRICULAS_JNL);
+            for (long i = 0; ok && i < quantos; i++) ajustarEstatisticas(&est, &apagadas[i], -1);
+            terminarAjusteEstatisticas(&est, ok);
+            free(apagadas);
+        } else {
+            FILE *dados = abrirDados(tabela, "r+b", 0, &cab);
+            ok = dados != NULL;
+            for (long i = 0; ok && i < quantos; i++) {
+                ok = fseek(dados, inicioRegistro(posicoes[i], t->tam_registro), SEEK_SET) == 0
+                     && fwrite(&registros[i], t->tam_registro, 1, dados) == 1;
+            }
+            if (ok) {
+                atualizarSomas(tabela, dados, total, total, posicoes, quantos);
+                ok = gravarCabecalhoDados(dados, &cab);  // nova geração
+            }
+            if (dados != NULL && fecharArquivo(dados) != 0) ok = 0;
+        }
+        invalidarIndicesTabela(tabela);
+    }
+    free(posicoes);
+    free(registros);
+    if (!ok) return -1;
+
+    mortos += quantos;
+    if (mortos >= MINIMO_COMPACTACAO && mortos * 100 >= total * LIMITE_ESPACO_MORTO) compactarTravado(tabela);
+    return quantos;
+}
+
+static int apagar(int tabela, const RegistroQualquer* filtro) {
+    if (tabela == TABELA_MATRICULAS) travarEscritaMatriculas();
+    else travarEscrita(tabela);
+    long apagados = apagarTravado(tabela, filtro);
+    destravar(tabela);
+    return (int)apagados;
+}
+
+int apagarAluno(long ra) {
+    RegistroQualquer filtro;
+    memset(&filtro, 0, sizeof(filtro));
+    filtro.aluno.ra = ra;
+    return apagar(TABELA_ALUNOS, &filtro);
+}
+
+int apagarTurma(int id) {
+    RegistroQualquer filtro;
+    memset(&filtro, 0, sizeof(filtro));
+    filtro.turma.id = id;
+    return apagar(TABELA_TURMAS, &filtro);
+}
+
+int apagarMateria(int id) {
+    RegistroQualquer filtro;
+    memset(&filtro, 0, sizeof(filtro));
+    filtro.materia.id = id;
+    return apagar(TABELA_MATERIAS, &filtro);
+}
+
+int apagarTurmaMateria(int id_turma, int id_materia) {
+    if (id_turma == 0 && id_materia == 0) return -1;  // não apaga a grade inteira por engano
+    RegistroQualquer filtro;
+    memset(&filtro, 0, sizeof(filtro));
+    filtro.tm.id_turma = id_turma;
+    filtro.tm.id_materia = id_materia;
+    return apagar(TABELA_GRADE, &filtro);
+}
+
+int apagarMatriculas(long ra_aluno, int id_turma, int id_materia) {
+    if (ra_aluno == 0 && id_turma == 0 && id_materia == 0) return -1;
+    RegistroQualquer filtro;
+    memset(&filtro, 0, sizeof(filtro));
+    filtro.matricula.ra_aluno = ra_aluno;
+    filtro.matricula.id_turma = id_turma;
+    filtro.matricula.id_materia = id_materia;
+    return apagar(TABELA_MATRICULAS, &filtro);
+}
+
+// Compacta na hora, sem esperar o limite (ex.: tirar matrículas repetidas de dados antigos).
+// Retorna quantos registros saíram do arquivo (-1 se falhar)
+int compactarTabela(int tabela) {
+    if (tabela < 0 || tabela >= TOTAL_TABELAS) return -1;
+    if (tabela == TABELA_MATRICULAS) travarEscritaMatriculas();
+    else travarEscrita(tabela);
+    long removidos = compactarTravado(tabela);
+    destravar(tabela);
+    return (int)removidos;
+}
+
+// --- 12. MIGRAÇÃO E VERIFICAÇÃO DO FORMATO ---
+// formatoTabela diz se o .dat precisa de migração; migrarTabela reescreve um .dat antigo
+// (sem cabeçalho, ou gravado com o long de outro tamanho) num temporário já com cabeçalho
+// e troca o original; verificarTabela confere as somas dos blocos
+
+// Converte um registro gravado com long de 'tam_long' bytes para a struct deste programa
+static void converterRegistro(const Tabela* t, const char* origem, size_t tam_long, char* destino) {
+    if (!t->chave_long || tam_long == sizeof(long)) {
+        memcpy(destino, origem, t->tam_registro);
+        return;
+    }
+    long chave;
+    if (tam_long == 4) {
+        int32_t c;
+        memcpy(&c, origem, 4);
+        chave = c;
+    } else {
+        int64_t c;
+        memcpy(&c, origem, 8);
+        chave = (long)c;
+    }
+    memcpy(destino, &chave, sizeof(long));
+    memcpy(destino + sizeof(long), origem + tam_long, t->tam_registro - sizeof(long));
+}
+
+// Chamado com a trava exclusiva. 'tam_long' = tamanho do long de quem gravou um arquivo
+// sem cabeçalho. Retorna quantos registros foram convertidos (-1 se falhar)
+static long migrarTravado(int tabela, size_t tam_long) {
+    const Tabela* t = &TABELAS[tabela];
+    FILE *f = abrirArquivo(t->arquivo, "rb");
+    if (f == NULL) return 0;
+    CabecalhoDados cab;
+    int formato = lerCabecalhoDados(f, tabela, &cab);
+    if (formato != FORMATO_ANTIGO) {
+        fecharArquivo(f);
+        return formato == FORMATO_ATUAL ? 0 : -1;
+    }
+    long inicio = 0, n;
+    size_t tam_origem;
+    if (memcmp(cab.magica, MAGICA_DADOS, 4) == 0 && cab.tam_registro != t->tam_registro) {
+        // Já tem cabeçalho, gravado onde o long tem outro tamanho
+        tam_origem = cab.tam_registro;
+        tam_long = tam_origem - (t->tam_registro - sizeof(long));
+        inicio = TAMANHO_CABECALHO;
+        n = (long)cab.registros;
+    } else {
+        fseek(f, 0, SEEK_END);
+        long tamanho = ftell(f);
+        tam_origem = tamanhoComLong(t, tam_long);
+        n = tamanho / (long)tam_origem;
+        size_t outro = tamanhoComLong(t, tam_long == 4 ? 8 : 4);
+        // Sobra no fim e o outro tamanho fecha certo: o long informado deve estar errado
+        if (tamanho % (long)tam_origem != 0 && tamanho % (long)outro == 0) {
+            fecharArquivo(f);
+            return -1;
+        }
+    }
+
+    char temp[260];
+    nomeTemporario(temp, sizeof(temp), t->arquivo);
+    FILE *out = fopen(temp, "wb");
+    CabecalhoDados novo;
+    novoCabecalho(tabela, &novo);
+    novo.registros = n;
+    int ok = out != NULL && fseek(f, inicio, SEEK_SET) == 0;
+    if (ok) {
+        setvbuf(out, NULL, _IOFBF, TAMANHO_BUFFER_ESCRITA);
+        ok = gravarCabecalhoDados(out, &novo);
+    }
+    char origem[sizeof(RegistroQualquer) + 8];
+    RegistroQualquer r;
+    for (long i = 0; ok && i < n; i++) {
+        ok = lerRegistros(origem, tam_origem, 1, f) == 1;
+        if (ok) {
+            converterRegistro(t, origem, tam_long, (char*)&r);
+            ok = fwrite(&r, t->tam_registro, 1, out) == 1;
+        }
+    }
+    fecharArquivo(f);
+    if (out != NULL) {
+        sincronizarArquivo(out);
+        if (fclose(out) != 0) ok = 0;
+    }
+    if (!ok || !substituirArquivo(temp, t->arquivo)) {
+        remove(temp);
+        return -1;
+    }
+    refazerSomasTabela(tabela);
+    invalidarIndicesTabela(tabela);
+    return n;
+}
+
+// FORMATO_ATUAL, FORMATO_ANTIGO ou FORMATO_DESCONHECIDO
+int formatoTabela(int tabela) {
+    if (tabela < 0 || tabela >= TOTAL_TABELAS) return FORMATO_DESCONHECIDO;
+    travarLeitura(tabela);
+    int formato = formatoArquivo(tabela);
+    destravar(tabela);
+    return formato;
+}
+
+// 'tam_long_origem': tamanho do long (4 ou 8) no programa que gravou um .dat sem
+// cabeçalho; 0 = o deste programa. Retorna quantos registros foram convertidos (0 se já
+// estava no formato atual, -1 se falhar)
+int migrarTabela(int tabela, int tam_long_origem) {
+    if (tabela < 0 || tabela >= TOTAL_TABELAS) return -1;
+    if (tam_long_origem == 0) tam_long_origem = (int)sizeof(long);
+    if (tam_long_origem != 4 && tam_long_origem != 8) return -1;
+    // Sem recuperarMatriculas antes: o journal só pode ser aplicado no formato novo
+    travarEscrita(tabela);
+    long convertidos = migrarTravado(tabela, (size_t)tam_long_origem);
+    if (tabela == TABELA_MATRICULAS && convertidos >= 0) recuperarMatriculas();
+    destravar(tabela);
+    return (int)convertidos;
+}
+
+// Confere a soma de cada bloco do .dat com o .sum. Guarda em 'blocos_ruins' (até 'max')
+// o número dos blocos que não conferem; o bloco b tem os registros de
+// b * REGISTROS_POR_BLOCO em diante. Retorna quantos blocos não conferem (-1 se o .dat
+// não está no formato atual). Sem .sum (ou com um .sum atrasado) as somas são refeitas e
+// não há o que comparar
+int verificarTabela(int tabela, long* blocos_ruins, int max) {
+    if (tabela < 0 || tabela >= TOTAL_TABELAS) return -1;
+    if (tabela == TABELA_MATRICULAS) travarEscritaMatriculas();
+    else travarEscrita(tabela);
+    const Tabela* t = &TABELAS[tabela];
+    CabecalhoDados cab;
+    FILE *dados = abrirDados(tabela, "rb", 0, &cab);
+    if (dados == NULL) {
+        destravar(tabela);
+        return formatoArquivo(tabela) == FORMATO_ATUAL ? 0 : -1;
+    }
+    long registros = (long)cab.registros;
+    int ruins = 0;
+    CabecalhoSomas somas;
+    FILE *f = abrirArquivo(t->arquivo_somas, "rb");
+    char* buffer = malloc(t->tam_registro * REGISTROS_POR_BLOCO);
+    if (f == NULL || buffer == NULL || !lerCabecalhoSomas(f, &somas) || somas.registros != registros) {
+        if (buffer != NULL) reconstruirSomas(tabela, dados, registros);
+        else ruins = -1;
+    } else {
+        for (long b = 0; b < totalBlocos(registros); b++) {
+            uint32_t gravada = 0, calculada = 0;
+            fseek(f, (long)sizeof(CabecalhoSomas) + b * (long)sizeof(uint32_t), SEEK_SET);
+            int confere = fread(&gravada, sizeof(gravada), 1, f) == 1
+                          && somarBloco(dados, t, b, registros, buffer, &calculada) && gravada == calculada;
+            if (confere) continue;
+            if (ruins < max && blocos_ruins != NULL) blocos_ruins[ruins] = b;
+            ruins++;
+        }
+    }
+    if (f != NULL) fecharArquivo(f);
+    free(buffer);
+    fecharArquivo(dados);
+    destravar(tabela);
+    return ruins;
+}
+
+// --- 13. SESSÃO ---
+// Para várias operações seguidas (uma ação da interface, uma importação) reaproveitarem
+// os mesmos arquivos abertos. Pode ser aninhada: só o último fecharBanco fecha tudo.
+int abrirBanco(void) {
+    profundidade_sessao++;
+    return 1;
+}
+
+void fecharBanco(void) {
+    if (profundidade_sessao == 0) return;
+    if (--profundidade_sessao > 0) return;
+    for (int i = 0; i < total_arquivos_sessao; i++) {
+        // Um arquivo ainda emprestado (ex.: cursor aberto) é fechado pelo próprio dono
+        if (!arquivos_sessao[i].em_uso) fclose(arquivos_sessao[i].f);
+    }
+    total_arquivos_sessao = 0;
+}
+
+// --- 14. CONTADORES DE E/S ---
+// Totais desde que a biblioteca foi carregada; quem mede uma chamada lê antes e depois
+void lerContadores(ContadoresES* saida) {
+    *saida = contadores;
+}
@@ -0,0 +1,1204 @@
+# Motor de armazenamento em Python puro (struct + mmap), com as mesmas funções da
+# biblioteca database.c: serve onde ela não foi compilada e para comparar os dois motores
+# (benchmark.py). Escolha com SGA_MOTOR=python ou, na linha de comando, --motor python.
+#
+# Os arquivos são os mesmos da biblioteca (.dat com cabeçalho, .sum, matriculas.jnl,
+# sequencias.dat e as travas em sga.lock), então os dois motores podem usar a mesma pasta,
+# até ao mesmo tempo. Os índices deste motor ficam só na memória do processo e são refeitos
+# quando o .dat muda por fora; os .idx da biblioteca são descartados quando este motor
+# altera um registro no meio do arquivo (acréscimos no fim ela percebe sozinha).
+import ctypes
+import mmap
+import os
+import struct
+
+try:
+    import numpy as np
+except ImportError:  # sem NumPy as somas dos blocos são calculadas uma a uma
+    np = None
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from servico import (ARQUIVOS_TABELAS, APAGADO, CabecalhoDados, TAMANHO_CABECALHO, MAGICA_DADOS, VERSAO_FORMATO,
+                     REGISTROS_POR_BLOCO, FORMATO_ATUAL, FORMATO_ANTIGO, FORMATO_DESCONHECIDO, FNV_INICIAL,
+                     TABELA_ALUNOS, TABELA_TURMAS, TABELA_MATERIAS, TABELA_MATRICULAS, TABELA_GRADE,
+                     SITUACOES, Aluno, Matricula, Estatistica, ContadoresES, hash_fnv, soma_cabecalho,
+                     situacao_status, faixa_nota)
+
+# --- 1. Arquivos (os mesmos nomes de database.c) ---
+TOTAL_TABELAS = len(ARQUIVOS_TABELAS)
+ARQUIVOS_SOMAS = {tabela: arquivo[:-len(".dat")] + ".sum" for tabela, (arquivo, _) in ARQUIVOS_TABELAS.items()}
+INDICES_BIBLIOTECA = {
+    TABELA_ALUNOS: ("alunos_ra.idx", "alunos_cpf.idx"),
+    TABELA_MATRICULAS: ("matriculas_chave.idx", "matriculas_aluno.idx", "matriculas_turma.idx", "matriculas_status.idx"),
+}
+MATRICULAS_JNL = "matriculas.jnl"
+TRAVAS_DB = "sga.lock"
+SEQUENCIAS_DB = "sequencias.dat"
+
+# O primeiro campo de Aluno e Matricula é long: 4 bytes no Windows, 8 no Linux
+TABELAS_CHAVE_LONG = (TABELA_ALUNOS, TABELA_MATRICULAS)
+TAMANHO_LONG = ctypes.sizeof(ctypes.c_long)
+
+TRAVA_SEQUENCIAS = TOTAL_TABELAS
+PRIMEIRO_RA = 100000
+PRIMEIRO_ID = 1
+LIMITE_ESPACO_MORTO = 25
+MINIMO_COMPACTACAO = 64
+MAGICA_SOMAS = b"SUM1"
+MAGICA_JOURNAL = b"JNL1"
+TAMANHO_BUFFER_ESCRITA = 1 << 20
+
+class CabecalhoSomas(ctypes.Structure):
+    _fields_ = [("magica", ctypes.c_char * 4), ("registros_por_bloco", ctypes.c_uint32), ("registros", ctypes.c_int64)]
+
+class CabecalhoJournal(ctypes.Structure):
+    _fields_ = [("magica", ctypes.c_char * 4), ("quantidade", ctypes.c_long), ("tam_registro", ctypes.c_long)]
+
+SOMA = struct.Struct("=I")
+POSICAO_JOURNAL = struct.Struct("=q" if TAMANHO_LONG == 8 else "=i")
+
+# Formato struct equivalente à struct ctypes (mesmos offsets, sem alinhamento automático)
+def formato_struct(tipo):
+    partes, fim = [], 0
+    for nome, tipo_campo in tipo._fields_:
+        campo = getattr(tipo, nome)
+        if campo.offset > fim: partes.append(f"{campo.offset - fim}x")
+        if tipo_campo is ctypes.c_float: partes.append("f")
+        elif issubclass(tipo_campo, ctypes.Array): partes.append(f"{campo.size}s")
+        else: partes.append({4: "i", 8: "q"}[campo.size])
+        fim = campo.offset + campo.size
+    if ctypes.sizeof(tipo) > fim: partes.append(f"{ctypes.sizeof(tipo) - fim}x")
+    return struct.Struct("=" + "".join(partes))
+
+# Registro apagado: a chave (primeiro campo) vale APAGADO
+def marca_apagado(tabela):
+    return struct.pack("=q" if tabela in TABELAS_CHAVE_LONG and TAMANHO_LONG == 8 else "=i", APAGADO)
+
+def texto(valor):
+    return valor.split(b"\0", 1)[0]
+
+# Mesmo corte do strncpy da biblioteca (o último byte do campo fica para o '\0')
+def texto_campo(valor, tipo, campo):
+    return texto(valor)[:getattr(tipo, campo).size - 1]
+
+# Contadores de E/S (os mesmos da biblioteca, ver lerContadores): toda leitura e escrita
+# de arquivo passa por ler()/gravar(); os registros lidos do mapeamento contam em EstadoTabela
+contadores = ContadoresES()
+
+def ler(f, n=-1):
+    dados = f.read(n)
+    contadores.bytes_lidos += len(dados)
+    return dados
+
+def gravar(f, dados):
+    contadores.bytes_gravados += memoryview(dados).nbytes
+    return f.write(dados)
+
+def contar_registros(quantidade, tam):
+    contadores.registros_examinados += quantidade
+    contadores.bytes_lidos += quantidade * tam
+
+def destino(ponteiro):
+    if hasattr(ponteiro, "_obj"): return ponteiro._obj         # ctypes.byref(...)
+    if hasattr(ponteiro, "contents"): return ponteiro.contents  # ctypes.pointer(...)
+    return ponteiro
+
+def copiar_para(buffer, i, dados, tam):
+    ctypes.memmove(ctypes.addressof(buffer) + i * tam, dados, tam)
+
+# --- 2. Cabeçalho e somas de verificação (2.2 de database.c) ---
+def novo_cabecalho(tabela):
+    cab = CabecalhoDados()
+    cab.magica = MAGICA_DADOS
+    cab.versao = VERSAO_FORMATO
+    cab.tabela = tabela
+    cab.tam_registro = ctypes.sizeof(ARQUIVOS_TABELAS[tabela][1])
+    return cab
+
+def tamanho_com_long(tabela, tam_long):
+    tam = ctypes.sizeof(ARQUIVOS_TABELAS[tabela][1])
+    return tam - TAMANHO_LONG + tam_long if tabela in TABELAS_CHAVE_LONG else tam
+
+# (formato, cabeçalho). Arquivo vazio conta como atual, sem registros
+def ler_cabecalho_dados(f, tabela):
+    cab = novo_cabecalho(tabela)
+    f.seek(0, os.SEEK_END)
+    if f.tell() == 0: return FORMATO_ATUAL, cab
+    f.seek(0)
+    dados = ler(f, TAMANHO_CABECALHO)
+    if len(dados) < TAMANHO_CABECALHO or dados[:4] != MAGICA_DADOS: return FORMATO_ANTIGO, cab
+    lido = CabecalhoDados.from_buffer_copy(dados)
+    if (lido.soma != soma_cabecalho(lido) or lido.versao != VERSAO_FORMATO or lido.tabela != tabela
+            or lido.registros < 0):
+        return FORMATO_DESCONHECIDO, lido
+    if lido.tam_registro == cab.tam_registro: return FORMATO_ATUAL, lido
+    antigo = lido.tam_registro in (tamanho_com_long(tabela, 4), tamanho_com_long(tabela, 8))
+    return (FORMATO_ANTIGO if antigo else FORMATO_DESCONHECIDO), lido
+
+def gravar_cabecalho_dados(f, cab):
+    cab.geracao = (cab.geracao + 1) & 0xFFFFFFFF
+    cab.soma = soma_cabecalho(cab)
+    f.seek(0)
+    gravar(f, bytes(cab))
+
+def inicio_registro(pos, tam):
+    return TAMANHO_CABECALHO + pos * tam
+
+def total_blocos(registros):
+    return (registros + REGISTROS_POR_BLOCO - 1) // REGISTROS_POR_BLOCO
+
+# A partir daqui as somas de vários blocos cheios saem juntas no NumPy (uma coluna de
+# bytes por vez, todos os blocos em paralelo); com poucos blocos o laço simples ganha
+MINIMO_BLOCOS_NUMPY = 16
+
+# {bloco: bytes do bloco} -> {bloco: soma FNV}
+def somar_blocos(blocos):
+    somas, cheios = {}, []
+    largura = max((len(dados) for dados in blocos.values()), default=0)
+    for bloco, dados in blocos.items():
+        if np is not None and len(dados) == largura: cheios.append(bloco)
+        else: somas[bloco] = hash_fnv(dados)
+    if len(cheios) < MINIMO_BLOCOS_NUMPY:
+        somas.update((bloco, hash_fnv(blocos[bloco])) for bloco in cheios)
+    elif cheios:
+        matriz = np.stack([np.frombuffer(blocos[bloco], np.uint8) for bloco in cheios])
+        h = np.full(len(cheios), FNV_INICIAL, np.uint32)
+        primo = np.uint32(16777619)
+        for coluna in matriz.T:
+            h = (h ^ coluna) * primo
+        somas.update(zip(cheios, h.tolist()))
+    return somas
+
+def ler_blocos(dados, tam, registros, blocos):
+    lidos = {}
+    for bloco in blocos:
+        de = bloco * REGISTROS_POR_BLOCO
+        qtd = min(REGISTROS_POR_BLOCO, registros - de)
+        dados.seek(inicio_registro(de, tam))
+        lidos[bloco] = ler(dados, qtd * tam)
+        contadores.registros_examinados += len(lidos[bloco]) // tam
+    return lidos
+
+# Blocos por vez ao refazer um .sum inteiro (a memória não cresce com o arquivo)
+BLOCOS_POR_LEITURA = 1024
+
+def reconstruir_somas(tabela, dados, registros):
+    tam = ctypes.sizeof(ARQUIVOS_TABELAS[tabela][1])
+    arquivo = ARQUIVOS_SOMAS[tabela]
+    temp = f"{arquivo}.{os.getpid()}.tmp"
+    try:
+        with open(temp, "wb") as out:
+            gravar(out, bytes(CabecalhoSomas(MAGICA_SOMAS, REGISTROS_POR_BLOCO, registros)))
+            for inicio in range(0, total_blocos(registros), BLOCOS_POR_LEITURA):
+                faixa = range(inicio, min(inicio + BLOCOS_POR_LEITURA, total_blocos(registros)))
+                somas = somar_blocos(ler_blocos(dados, tam, registros, faixa))
+                gravar(out, b"".join(SOMA.pack(somas[bloco]) for bloco in faixa))
+        os.replace(temp, arquivo)
+    except OSError:
+        if os.path.exists(temp): os.remove(temp)
+
+# Mesma regra de atualizarSomas: refaz os blocos das posições alteradas ('posicoes' None =
+# acréscimo de 'antes' até 'depois'); um .sum que não estava em dia é refeito inteiro
+def atualizar_somas(tabela, dados, antes, depois, posicoes=None):
+    tam = ctypes.sizeof(ARQUIVOS_TABELAS[tabela][1])
+    arquivo = ARQUIVOS_SOMAS[tabela]
+    if antes == 0 and not os.path.exists(arquivo): open(arquivo, "ab").close()
+    try:
+        f = open(arquivo, "r+b")
+    except OSError:
+        return reconstruir_somas(tabela, dados, depois)
+    with f:
+        lido = ler(f, ctypes.sizeof(CabecalhoSomas))
+        if len(lido) == ctypes.sizeof(CabecalhoSomas):
+            cab = CabecalhoSomas.from_buffer_copy(lido)
+            em_dia = cab.magica == MAGICA_SOMAS and cab.registros_por_bloco == REGISTROS_POR_BLOCO and cab.registros == antes
+        else:
+            cab = CabecalhoSomas(MAGICA_SOMAS, REGISTROS_POR_BLOCO, 0)
+            em_dia = antes == 0 and not lido
+        if em_dia:
+            alteradas = range(antes, depois) if posicoes is None else posicoes
+            blocos = sorted({pos // REGISTROS_POR_BLOCO for pos in alteradas})
+            for bloco, soma in somar_blocos(ler_blocos(dados, tam, depois, blocos)).items():
+                f.seek(ctypes.sizeof(CabecalhoSomas) + bloco * SOMA.size)
+                gravar(f, SOMA.pack(soma))
+            cab.registros = depois
+            f.seek(0)
+            gravar(f, bytes(cab))
+            return
+    reconstruir_somas(tabela, dados, depois)
+
+def sincronizar(f):
+    f.flush()
+    os.fsync(f.fileno())
+
+def remover(arquivo):
+    try:
+        os.remove(arquivo)
+    except FileNotFoundError:
+        pass
+
+# --- 3. Travas entre processos (mesmos bytes de sga.lock que a biblioteca usa) ---
+# No Linux, fcntl (as mesmas travas da biblioteca). No Windows o msvcrt só tem trava
+# exclusiva, então lá quem lê também espera os outros leitores
+class Travas:
+    def __init__(self):
+        self.fd = None
+        self.contagem = [0] * (TOTAL_TABELAS + 1)
+
+    def abrir(self):
+        if self.fd is None:
+            try:
+                self.fd = os.open(TRAVAS_DB, os.O_RDWR | os.O_CREAT, 0o644)
+            except OSError:
+                return False  # pasta só leitura: segue sem travas, como a biblioteca
+        return True
+
+    def travar(self, tabela, exclusiva):
+        self.contagem[tabela] += 1
+        if self.contagem[tabela] > 1 or not self.abrir(): return
+        if fcntl is not None:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX if exclusiva else fcntl.LOCK_SH, 1, tabela, os.SEEK_SET)
+            return
+        while True:
+            os.lseek(self.fd, tabela, os.SEEK_SET)
+            try:
+                msvcrt.locking(self.fd, msvcrt.LK_LOCK, 1)
+                return
+            except OSError:  # LK_LOCK desiste depois de 10 tentativas
+                continue
+
+    def destravar(self, tabela):
+        if self.contagem[tabela] == 0: return
+        self.contagem[tabela] -= 1
+        if self.contagem[tabela] > 0 or not self.abrir(): return
+        if fcntl is not None:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN, 1, tabela, os.SEEK_SET)
+        else:
+            os.lseek(self.fd, tabela, os.SEEK_SET)
+            msvcrt.locking(self.fd, msvcrt.LK_UNLCK, 1)
+
+# --- 4. Estado de cada tabela: mapeamento do .dat e índices em memória ---
+class EstadoTabela:
+    def __init__(self, tabela):
+        self.tabela = tabela
+        self.arquivo, self.tipo = ARQUIVOS_TABELAS[tabela]
+        self.tam = ctypes.sizeof(self.tipo)
+        self.formato = formato_struct(self.tipo)
+        self.marca = marca_apagado(tabela)
+        self.f = self.mapa = None
+        self.formato_arquivo = FORMATO_ATUAL
+        self.registros = 0
+        self.assinatura = None   # (inode, geração, registros) do .dat mapeado
+        self.indices = None      # montados na primeira consulta
+
+    def fechar(self):
+        if self.mapa is not None: self.mapa.close()
+        if self.f is not None: self.f.close()
+        self.f = self.mapa = None
+        self.assinatura = None
+
+    def ler_assinatura(self, inode):
+        self.f.seek(0)
+        cab = CabecalhoDados.from_buffer_copy(ler(self.f, TAMANHO_CABECALHO).ljust(TAMANHO_CABECALHO, b"\0"))
+        return (inode, cab.geracao, cab.registros)
+
+    # Remapeia se o .dat mudou desde a última vez, por este ou por outro processo: arquivo
+    # trocado (compactação, migração) ou outra geração no cabeçalho (qualquer gravação)
+    def atualizar(self, manter_indices=False):
+        try:
+            inode = os.stat(self.arquivo).st_ino
+        except FileNotFoundError:
+            inode = None
+        if inode is None and self.f is None: return self
+        if inode is not None and self.f is not None and self.assinatura[0] == inode:
+            if self.ler_assinatura(inode) == self.assinatura: return self
+        indices = self.indices if manter_indices else None
+        self.fechar()
+        self.formato_arquivo, self.registros, self.indices = FORMATO_ATUAL, 0, indices
+        if inode is None: return self
+        self.f = open(self.arquivo, "rb", buffering=0)  # sem buffer: o cabeçalho é relido a cada chamada
+        self.assinatura = self.ler_assinatura(inode)
+        self.formato_arquivo, cab = ler_cabecalho_dados(self.f, self.tabela)
+        tamanho = os.fstat(self.f.fileno()).st_size
+        if self.formato_arquivo == FORMATO_ATUAL and tamanho > 0:
+            self.mapa = mmap.mmap(self.f.fileno(), tamanho, access=mmap.ACCESS_READ)
+            # Nunca além do que está no arquivo (cabeçalho à frente de um .dat truncado)
+            self.registros = min(cab.registros, (tamanho - TAMANHO_CABECALHO) // self.tam)
+        return self
+
+    @property
+    def legivel(self):
+        return self.formato_arquivo == FORMATO_ATUAL
+
+    # contar=False quando o registro já entrou nos contadores por percorrer()
+    def bytes_registro(self, pos, contar=True):
+        if contar: contar_registros(1, self.tam)
+        inicio = inicio_registro(pos, self.tam)
+        return self.mapa[inicio:inicio + self.tam]
+
+    def registro(self, pos):
+        contar_registros(1, self.tam)
+        return self.tipo.from_buffer_copy(self.mapa, inicio_registro(pos, self.tam))
+
+    # (posição, campos) de todos os registros, apagados incluídos. Nos contadores entram
+    # só os registros que quem chamou chegou a pedir (o cursor para no fim do lote)
+    def percorrer(self, de=0):
+        if self.mapa is None or de >= self.registros: return
+        pos = de - 1
+        with memoryview(self.mapa) as vista:
+            area = vista[inicio_registro(de, self.tam):inicio_registro(self.registros, self.tam)]
+            try:
+                for pos, campos in enumerate(self.formato.iter_unpack(area), de): yield pos, campos
+            finally:
+                contar_registros(pos + 1 - de, self.tam)
+            area.release()
+
+    def apagado(self, campos):
+        return campos[0] == APAGADO
+
+# Índices em memória. Alunos: RA e CPF -> primeira posição. Matrículas: chave -> primeira
+# posição; aluno, (turma, matéria) e status -> posições em ordem, como os .idx da biblioteca
+def indices_vazios(tabela):
+    if tabela == TABELA_ALUNOS: return {"ra": {}, "cpf": {}}
+    if tabela == TABELA_MATRICULAS: return {"chave": {}, "aluno": {}, "turma": {}, "status": {}}
+    return {}
+
+def indexar(tabela, indices, pos, campos):
+    if tabela == TABELA_ALUNOS:
+        indices["ra"].setdefault(campos[0], pos)
+        indices["cpf"].setdefault(texto(campos[2]), pos)
+    elif tabela == TABELA_MATRICULAS:
+        ra, turma, materia = campos[0], campos[1], campos[2]
+        indices["chave"].setdefault((ra, turma, materia), pos)
+        indices["aluno"].setdefault(ra, []).append(pos)
+        indices["turma"].setdefault(turma, {}).setdefault(materia & 0xFFFFFFFF, []).append(pos)
+        indices["status"].setdefault(texto(campos[8]), []).append(pos)
+
+# --- 5. Estatísticas das matrículas (2.7 de database.c) ---
+# O mesmo matriculas.est da biblioteca: cabeçalho, uma linha por situação e a tabela hash
+# das (turma, matéria). Vale enquanto a geração e a contagem gravadas nele forem as do .dat
+MATRICULAS_EST = "matriculas.est"
+MAGICA_ESTATISTICAS = b"EST1"
+LIMITE_AJUSTES_ESTATISTICAS = 1024
+TAMANHO_ESTATISTICA = ctypes.sizeof(Estatistica)
+
+class CabecalhoEstatisticas(ctypes.Structure):
+    _fields_ = [("magica", ctypes.c_char * 4), ("geracao", ctypes.c_uint32), ("registros", ctypes.c_int64),
+                ("capacidade", ctypes.c_int32), ("grupos", ctypes.c_int32), ("reservado", ctypes.c_char * 8)]
+
+# Linha 0 a len(SITUACOES) - 1: situações; depois, as posições da tabela hash
+def inicio_estatistica(linha):
+    return ctypes.sizeof(CabecalhoEstatisticas) + linha * TAMANHO_ESTATISTICA
+
+def hash_grupo(id_turma, id_materia):
+    return hash_fnv(struct.pack("=ii", id_turma, id_materia))
+
+def capacidade_hash(n):
+    cap = 64
+    while cap < n * 2: cap *= 2
+    return cap
+
+# 'campos' de uma matrícula (formato_struct): soma (sinal = 1) ou tira (sinal = -1) dos totais
+def somar_estatistica(e, campos, sinal):
+    np1, np2, pim, faltas, media, status = campos[3:9]
+    e.matriculas += sinal
+    e.por_situacao[situacao_status(texto(status))] += sinal
+    e.soma_np1 += sinal * np1
+    e.soma_np2 += sinal * np2
+    e.soma_pim += sinal * pim
+    e.soma_media += sinal * media
+    e.soma_faltas += sinal * faltas
+    e.faixas_np1[faixa_nota(np1)] += sinal
+    e.faixas_np2[faixa_nota(np2)] += sinal
+    e.faixas_pim[faixa_nota(pim)] += sinal
+
+def ler_cabecalho_estatisticas(f):
+    f.seek(0)
+    dados = ler(f, ctypes.sizeof(CabecalhoEstatisticas))
+    if len(dados) < ctypes.sizeof(CabecalhoEstatisticas): return None
+    cab = CabecalhoEstatisticas.from_buffer_copy(dados)
+    return cab if cab.magica == MAGICA_ESTATISTICAS and cab.capacidade > 0 else None
+
+# Cabeçalho atual do matriculas.dat (sem o arquivo, um vazio); None se não está no formato atual
+def cabecalho_matriculas():
+    try:
+        f = open(ARQUIVOS_TABELAS[TABELA_MATRICULAS][0], "rb")
+    except FileNotFoundError:
+        return novo_cabecalho(TABELA_MATRICULAS)
+    with f:
+        formato, cab = ler_cabecalho_dados(f, TABELA_MATRICULAS)
+    return cab if formato == FORMATO_ATUAL else None
+
+def em_dia(cab, dados):
+    return cab is not None and dados is not None and (cab.geracao, cab.registros) == (dados.geracao, dados.registros)
+
+def ler_estatistica(f, linha):
+    f.seek(inicio_estatistica(linha))
+    dados = ler(f, TAMANHO_ESTATISTICA)
+    return Estatistica.from_buffer_copy(dados) if len(dados) == TAMANHO_ESTATISTICA else None
+
+def gravar_estatistica(f, linha, e):
+    f.seek(inicio_estatistica(linha))
+    gravar(f, bytes(e))
+
+# Ajuste dos totais durante uma gravação de matrículas (mesma regra de database.c): criado
+# antes de mexer no .dat, 'ajustar' com cada registro que saiu ou entrou depois que a
+# gravação deu certo e 'terminar' no fim
+class AjusteEstatisticas:
+    def __init__(self, quantidade):
+        self.f, self.cab, self.falhou = None, None, False
+        if quantidade > LIMITE_AJUSTES_ESTATISTICAS: return
+        try:
+            self.f = open(MATRICULAS_EST, "r+b")
+        except OSError:
+            return
+        self.cab = ler_cabecalho_estatisticas(self.f)
+        if not em_dia(self.cab, cabecalho_matriculas()):
+            self.f.close()
+            self.f = None
+
+    def ajustar(self, campos, sinal):
+        if self.f is None or self.falhou: return
+        situacao = situacao_status(texto(campos[8]))
+        e = ler_estatistica(self.f, situacao)
+        if e is None:
+            self.falhou = True
+            return
+        somar_estatistica(e, campos, sinal)
+        gravar_estatistica(self.f, situacao, e)
+        id_turma, id_materia, cap = campos[1], campos[2], self.cab.capacidade
+        s = hash_grupo(id_turma, id_materia) & (cap - 1)
+        while True:
+            e = ler_estatistica(self.f, len(SITUACOES) + s)
+            if e is None:
+                self.falhou = True
+                return
+            if not e.usado or (e.id_turma, e.id_materia) == (id_turma, id_materia): break
+            s = (s + 1) & (cap - 1)
+        if not e.usado:
+            # Sem lugar para uma turma/matéria nova: o .est fica velho e é refeito maior
+            if sinal < 0 or (self.cab.grupos + 1) * 2 > cap:
+                self.falhou = True
+                return
+            e = Estatistica(id_turma=id_turma, id_materia=id_materia, usado=1)
+            self.cab.grupos += 1
+        somar_estatistica(e, campos, sinal)
+        gravar_estatistica(self.f, len(SITUACOES) + s, e)
+
+    def terminar(self, gravou):
+        if self.f is None: return
+        with self.f:
+            if not gravou: return
+            dados = cabecalho_matriculas()
+            if self.falhou or dados is None:
+                self.cab.registros = -1
+            else:
+                self.cab.geracao, self.cab.registros = dados.geracao, dados.registros
+            self.f.seek(0)
+            gravar(self.f, bytes(self.cab))
+
+# --- 6. O motor ---
+class Cursor:
+    def __init__(self, tabela):
+        self.tabela = tabela
+        self.proximo = 0
+
+class MotorPython:
+    def __init__(self):
+        self.travas = Travas()
+        self.estados = [EstadoTabela(tabela) for tabela in range(TOTAL_TABELAS)]
+
+    # --- Travas e journal ---
+    def travar_leitura(self, tabela):
+        if tabela == TABELA_MATRICULAS and self.travas.contagem[tabela] == 0 and os.path.exists(MATRICULAS_JNL):
+            self.travar_escrita(tabela)  # termina o journal antes (como travarLeituraMatriculas)
+            self.travas.destravar(tabela)
+        self.travas.travar(tabela, False)
+
+    def travar_escrita(self, tabela):
+        self.travas.travar(tabela, True)
+        if tabela == TABELA_MATRICULAS and self.aplicar_journal():
+            self.invalidar_indices(TABELA_MATRICULAS)
+            remover(MATRICULAS_JNL)
+
+    def estado(self, tabela):
+        return self.estados[tabela].atualizar()
+
+    # Índices deste processo, montados numa passada pelo .dat se ainda não existem
+    def indices(self, tabela):
+        e = self.estado(tabela)
+        if e.indices is None:
+            e.indices = indices_vazios(tabela)
+            for pos, campos in e.percorrer():
+                if not e.apagado(campos): indexar(tabela, e.indices, pos, campos)
+        return e.indices
+
+    def invalidar_indices(self, tabela):
+        self.estados[tabela].indices = None
+        for arquivo in INDICES_BIBLIOTECA.get(tabela, ()): remover(arquivo)
+
+    def abrir_dados(self, tabela, criar=False):
+        arquivo = ARQUIVOS_TABELAS[tabela][0]
+        if criar and not os.path.exists(arquivo): open(arquivo, "ab").close()
+        try:
+            f = open(arquivo, "r+b", buffering=TAMANHO_BUFFER_ESCRITA)
+        except FileNotFoundError:
+            return None, None
+        formato, cab = ler_cabecalho_dados(f, tabela)
+        if formato != FORMATO_ATUAL:
+            f.close()
+            return None, None
+        return f, cab
+
+    # Acrescenta depois do último registro completo: registros, somas e só então a contagem.
+    # Retorna a posição do primeiro (-1 se falhar)
+    def anexar(self, tabela, dados, n):
+        f, cab = self.abrir_dados(tabela, criar=True)
+        if f is None: return -1
+        with f:
+            pos = cab.registros
+            tam = ctypes.sizeof(ARQUIVOS_TABELAS[tabela][1])
+            f.seek(inicio_registro(pos, tam))
+            gravar(f, dados)
+            f.flush()
+            atualizar_somas(tabela, f, pos, pos + n)
+            cab.registros = pos + n
+            gravar_cabecalho_dados(f, cab)
+        e = self.estados[tabela]
+        indices = e.indices if e.indices is not None and e.registros == pos else None
+        e.indices = indices
+        e.atualizar(manter_indices=True)
+        if indices is not None:
+            for p, campos in e.percorrer(pos): indexar(tabela, indices, p, campos)
+        return pos
+
+    # Sobrescreve registros no meio do .dat (posições em ordem, podendo passar do fim)
+    def sobrescrever(self, tabela, f, cab, posicoes, registros):
+        tam = ctypes.sizeof(ARQUIVOS_TABELAS[tabela][1])
+        antes = depois = cab.registros
+        for pos, dados in zip(posicoes, registros):
+            f.seek(inicio_registro(pos, tam))
+            gravar(f, dados)
+            depois = max(depois, pos + 1)
+        f.flush()
+        atualizar_somas(tabela, f, antes, depois, posicoes)
+        cab.registros = depois
+        gravar_cabecalho_dados(f, cab)
+        sincronizar(f)
+
+    def gravar_journal(self, posicoes, registros):
+        cab = bytes(CabecalhoJournal(MAGICA_JOURNAL, len(posicoes), ctypes.sizeof(Matricula)))
+        partes, soma = [cab], hash_fnv(cab)
+        for pos, dados in zip(posicoes, registros):
+            pos = POSICAO_JOURNAL.pack(pos)
+            soma = hash_fnv(dados, hash_fnv(pos, soma))
+            partes += [pos, dados]
+        partes.append(SOMA.pack(soma))
+        try:
+            with open(MATRICULAS_JNL, "wb") as f:
+                gravar(f, b"".join(partes))
+                sincronizar(f)
+        except OSError:
+            remover(MATRICULAS_JNL)
+            return False
+        return True
+
+    # Refaz as escritas de um journal completo. False se não havia journal, se ele estava
+    # incompleto (e foi apagado) ou se o .dat ainda está no formato antigo
+    def aplicar_journal(self):
+        try:
+            with open(MATRICULAS_JNL, "rb") as f:
+                conteudo = ler(f)
+        except FileNotFoundError:
+            return False
+        tam_cab, tam = ctypes.sizeof(CabecalhoJournal), ctypes.sizeof(Matricula)
+        cab = CabecalhoJournal.from_buffer_copy(conteudo[:tam_cab].ljust(tam_cab, b"\0"))
+        par = POSICAO_JOURNAL.size + tam
+        valido = (cab.magica == MAGICA_JOURNAL and cab.quantidade >= 0 and cab.tam_registro == tam
+                  and len(conteudo) >= tam_cab + cab.quantidade * par + SOMA.size)
+        if valido:
+            fim = tam_cab + cab.quantidade * par
+            soma = SOMA.unpack_from(conteudo, fim)[0]
+            valido = hash_fnv(conteudo[tam_cab:fim], hash_fnv(conteudo[:tam_cab])) == soma
+        if not valido:
+            remover(MATRICULAS_JNL)
+            return False
+        posicoes, registros = [], []
+        for i in range(cab.quantidade):
+            inicio = tam_cab + i * par
+            posicoes.append(POSICAO_JOURNAL.unpack_from(conteudo, inicio)[0])
+            registros.append(conteudo[inicio + POSICAO_JOURNAL.size:inicio + par])
+        f, cab_dados = self.abrir_dados(TABELA_MATRICULAS, criar=True)
+        if f is None: return False
+        with f:
+            self.sobrescrever(TABELA_MATRICULAS, f, cab_dados, posicoes, registros)
+        return True
+
+    # Matrículas: journal, .dat e só então o journal sai. Retorna True se gravou
+    def gravar_matriculas(self, posicoes, registros):
+        ok = self.gravar_journal(posicoes, registros) and self.aplicar_journal()
+        if ok: remover(MATRICULAS_JNL)
+        return ok
+
+    # --- Sessão (cada chamada já reaproveita o mapeamento; nada a guardar) ---
+    def abrirBanco(self):
+        return 1
+
+    def fecharBanco(self):
+        pass
+
+    # --- Cadastros ---
+    def avancar_sequencia(self, tabela, chave):
+        self.travas.travar(TRAVA_SEQUENCIAS, True)
+        try:
+            proximo = self.ler_sequencia(tabela)
+            if proximo > 0 and chave >= proximo: self.gravar_sequencia(tabela, chave + 1)
+        finally:
+            self.travas.destravar(TRAVA_SEQUENCIAS)
+
+    def salvar(self, tabela, registros, n):
+        if n <= 0: return 0
+        self.travar_escrita(tabela)
+        try:
+            ajuste = AjusteEstatisticas(n) if tabela == TABELA_MATRICULAS else None
+            pos = self.anexar(tabela, b"".join(bytes(r) for r in registros[:n]), n)
+            if ajuste is not None:
+                formato = self.estados[tabela].formato
+                for r in registros[:n] if pos >= 0 else ():
+                    ajuste.ajustar(formato.unpack(bytes(r)), 1)
+                ajuste.terminar(pos >= 0)
+            if pos >= 0 and tabela in (TABELA_ALUNOS, TABELA_TURMAS, TABELA_MATERIAS):
+                chaves = (getattr(r, r._fields_[0][0]) for r in registros[:n])
+                self.avancar_sequencia(tabela, max(chaves))
+            return -1 if pos < 0 else n
+        finally:
+            self.travas.destravar(tabela)
+
+    def salvarAluno(self, aluno): self.salvar(TABELA_ALUNOS, [aluno], 1)
+    def salvarTurma(self, turma): self.salvar(TABELA_TURMAS, [turma], 1)
+    def salvarMateria(self, materia): self.salvar(TABELA_MATERIAS, [materia], 1)
+    def salvarMatricula(self, matricula): self.salvar(TABELA_MATRICULAS, [matricula], 1)
+    def salvarTurmaMateria(self, tm): self.salvar(TABELA_GRADE, [tm], 1)
+
+    def salvarAlunosLote(self, alunos, n): return self.salvar(TABELA_ALUNOS, alunos, n)
+    def salvarTurmasLote(self, turmas, n): return self.salvar(TABELA_TURMAS, turmas, n)
+    def salvarMateriasLote(self, materias, n): return self.salvar(TABELA_MATERIAS, materias, n)
+    def salvarTurmaMateriaLote(self, ligacoes, n): return self.salvar(TABELA_GRADE, ligacoes, n)
+    def salvarMatriculasLote(self, matriculas, n): return self.salvar(TABELA_MATRICULAS, matriculas, n)
+
+    def carregar(self, tabela, buffer, maximo):
+        self.travar_leitura(tabela)
+        try:
+            e, total = self.estado(tabela), 0
+            for pos, campos in e.percorrer():
+                if total >= maximo: break
+                if e.apagado(campos): continue
+                copiar_para(buffer, total, e.bytes_registro(pos, contar=False), e.tam)
+                total += 1
+            return total
+        finally:
+            self.travas.destravar(tabela)
+
+    def carregarAlunos(self, buffer, maximo): return self.carregar(TABELA_ALUNOS, buffer, maximo)
+    def carregarTurmas(self, buffer, maximo): return self.carregar(TABELA_TURMAS, buffer, maximo)
+    def carregarMaterias(self, buffer, maximo): return self.carregar(TABELA_MATERIAS, buffer, maximo)
+    def carregarMatriculas(self, buffer, maximo): return self.carregar(TABELA_MATRICULAS, buffer, maximo)
+    def carregarTurmaMateria(self, buffer, maximo): return self.carregar(TABELA_GRADE, buffer, maximo)
+
+    # --- Buscas ---
+    def buscar_aluno(self, indice, chave, saida):
+        self.travar_leitura(TABELA_ALUNOS)
+        try:
+            pos = self.indices(TABELA_ALUNOS)[indice].get(chave)
+            if pos is None: return 0
+            e = self.estados[TABELA_ALUNOS]
+            copiar_para(destino(saida), 0, e.bytes_registro(pos), e.tam)
+            return 1
+        finally:
+            self.travas.destravar(TABELA_ALUNOS)
+
+    def buscarAlunoPorRA(self, ra, saida): return self.buscar_aluno("ra", ra, saida)
+    def buscarAlunoPorCPF(self, cpf, saida): return self.buscar_aluno("cpf", texto_campo(cpf, Aluno, "cpf"), saida)
+
+    # Grava até 'maximo' matrículas das posições em 'buffer' e retorna quantas existem
+    def consultar(self, posicoes_por_indice, buffer, maximo):
+        self.travar_leitura(TABELA_MATRICULAS)
+        try:
+            posicoes = posicoes_por_indice(self.indices(TABELA_MATRICULAS))
+            e = self.estados[TABELA_MATRICULAS]
+            for i, pos in enumerate(posicoes[:maximo]):
+                copiar_para(buffer, i, e.bytes_registro(pos), e.tam)
+            return len(posicoes)
+        finally:
+            self.travas.destravar(TABELA_MATRICULAS)
+
+    def matriculasPorAluno(self, ra, buffer, maximo):
+        return self.consultar(lambda ind: ind["aluno"].get(ra, []), buffer, maximo)
+
+    def matriculasPorTurma(self, id_turma, buffer, maximo):
+        def posicoes(ind):
+            materias = ind["turma"].get(id_turma, {})
+            return [pos for materia in sorted(materias) for pos in materias[materia]]
+        return self.consultar(posicoes, buffer, maximo)
+
+    def matriculasPorTurmaMateria(self, id_turma, id_materia, buffer, maximo):
+        return self.consultar(lambda ind: ind["turma"].get(id_turma, {}).get(id_materia & 0xFFFFFFFF, []), buffer, maximo)
+
+    def matriculasPorStatus(self, status, buffer, maximo):
+        status = texto_campo(status, Matricula, "status")
+        return self.consultar(lambda ind: ind["status"].get(status, []), buffer, maximo)
+
+    def matriculasEmExame(self, buffer, maximo):
+        return self.matriculasPorStatus(b"Exame", buffer, maximo)
+
+    # --- Atualização de matrículas (journal: tudo ou nada) ---
+    def atualizarMatriculasLote(self, matriculas, n):
+        if n <= 0: return 1
+        self.travar_escrita(TABELA_MATRICULAS)
+        try:
+            indices = self.indices(TABELA_MATRICULAS)
+            e = self.estados[TABELA_MATRICULAS]
+            total = proxima = e.registros
+            novas, por_posicao = {}, {}
+            for m in matriculas[:n]:
+                chave = (m.ra_aluno, m.id_turma, m.id_materia)
+                pos = indices["chave"].get(chave)
+                if pos is None:
+                    pos = novas.get(chave)
+                    if pos is None:
+                        pos = novas[chave] = proxima
+                        proxima += 1
+                por_posicao[pos] = bytes(m)  # a última versão de cada matrícula vence
+            posicoes = sorted(por_posicao)
+            anteriores = {pos: e.formato.unpack(e.bytes_registro(pos)) for pos in posicoes if pos < total}
+            ajuste = AjusteEstatisticas(2 * n)
+            if not self.gravar_matriculas(posicoes, [por_posicao[pos] for pos in posicoes]):
+                ajuste.terminar(False)
+                return 0
+            # Índices: novas entram no fim; nas que já existiam só o status pode mudar.
+            # Estatísticas: sai a versão anterior, entra a nova
+            e.atualizar(manter_indices=True)
+            for pos in posicoes:
+                campos = e.formato.unpack(por_posicao[pos])
+                if pos >= total:
+                    indexar(TABELA_MATRICULAS, indices, pos, campos)
+                else:
+                    ajuste.ajustar(anteriores[pos], -1)
+                    status_anterior = texto(anteriores[pos][8])
+                    if status_anterior != texto(campos[8]):
+                        lista = indices["status"][status_anterior]
+                        lista.remove(pos)
+                        if not lista: del indices["status"][status_anterior]
+                        destino_status = indices["status"].setdefault(texto(campos[8]), [])
+                        destino_status.append(pos)
+                        destino_status.sort()
+                ajuste.ajustar(campos, 1)
+            ajuste.terminar(True)
+            for arquivo in INDICES_BIBLIOTECA[TABELA_MATRICULAS]: remover(arquivo)
+            return 1
+        finally:
+            self.travas.destravar(TABELA_MATRICULAS)
+
+    def atualizarMatricula(self, matricula):
+        return self.atualizarMatriculasLote([matricula], 1)
+
+    # --- Estatísticas (matriculas.est) ---
+    # Refaz o .est numa passada pelo .dat. Chamado com a trava das matrículas
+    def reconstruir_estatisticas(self):
+        dados = cabecalho_matriculas()
+        if dados is None: return False
+        e = self.estado(TABELA_MATRICULAS)
+        situacoes = [Estatistica() for _ in SITUACOES]
+        grupos = {}
+        for _, campos in e.percorrer():
+            if e.apagado(campos): continue
+            grupo = grupos.get((campos[1], campos[2]))
+            if grupo is None:
+                grupo = grupos[(campos[1], campos[2])] = Estatistica(id_turma=campos[1], id_materia=campos[2], usado=1)
+            somar_estatistica(grupo, campos, 1)
+            somar_estatistica(situacoes[situacao_status(texto(campos[8]))], campos, 1)
+        cap = capacidade_hash(len(grupos) * 2)
+        tabela = [None] * cap
+        for (id_turma, id_materia), grupo in grupos.items():
+            s = hash_grupo(id_turma, id_materia) & (cap - 1)
+            while tabela[s] is not None: s = (s + 1) & (cap - 1)
+            tabela[s] = grupo
+        cab = CabecalhoEstatisticas(MAGICA_ESTATISTICAS, dados.geracao, dados.registros, cap, len(grupos))
+        vazia = bytes(TAMANHO_ESTATISTICA)
+        temp = f"{MATRICULAS_EST}.{os.getpid()}.tmp"
+        try:
+            with open(temp, "wb", buffering=TAMANHO_BUFFER_ESCRITA) as out:
+                gravar(out, bytes(cab))
+                for linha in situacoes: gravar(out, bytes(linha))
+                for grupo in tabela: gravar(out, vazia if grupo is None else bytes(grupo))
+            os.replace(temp, MATRICULAS_EST)
+        except OSError:
+            remover(temp)
+            return False
+        return True
+
+    # (arquivo, cabeçalho) do .est em dia (refeito antes se estava velho); None se falhar
+    def abrir_estatisticas(self):
+        for tentativa in range(2):
+            dados = cabecalho_matriculas()
+            if dados is None: return None
+            try:
+                f = open(MATRICULAS_EST, "rb")
+            except FileNotFoundError:
+                f = None
+            if f is not None:
+                cab = ler_cabecalho_estatisticas(f)
+                if em_dia(cab, dados): return f, cab
+                f.close()
+            if tentativa == 0 and not self.reconstruir_estatisticas(): return None
+        return None
+
+    def ler_estatisticas(self, leitura):
+        self.travar_leitura(TABELA_MATRICULAS)
+        try:
+            aberto = self.abrir_estatisticas()
+            if aberto is None: return -1
+            f, cab = aberto
+            with f:
+                return leitura(f, cab)
+        finally:
+            self.travas.destravar(TABELA_MATRICULAS)
+
+    def estatisticasMatriculas(self, buffer, maximo):
+        def leitura(f, cab):
+            f.seek(inicio_estatistica(len(SITUACOES)))
+            dados, total = ler(f, cab.capacidade * TAMANHO_ESTATISTICA), 0
+            for inicio in range(0, len(dados) - TAMANHO_ESTATISTICA + 1, TAMANHO_ESTATISTICA):
+                e = Estatistica.from_buffer_copy(dados, inicio)
+                if not e.usado or e.matriculas == 0: continue
+                if total < maximo: copiar_para(buffer, total, bytes(e), TAMANHO_ESTATISTICA)
+                total += 1
+            return total
+        return self.ler_estatisticas(leitura)
+
+    def estatisticasPorSituacao(self, buffer, maximo):
+        def leitura(f, cab):
+            f.seek(inicio_estatistica(0))
+            dados = ler(f, len(SITUACOES) * TAMANHO_ESTATISTICA)
+            if len(dados) < len(SITUACOES) * TAMANHO_ESTATISTICA: return -1
+            copiar_para(buffer, 0, dados, TAMANHO_ESTATISTICA * min(maximo, len(SITUACOES)))
+            return len(SITUACOES)
+        return self.ler_estatisticas(leitura)
+
+    def estatisticaTurmaMateria(self, id_turma, id_materia, saida):
+        saida = destino(saida)
+        def leitura(f, cab):
+            s = hash_grupo(id_turma, id_materia) & (cab.capacidade - 1)
+            for _ in range(cab.capacidade):
+                e = ler_estatistica(f, len(SITUACOES) + s)
+                if e is None or not e.usado: break
+                if (e.id_turma, e.id_materia) == (id_turma, id_materia):
+                    if e.matriculas == 0: break
+                    copiar_para(saida, 0, bytes(e), TAMANHO_ESTATISTICA)
+                    return 1
+                s = (s + 1) & (cab.capacidade - 1)
+            copiar_para(saida, 0, bytes(TAMANHO_ESTATISTICA), TAMANHO_ESTATISTICA)
+            return 0
+        return self.ler_estatisticas(leitura)
+
+    # --- Cursor ---
+    def contarRegistros(self, tabela):
+        if not 0 <= tabela < TOTAL_TABELAS: return 0
+        self.travar_leitura(tabela)
+        try:
+            return self.estado(tabela).registros
+        finally:
+            self.travas.destravar(tabela)
+
+    def abrirCursor(self, tabela):
+        if not 0 <= tabela < TOTAL_TABELAS: return None
+        self.travar_leitura(tabela)
+        try:
+            e = self.estado(tabela)
+            return Cursor(tabela) if e.f is not None and e.legivel else None
+        finally:
+            self.travas.destravar(tabela)
+
+    def proximoLote(self, cursor, buffer, maximo):
+        if cursor is None or maximo <= 0: return 0
+        self.travar_leitura(cursor.tabela)
+        try:
+            e, vivos = self.estado(cursor.tabela), 0
+            for pos, campos in e.percorrer(cursor.proximo):
+                cursor.proximo = pos + 1
+                if e.apagado(campos): continue
+                copiar_para(buffer, vivos, e.bytes_registro(pos, contar=False), e.tam)
+                vivos += 1
+                if vivos == maximo: break
+            return vivos
+        finally:
+            self.travas.destravar(cursor.tabela)
+
+    def fecharCursor(self, cursor):
+        pass
+
+    def reconstruirIndices(self, tabela):
+        if not 0 <= tabela < TOTAL_TABELAS: return 0
+        self.travar_escrita(tabela)
+        try:
+            self.estado(tabela).indices = None
+            self.indices(tabela)
+            return 1 if tabela != TABELA_MATRICULAS else int(self.reconstruir_estatisticas())
+        finally:
+            self.travas.destravar(tabela)
+
+    # --- Sequências de RA e ID ---
+    def ler_sequencia(self, tabela):
+        try:
+            with open(SEQUENCIAS_DB, "rb") as f:
+                f.seek(tabela * 8)
+                dados = ler(f, 8)
+        except FileNotFoundError:
+            return 0
+        return struct.unpack("=q", dados)[0] if len(dados) == 8 else 0
+
+    def gravar_sequencia(self, tabela, proximo):
+        with open(SEQUENCIAS_DB, "ab"):
+            pass
+        with open(SEQUENCIAS_DB, "r+b") as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() < tabela * 8: gravar(f, b"\0" * (tabela * 8 - f.tell()))  # tabelas anteriores sem contador
+            f.seek(tabela * 8)
+            gravar(f, struct.pack("=q", proximo))
+
+    def maior_chave(self, tabela):
+        e = self.estado(tabela)
+        if not e.legivel: return -1
+        return max((campos[0] for _, campos in e.percorrer()), default=0)
+
+    def reservarIds(self, tabela, quantidade):
+        if tabela not in (TABELA_ALUNOS, TABELA_TURMAS, TABELA_MATERIAS) or quantidade <= 0: return -1
+        self.travas.travar(tabela, False)
+        self.travas.travar(TRAVA_SEQUENCIAS, True)
+        try:
+            proximo = self.ler_sequencia(tabela)
+            if proximo <= 0:
+                inicio = PRIMEIRO_RA if tabela == TABELA_ALUNOS else PRIMEIRO_ID
+                maior = self.maior_chave(tabela)
+                proximo = 0 if maior < 0 else max(maior + 1, inicio)
+            if proximo <= 0: return -1
+            self.gravar_sequencia(tabela, proximo + quantidade)
+            return proximo
+        except OSError:
+            return -1
+        finally:
+            self.travas.destravar(TRAVA_SEQUENCIAS)
+            self.travas.destravar(tabela)
+
+    # --- Exclusão lógica e compactação ---
+    def apagar(self, tabela, confere):
+        self.travar_escrita(tabela)
+        try:
+            e = self.estado(tabela)
+            if not e.legivel: return -1
+            mortos, posicoes = 0, []
+            for pos, campos in e.percorrer():
+                if e.apagado(campos): mortos += 1
+                elif confere(campos): posicoes.append(pos)
+            total = e.registros
+            if posicoes:
+                registros = [e.marca + e.bytes_registro(pos, contar=False)[len(e.marca):] for pos in posicoes]
+                if tabela == TABELA_MATRICULAS:
+                    # As cópias marcadas mantêm turma, matéria e notas para descontar das estatísticas
+                    ajuste = AjusteEstatisticas(len(posicoes))
+                    ok = self.gravar_matriculas(posicoes, registros)
+                    for dados in registros if ok else ():
+                        ajuste.ajustar(e.formato.unpack(dados), -1)
+                    ajuste.terminar(ok)
+                else:
+                    f, cab = self.abrir_dados(tabela)
+                    ok = f is not None
+                    if ok:
+                        with f: self.sobrescrever(tabela, f, cab, posicoes, registros)
+                self.invalidar_indices(tabela)
+                if not ok: return -1
+            mortos += len(posicoes)
+            if mortos >= MINIMO_COMPACTACAO and mortos * 100 >= total * LIMITE_ESPACO_MORTO:
+                self.compactar(tabela)
+            return len(posicoes)
+        finally:
+            self.travas.destravar(tabela)
+
+    def apagarAluno(self, ra):
+        return self.apagar(TABELA_ALUNOS, lambda c: c[0] == ra)
+
+    def apagarTurma(self, id_turma):
+        return self.apagar(TABELA_TURMAS, lambda c: c[0] == id_turma)
+
+    def apagarMateria(self, id_materia):
+        return self.apagar(TABELA_MATERIAS, lambda c: c[0] == id_materia)
+
+    def apagarTurmaMateria(self, id_turma, id_materia):
+        if id_turma == 0 and id_materia == 0: return -1  # não apaga a grade inteira por engano
+        return self.apagar(TABELA_GRADE, lambda c: id_turma in (0, c[0]) and id_materia in (0, c[1]))
+
+    def apagarMatriculas(self, ra, id_turma, id_materia):
+        if ra == 0 and id_turma == 0 and id_materia == 0: return -1
+        return self.apagar(TABELA_MATRICULAS,
+                           lambda c: ra in (0, c[0]) and id_turma in (0, c[1]) and id_materia in (0, c[2]))
+
+    # Reescreve o .dat sem apagados nem repetidos (matrículas e grade: fica a primeira
+    # cópia de cada chave). Retorna quantos registros saíram (-1 se falhar)
+    def compactar(self, tabela):
+        e = self.estado(tabela)
+        if not e.legivel: return -1
+        if e.f is None: return 0
+        vistas, vivos = set(), []
+        for pos, campos in e.percorrer():
+            if e.apagado(campos): continue
+            if tabela in (TABELA_MATRICULAS, TABELA_GRADE):
+                chave = campos[:3] if tabela == TABELA_MATRICULAS else campos[:2]
+                if chave in vistas: continue
+                vistas.add(chave)
+            vivos.append(pos)
+        removidos = e.registros - len(vivos)
+        if removidos == 0: return 0
+        cab = novo_cabecalho(tabela)
+        cab.registros = len(vivos)
+        cab.geracao = (e.assinatura[1] + 1) & 0xFFFFFFFF  # segue a geração, como na biblioteca
+        cab.soma = soma_cabecalho(cab)
+        temp = f"{e.arquivo}.{os.getpid()}.tmp"
+        try:
+            with open(temp, "wb", buffering=TAMANHO_BUFFER_ESCRITA) as out:
+                gravar(out, bytes(cab))
+                for pos in vivos: gravar(out, e.bytes_registro(pos, contar=False))
+                sincronizar(out)
+            e.fechar()  # no Windows o arquivo mapeado não pode ser trocado
+            os.replace(temp, e.arquivo)
+        except OSError:
+            remover(temp)
+            return -1
+        with open(e.arquivo, "rb") as dados:
+            reconstruir_somas(tabela, dados, len(vivos))
+        self.invalidar_indices(tabela)
+        return removidos
+
+    def compactarTabela(self, tabela):
+        if not 0 <= tabela < TOTAL_TABELAS: return -1
+        self.travar_escrita(tabela)
+        try:
+            return self.compactar(tabela)
+        finally:
+            self.travas.destravar(tabela)
+
+    # --- Formato dos .dat ---
+    def formatoTabela(self, tabela):
+        if not 0 <= tabela < TOTAL_TABELAS: return FORMATO_DESCONHECIDO
+        self.travas.travar(tabela, False)
+        try:
+            return self.estado(tabela).formato_arquivo
+        finally:
+            self.travas.destravar(tabela)
+
+    # 'tam_long_origem': tamanho do long de quem gravou um .dat sem cabeçalho (0 = o deste
+    # computador). Retorna quantos registros foram convertidos (-1 se falhar)
+    def migrarTabela(self, tabela, tam_long_origem):
+        if not 0 <= tabela < TOTAL_TABELAS: return -1
+        tam_long = tam_long_origem or TAMANHO_LONG
+        if tam_long not in (4, 8): return -1
+        self.travas.travar(tabela, True)  # o journal só pode ser aplicado no formato novo
+        try:
+            convertidos = self.migrar(tabela, tam_long)
+        finally:
+            self.travas.destravar(tabela)
+        if tabela == TABELA_MATRICULAS and convertidos >= 0:
+            self.travar_escrita(tabela)
+            self.travas.destravar(tabela)
+        return convertidos
+
+    def migrar(self, tabela, tam_long):
+        e = self.estado(tabela)
+        if e.formato_arquivo != FORMATO_ANTIGO: return 0 if e.legivel else -1
+        with open(e.arquivo, "rb") as f:
+            _, cab = ler_cabecalho_dados(f, tabela)
+            f.seek(0)
+            com_cabecalho = ler(f, len(MAGICA_DADOS)) == MAGICA_DADOS
+            f.seek(0, os.SEEK_END)
+            tamanho = f.tell()
+            if com_cabecalho:  # gravado com outro long
+                tam_origem, inicio, n = cab.tam_registro, TAMANHO_CABECALHO, cab.registros
+                tam_long = tam_origem - (e.tam - TAMANHO_LONG)
+            else:
+                tam_origem, inicio = tamanho_com_long(tabela, tam_long), 0
+                n = tamanho // tam_origem
+                outro = tamanho_com_long(tabela, 12 - tam_long)
+                if tamanho % tam_origem and tamanho % outro == 0: return -1  # long informado errado
+            f.seek(inicio)
+            dados = ler(f, n * tam_origem)
+            contadores.registros_examinados += len(dados) // tam_origem
+        if len(dados) < n * tam_origem: return -1
+        cab = novo_cabecalho(tabela)
+        cab.registros = n
+        cab.soma = soma_cabecalho(cab)
+        chave = struct.Struct("=i" if tam_long == 4 else "=q")
+        nova = struct.Struct("=i" if TAMANHO_LONG == 4 else "=q")
+        temp = f"{e.arquivo}.{os.getpid()}.tmp"
+        try:
+            with open(temp, "wb", buffering=TAMANHO_BUFFER_ESCRITA) as out:
+                gravar(out, bytes(cab))
+                for i in range(n):
+                    registro = dados[i * tam_origem:(i + 1) * tam_origem]
+                    if tabela in TABELAS_CHAVE_LONG and tam_long != TAMANHO_LONG:
+                        registro = nova.pack(chave.unpack_from(registro)[0]) + registro[tam_long:]
+                    gravar(out, registro)
+                sincronizar(out)
+            e.fechar()
+            os.replace(temp, e.arquivo)
+        except (OSError, struct.error):
+            remover(temp)
+            return -1
+        with open(e.arquivo, "rb") as f:
+            reconstruir_somas(tabela, f, n)
+        self.invalidar_indices(tabela)
+        return n
+
+    # Confere cada bloco com o .sum e grava os que não conferem em 'blocos_ruins'
+    def verificarTabela(self, tabela, blocos_ruins, maximo):
+        if not 0 <= tabela < TOTAL_TABELAS: return -1
+        self.travar_escrita(tabela)
+        try:
+            e = self.estado(tabela)
+            if not e.legivel: return -1
+            if e.f is None: return 0
+            try:
+                with open(ARQUIVOS_SOMAS[tabela], "rb") as f:
+                    somas = ler(f)
+            except FileNotFoundError:
+                somas = b""
+            tam_cab = ctypes.sizeof(CabecalhoSomas)
+            cab = CabecalhoSomas.from_buffer_copy(somas[:tam_cab].ljust(tam_cab, b"\0"))
+            if (cab.magica != MAGICA_SOMAS or cab.registros_por_bloco != REGISTROS_POR_BLOCO
+                    or cab.registros != e.registros):
+                with open(e.arquivo, "rb") as dados:
+                    reconstruir_somas(tabela, dados, e.registros)
+                return 0
+            ruins = 0
+            for inicio in range(0, total_blocos(e.registros), BLOCOS_POR_LEITURA):
+                faixa = range(inicio, min(inicio + BLOCOS_POR_LEITURA, total_blocos(e.registros)))
+                blocos = {b: e.mapa[inicio_registro(b * REGISTROS_POR_BLOCO, e.tam):
+                                    inicio_registro(min((b + 1) * REGISTROS_POR_BLOCO, e.registros), e.tam)]
+                          for b in faixa}
+                contar_registros(sum(len(bloco) for bloco in blocos.values()) // e.tam, e.tam)
+                for bloco, soma in sorted(somar_blocos(blocos).items()):
+                    deslocamento = tam_cab + bloco * SOMA.size
+                    gravada = SOMA.unpack_from(somas, deslocamento)[0] if deslocamento + SOMA.size <= len(somas) else None
+                    if gravada == soma: continue
+                    if ruins < maximo and blocos_ruins is not None: blocos_ruins[ruins] = bloco
+                    ruins += 1
+            return ruins
+        finally:
+            self.travas.destravar(tabela)
+
+    # --- Contadores de E/S ---
+    def lerContadores(self, saida):
+        ctypes.memmove(ctypes.addressof(destino(saida)), ctypes.addressof(contadores), ctypes.sizeof(ContadoresES))
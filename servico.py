@@ -0,0 +1,1291 @@
+# Camada de serviço do SGA: estruturas ctypes, acesso à biblioteca C e regras de cálculo.
+# Não depende do Tkinter, então pode ser usada pela interface (app.py), pela linha de
+# comando (cli.py) ou por scripts rodando em servidor sem tela.
+import bisect
+import csv
+import ctypes
+import heapq
+import json
+import marshal
+import mmap
+import os
+import re
+import sys
+import threading
+import time
+import unicodedata
+from collections import defaultdict
+from contextlib import contextmanager
+from operator import itemgetter
+
+try:
+    import numpy as np
+except ImportError:  # NumPy é opcional: sem ele o cálculo em lote usa listas
+    np = None
+
+# --- 1. A Ponte (ctypes) - 5 estruturas ---
+
+class Aluno(ctypes.Structure):
+    _fields_ = [
+        ("ra", ctypes.c_long),
+        ("nome", ctypes.c_char * 100),
+        ("cpf", ctypes.c_char * 15),
+        ("telefone", ctypes.c_char * 20)
+    ]
+class Turma(ctypes.Structure): _fields_ = [("id", ctypes.c_int), ("nome", ctypes.c_char * 100)]
+class Materia(ctypes.Structure): _fields_ = [("id", ctypes.c_int), ("nome", ctypes.c_char * 100)]
+class Matricula(ctypes.Structure):
+    _fields_ = [
+        ("ra_aluno", ctypes.c_long),
+        ("id_turma", ctypes.c_int),
+        ("id_materia", ctypes.c_int),
+        ("np1", ctypes.c_float), ("np2", ctypes.c_float), ("pim", ctypes.c_float),
+        ("faltas", ctypes.c_int),
+        ("media_final", ctypes.c_float),
+        ("status", ctypes.c_char * 20)
+    ]
+class TurmaMateria(ctypes.Structure): _fields_ = [("id_turma", ctypes.c_int), ("id_materia", ctypes.c_int)]
+
+# Totais de uma (turma, matéria) ou de uma situação, mantidos pelo motor (matriculas.est).
+# faixas_*[k]: quantas notas estão entre k e k + 1 (a última faixa inclui o 10)
+FAIXAS_NOTA = 10
+SITUACAO_PENDENTE, SITUACAO_EXAME, SITUACAO_APROVADO, SITUACAO_REPROVADO = range(4)
+SITUACOES = ("Pendente", "Exame", "Aprovado", "Reprovado (Faltas)")
+STATUS_PENDENTE = b"Pendente"  # matrícula sem notas lançadas
+
+class Estatistica(ctypes.Structure):
+    _fields_ = [
+        ("id_turma", ctypes.c_int), ("id_materia", ctypes.c_int),
+        ("usado", ctypes.c_int),
+        ("matriculas", ctypes.c_int),
+        ("por_situacao", ctypes.c_int * len(SITUACOES)),
+        ("soma_np1", ctypes.c_double), ("soma_np2", ctypes.c_double), ("soma_pim", ctypes.c_double),
+        ("soma_media", ctypes.c_double),
+        ("soma_faltas", ctypes.c_longlong),
+        ("faixas_np1", ctypes.c_int * FAIXAS_NOTA), ("faixas_np2", ctypes.c_int * FAIXAS_NOTA),
+        ("faixas_pim", ctypes.c_int * FAIXAS_NOTA)
+    ]
+
+# Contadores de E/S do motor desde que foi carregado (lerContadores, ver Instrumentação)
+class ContadoresES(ctypes.Structure):
+    _fields_ = [("bytes_lidos", ctypes.c_ulonglong), ("bytes_gravados", ctypes.c_ulonglong),
+                ("registros_examinados", ctypes.c_ulonglong)]
+
+# --- Carrega o motor de armazenamento (só no primeiro uso) ---
+# Importar este módulo não abre a biblioteca nem mostra nada na tela: quem usa (interface,
+# linha de comando, scripts) decide o que fazer se ela não existir.
+# Dois motores com as mesmas funções e os mesmos arquivos: "c" (database.c compilado com
+# 'make': database.dll no Windows, database.so no Linux, database.dylib no macOS) e
+# "python" (motor_python.py, não precisa compilar nada). A variável de ambiente SGA_MOTOR
+# escolhe o motor; SGA_BIBLIOTECA troca o caminho da biblioteca C.
+NOMES_BIBLIOTECA = {"win32": "database.dll", "cygwin": "database.dll", "darwin": "database.dylib"}
+NOME_BIBLIOTECA = NOMES_BIBLIOTECA.get(sys.platform, "database.so")
+CAMINHO_BIBLIOTECA = os.environ.get("SGA_BIBLIOTECA",
+                                    os.path.join(os.path.dirname(os.path.abspath(__file__)), NOME_BIBLIOTECA))
+MOTORES = ("c", "python")
+motor = os.environ.get("SGA_MOTOR", "c")
+_biblioteca = None
+
+def abrir_motor(nome):
+    if nome == "python":
+        from motor_python import MotorPython
+        return MotorPython()
+    if nome != "c": raise ValueError(f"motor desconhecido: {nome} (use {' ou '.join(MOTORES)})")
+    if not os.path.exists(CAMINHO_BIBLIOTECA):
+        raise FileNotFoundError(f"Biblioteca C não encontrada em {CAMINHO_BIBLIOTECA}\n"
+                                "Compile o 'database.c' com 'make' ou use o motor em Python (SGA_MOTOR=python).")
+    try:
+        lib = ctypes.CDLL(CAMINHO_BIBLIOTECA)
+    except OSError as e:
+        raise OSError(f"Não foi possível carregar a biblioteca C. {e}") from e
+    declarar_funcoes(lib)
+    return lib
+
+# Troca o motor antes do primeiro uso (ex.: --motor da linha de comando)
+def escolher_motor(nome):
+    global motor
+    if _biblioteca is not None and nome != motor:
+        raise RuntimeError(f"O motor {motor} já está em uso.")
+    motor = nome
+
+def carregar_biblioteca():
+    global _biblioteca
+    if _biblioteca is None:
+        _biblioteca = abrir_motor(motor)
+    return _biblioteca
+
+# A biblioteca C guarda estado global (sessão, travas, arquivos abertos) e não é
+# thread-safe: uma chamada por vez, venha da interface ou de uma thread de consulta.
+# Durante a chamada o ctypes solta o GIL, então as outras threads Python seguem rodando
+trava_biblioteca = threading.RLock()
+
+# lib_c.funcao(...) carrega a biblioteca na primeira chamada e segura a trava acima
+class BibliotecaPreguicosa:
+    def __getattr__(self, nome):
+        funcao = getattr(carregar_biblioteca(), nome)
+        if instrumentacao.ativa: funcao = instrumentacao.instrumentar_motor(nome, funcao)
+        def chamar(*args):
+            with trava_biblioteca:
+                return funcao(*args)
+        setattr(self, nome, chamar)  # próximas chamadas nem passam pelo __getattr__
+        return chamar
+
+lib_c = BibliotecaPreguicosa()
+
+# --- Instrumentação (opcional): tempo e contadores de cada chamada ---
+# Desligada não custa nada: as funções do motor nem são embrulhadas. Ligada (SGA_INSTRUMENTACAO=1,
+# 'cli.py --medir' ou a aba Diagnóstico), cada chamada ao motor guarda o tempo num histograma
+# por potências de 2 (em µs), os bytes lidos e gravados e os registros examinados (diferença
+# dos lerContadores de antes e de depois) e, nas consultas, os registros devolvidos.
+# medir()/instrumentar() fazem o mesmo para qualquer trecho (consultas e telas da interface)
+FUNCOES_CONTROLE = {"lerContadores", "abrirBanco", "fecharBanco"}
+# Funções que retornam quantos registros encontraram
+FUNCOES_COM_REGISTROS = {
+    "carregarAlunos", "carregarTurmas", "carregarMaterias", "carregarMatriculas", "carregarTurmaMateria",
+    "buscarAlunoPorRA", "buscarAlunoPorCPF", "proximoLote", "matriculasPorAluno", "matriculasPorTurma",
+    "matriculasPorTurmaMateria", "matriculasPorStatus", "matriculasEmExame", "estatisticasMatriculas",
+    "estatisticasPorSituacao", "estatisticaTurmaMateria",
+}
+FAIXAS_HISTOGRAMA = 32  # a última faixa (>= 2^30 µs, uns 18 minutos) junta o resto
+
+class MedidasChamada:
+    def __init__(self):
+        self.chamadas = 0
+        self.segundos = 0.0
+        self.maximo = 0.0
+        self.histograma = [0] * FAIXAS_HISTOGRAMA  # faixa k: menos de 2^k µs
+        self.bytes_lidos = self.bytes_gravados = 0
+        self.registros_examinados = self.registros_devolvidos = 0
+
+    # Limite de cima (µs) da faixa onde está a fração pedida das chamadas (0.5 = mediana)
+    def percentil(self, fracao):
+        alvo, acumulado = fracao * self.chamadas, 0
+        for faixa, quantidade in enumerate(self.histograma):
+            acumulado += quantidade
+            if quantidade and acumulado >= alvo: return 2 ** faixa
+        return 0
+
+    def resumo(self):
+        return {
+            "chamadas": self.chamadas,
+            "segundos": round(self.segundos, 6),
+            "media_us": round(self.segundos * 1e6 / self.chamadas, 2) if self.chamadas else 0.0,
+            "maximo_us": round(self.maximo * 1e6, 2),
+            "p50_us": self.percentil(0.5), "p95_us": self.percentil(0.95), "p99_us": self.percentil(0.99),
+            "histograma_us": {f"<{2 ** faixa}": n for faixa, n in enumerate(self.histograma) if n},
+            "bytes_lidos": self.bytes_lidos,
+            "bytes_gravados": self.bytes_gravados,
+            "registros_examinados": self.registros_examinados,
+            "registros_devolvidos": self.registros_devolvidos,
+        }
+
+class Instrumentacao:
+    def __init__(self):
+        self.ativa = False
+        self.medidas = {}  # nome -> MedidasChamada
+        self.inicio = time.time()
+        self.trava = threading.Lock()  # a interface e a thread de consultas registram ao mesmo tempo
+
+    # As funções do motor já usadas foram guardadas no lib_c sem (ou com) a medição: esquece
+    # todas para o próximo uso passar de novo pelo __getattr__
+    def ativar(self, ativa=True):
+        self.ativa = ativa
+        lib_c.__dict__.clear()
+
+    def zerar(self):
+        with self.trava:
+            self.medidas.clear()
+            self.inicio = time.time()
+
+    def registrar(self, nome, segundos, devolvidos=0, lidos=0, gravados=0, examinados=0):
+        faixa = min(int(segundos * 1e6).bit_length(), FAIXAS_HISTOGRAMA - 1)
+        with self.trava:
+            m = self.medidas.get(nome)
+            if m is None: m = self.medidas[nome] = MedidasChamada()
+            m.chamadas += 1
+            m.segundos += segundos
+            m.maximo = max(m.maximo, segundos)
+            m.histograma[faixa] += 1
+            m.registros_devolvidos += devolvidos
+            m.bytes_lidos += lidos
+            m.bytes_gravados += gravados
+            m.registros_examinados += examinados
+
+    @contextmanager
+    def medir(self, nome):
+        if not self.ativa:
+            yield
+            return
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.registrar(nome, time.perf_counter() - inicio)
+
+    # Embrulha uma função para ser medida (só quando a instrumentação estiver ligada)
+    def instrumentar(self, nome, funcao):
+        def medida(*args, **kwargs):
+            with self.medir(nome):
+                return funcao(*args, **kwargs)
+        return medida
+
+    # Chamado pelo lib_c, com a trava da biblioteca: os dois ContadoresES podem ser reaproveitados
+    def instrumentar_motor(self, nome, funcao):
+        if nome in FUNCOES_CONTROLE: return funcao
+        ler_contadores = carregar_biblioteca().lerContadores
+        antes, depois = ContadoresES(), ContadoresES()
+        ref_antes, ref_depois = ctypes.byref(antes), ctypes.byref(depois)
+        com_registros = nome in FUNCOES_COM_REGISTROS
+        def medida(*args):
+            ler_contadores(ref_antes)
+            inicio = time.perf_counter()
+            resultado = funcao(*args)
+            segundos = time.perf_counter() - inicio
+            ler_contadores(ref_depois)
+            self.registrar(nome, segundos, max(resultado, 0) if com_registros else 0,
+                           depois.bytes_lidos - antes.bytes_lidos, depois.bytes_gravados - antes.bytes_gravados,
+                           depois.registros_examinados - antes.registros_examinados)
+            return resultado
+        return medida
+
+    # Para o JSON e a aba Diagnóstico: nome -> resumo, das chamadas mais demoradas (no total) às mais rápidas
+    def relatorio(self):
+        with self.trava:
+            medidas = sorted(self.medidas.items(), key=lambda item: -item[1].segundos)
+            return {
+                "motor": motor,
+                "inicio": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.inicio)),
+                "duracao_segundos": round(time.time() - self.inicio, 3),
+                "medidas": {nome: m.resumo() for nome, m in medidas},
+            }
+
+    def salvar_json(self, caminho):
+        with open(caminho, "w", encoding="utf-8") as f:
+            json.dump(self.relatorio(), f, ensure_ascii=False, indent=2)
+
+instrumentacao = Instrumentacao()
+if os.environ.get("SGA_INSTRUMENTACAO") == "1": instrumentacao.ativa = True
+
+# Leitura em lotes (cursor) - mesma ordem do enum em database.c
+TABELA_ALUNOS, TABELA_TURMAS, TABELA_MATERIAS, TABELA_MATRICULAS, TABELA_GRADE = range(5)
+
+# Registro apagado: continua no .dat até a compactação, com a chave (primeiro campo) valendo
+# APAGADO. O cursor e as consultas da biblioteca já pulam esses; quem lê o .dat direto
+# (VisaoMapeada) usa registro_apagado
+APAGADO = -1
+
+def registro_apagado(registro):
+    return getattr(registro, registro._fields_[0][0]) == APAGADO
+
+# --- Define os tipos de argumentos e retorno (BOA PRÁTICA) ---
+def declarar_funcoes(lib_c):
+    # Aluno
+    lib_c.salvarAluno.argtypes = [Aluno]
+    lib_c.carregarAlunos.argtypes = [ctypes.POINTER(Aluno), ctypes.c_int]
+    lib_c.carregarAlunos.restype = ctypes.c_int
+    lib_c.buscarAlunoPorRA.argtypes = [ctypes.c_long, ctypes.POINTER(Aluno)]
+    lib_c.buscarAlunoPorRA.restype = ctypes.c_int
+    # --- NOVO: Definição da busca por CPF ---
+    lib_c.buscarAlunoPorCPF.argtypes = [ctypes.c_char_p, ctypes.POINTER(Aluno)]
+    lib_c.buscarAlunoPorCPF.restype = ctypes.c_int
+
+    # Turma
+    lib_c.salvarTurma.argtypes = [Turma]
+    lib_c.carregarTurmas.argtypes = [ctypes.POINTER(Turma), ctypes.c_int]
+    lib_c.carregarTurmas.restype = ctypes.c_int
+
+    # Materia
+    lib_c.salvarMateria.argtypes = [Materia]
+    lib_c.carregarMaterias.argtypes = [ctypes.POINTER(Materia), ctypes.c_int]
+    lib_c.carregarMaterias.restype = ctypes.c_int
+
+    # Matricula
+    lib_c.salvarMatricula.argtypes = [Matricula]
+    lib_c.carregarMatriculas.argtypes = [ctypes.POINTER(Matricula), ctypes.c_int]
+    lib_c.carregarMatriculas.restype = ctypes.c_int
+    lib_c.atualizarMatricula.argtypes = [Matricula]
+    lib_c.atualizarMatricula.restype = ctypes.c_int
+    lib_c.atualizarMatriculasLote.argtypes = [ctypes.POINTER(Matricula), ctypes.c_int]
+    lib_c.atualizarMatriculasLote.restype = ctypes.c_int
+    # Consultas pelos índices secundários (retornam o total de matrículas encontradas)
+    lib_c.matriculasPorAluno.argtypes = [ctypes.c_long, ctypes.POINTER(Matricula), ctypes.c_int]
+    lib_c.matriculasPorAluno.restype = ctypes.c_int
+    lib_c.matriculasPorTurma.argtypes = [ctypes.c_int, ctypes.POINTER(Matricula), ctypes.c_int]
+    lib_c.matriculasPorTurma.restype = ctypes.c_int
+    lib_c.matriculasPorTurmaMateria.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.POINTER(Matricula), ctypes.c_int]
+    lib_c.matriculasPorTurmaMateria.restype = ctypes.c_int
+    lib_c.matriculasPorStatus.argtypes = [ctypes.c_char_p, ctypes.POINTER(Matricula), ctypes.c_int]
+    lib_c.matriculasPorStatus.restype = ctypes.c_int
+    lib_c.matriculasEmExame.argtypes = [ctypes.POINTER(Matricula), ctypes.c_int]
+    lib_c.matriculasEmExame.restype = ctypes.c_int
+    # Estatísticas (retornam quantas linhas existem, -1 se falhar)
+    lib_c.estatisticasMatriculas.argtypes = [ctypes.POINTER(Estatistica), ctypes.c_int]
+    lib_c.estatisticasMatriculas.restype = ctypes.c_int
+    lib_c.estatisticasPorSituacao.argtypes = [ctypes.POINTER(Estatistica), ctypes.c_int]
+    lib_c.estatisticasPorSituacao.restype = ctypes.c_int
+    lib_c.estatisticaTurmaMateria.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.POINTER(Estatistica)]
+    lib_c.estatisticaTurmaMateria.restype = ctypes.c_int
+
+    # Grade (TurmaMateria)
+    lib_c.salvarTurmaMateria.argtypes = [TurmaMateria]
+    lib_c.carregarTurmaMateria.argtypes = [ctypes.POINTER(TurmaMateria), ctypes.c_int]
+    lib_c.carregarTurmaMateria.restype = ctypes.c_int
+
+    # Cursor
+    lib_c.contarRegistros.argtypes = [ctypes.c_int]
+    lib_c.contarRegistros.restype = ctypes.c_int
+    lib_c.abrirCursor.argtypes = [ctypes.c_int]
+    lib_c.abrirCursor.restype = ctypes.c_void_p
+    lib_c.proximoLote.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_int]
+    lib_c.proximoLote.restype = ctypes.c_int
+    lib_c.fecharCursor.argtypes = [ctypes.c_void_p]
+
+    # Importação em lote
+    lib_c.salvarAlunosLote.argtypes = [ctypes.POINTER(Aluno), ctypes.c_int]
+    lib_c.salvarAlunosLote.restype = ctypes.c_int
+    lib_c.salvarTurmasLote.argtypes = [ctypes.POINTER(Turma), ctypes.c_int]
+    lib_c.salvarTurmasLote.restype = ctypes.c_int
+    lib_c.salvarMateriasLote.argtypes = [ctypes.POINTER(Materia), ctypes.c_int]
+    lib_c.salvarMateriasLote.restype = ctypes.c_int
+    lib_c.salvarTurmaMateriaLote.argtypes = [ctypes.POINTER(TurmaMateria), ctypes.c_int]
+    lib_c.salvarTurmaMateriaLote.restype = ctypes.c_int
+    lib_c.salvarMatriculasLote.argtypes = [ctypes.POINTER(Matricula), ctypes.c_int]
+    lib_c.salvarMatriculasLote.restype = ctypes.c_int
+    lib_c.reconstruirIndices.argtypes = [ctypes.c_int]
+    lib_c.reconstruirIndices.restype = ctypes.c_int
+
+    # Sequências de RA/ID (retorna o primeiro valor reservado, -1 se falhar)
+    lib_c.reservarIds.argtypes = [ctypes.c_int, ctypes.c_int]
+    lib_c.reservarIds.restype = ctypes.c_long
+
+    # Exclusão lógica (0 num filtro = qualquer) e compactação: retornam quantos saíram, -1 se falhar
+    lib_c.apagarAluno.argtypes = [ctypes.c_long]
+    lib_c.apagarAluno.restype = ctypes.c_int
+    lib_c.apagarTurma.argtypes = [ctypes.c_int]
+    lib_c.apagarTurma.restype = ctypes.c_int
+    lib_c.apagarMateria.argtypes = [ctypes.c_int]
+    lib_c.apagarMateria.restype = ctypes.c_int
+    lib_c.apagarTurmaMateria.argtypes = [ctypes.c_int, ctypes.c_int]
+    lib_c.apagarTurmaMateria.restype = ctypes.c_int
+    lib_c.apagarMatriculas.argtypes = [ctypes.c_long, ctypes.c_int, ctypes.c_int]
+    lib_c.apagarMatriculas.restype = ctypes.c_int
+    lib_c.compactarTabela.argtypes = [ctypes.c_int]
+    lib_c.compactarTabela.restype = ctypes.c_int
+
+    # Formato dos .dat (cabeçalho, somas por bloco, migração)
+    lib_c.formatoTabela.argtypes = [ctypes.c_int]
+    lib_c.formatoTabela.restype = ctypes.c_int
+    lib_c.migrarTabela.argtypes = [ctypes.c_int, ctypes.c_int]
+    lib_c.migrarTabela.restype = ctypes.c_int
+    lib_c.verificarTabela.argtypes = [ctypes.c_int, ctypes.POINTER(ctypes.c_long), ctypes.c_int]
+    lib_c.verificarTabela.restype = ctypes.c_int
+
+    # Sessão (arquivos abertos entre chamadas)
+    lib_c.abrirBanco.restype = ctypes.c_int
+    lib_c.fecharBanco.restype = None
+
+    # Contadores de E/S (instrumentação)
+    lib_c.lerContadores.argtypes = [ctypes.POINTER(ContadoresES)]
+    lib_c.lerContadores.restype = None
+
+# Sessão: dentro do 'with' as chamadas à biblioteca reaproveitam os arquivos já abertos
+# (uma ação da interface, um comando da linha de comando). Pode ser aninhada
+@contextmanager
+def sessao():
+    lib_c.abrirBanco()
+    try:
+        yield
+    finally:
+        lib_c.fecharBanco()
+
+# Percorre uma tabela inteira em lotes de tamanho fixo (a memória não cresce com o arquivo)
+TAMANHO_LOTE = 256
+
+def iterar_lotes(tabela, tipo, tamanho_lote=TAMANHO_LOTE):
+    cursor = lib_c.abrirCursor(tabela)
+    if not cursor: return  # arquivo ainda não existe
+    try:
+        while True:
+            buffer = (tipo * tamanho_lote)()
+            lidos = lib_c.proximoLote(cursor, buffer, tamanho_lote)
+            if lidos <= 0: break
+            yield buffer[:lidos]
+    finally:
+        lib_c.fecharCursor(cursor)
+
+def iterar_registros(tabela, tipo, tamanho_lote=TAMANHO_LOTE):
+    for lote in iterar_lotes(tabela, tipo, tamanho_lote):
+        yield from lote
+
+# Chama uma das consultas matriculasPor... e devolve só as matrículas encontradas.
+# Começa com um lote e, se o total for maior, repete com um buffer do tamanho certo.
+# Erro do motor (-1: arquivo ou trava) vira IOError, nunca uma lista de registros zerados
+def consultar_matriculas(consulta, *args):
+    tamanho = TAMANHO_LOTE
+    while True:
+        buffer = (Matricula * tamanho)()
+        total = consulta(*args, buffer, tamanho)
+        if total < 0: raise IOError("Não foi possível consultar as matrículas.")
+        if total <= tamanho: return buffer[:total]
+        tamanho = total
+
+# --- Formato dos .dat ---
+# Cabeçalho de 64 bytes antes dos registros (mesma struct CabecalhoDados de database.c).
+# 'registros' diz quantos registros estão completos: o que vier depois é resto de uma
+# escrita interrompida e não é lido
+class CabecalhoDados(ctypes.Structure):
+    _fields_ = [
+        ("magica", ctypes.c_char * 4),
+        ("versao", ctypes.c_uint32),
+        ("tabela", ctypes.c_uint32),
+        ("tam_registro", ctypes.c_uint32),
+        ("registros", ctypes.c_int64),
+        ("soma", ctypes.c_uint32),
+        ("geracao", ctypes.c_uint32),   # muda a cada gravação no .dat
+        ("reservado", ctypes.c_char * 32)
+    ]
+
+TAMANHO_CABECALHO = ctypes.sizeof(CabecalhoDados)
+MAGICA_DADOS = b"SGA1"
+VERSAO_FORMATO = 1
+REGISTROS_POR_BLOCO = 256   # registros por soma de verificação no .sum
+FORMATO_ATUAL, FORMATO_ANTIGO, FORMATO_DESCONHECIDO = 0, 1, -1
+
+# FNV-1a de 32 bits, o mesmo hashBytes da biblioteca ('h' continua um hash anterior)
+FNV_INICIAL = 2166136261
+
+def hash_fnv(dados, h=FNV_INICIAL):
+    for byte in dados:
+        h = ((h ^ byte) * 16777619) & 0xFFFFFFFF
+    return h
+
+def soma_cabecalho(cab):
+    copia = CabecalhoDados.from_buffer_copy(cab)
+    copia.soma = 0
+    return hash_fnv(bytes(copia))
+
+def cabecalho_valido(cab, tabela, tipo):
+    return (cab.magica == MAGICA_DADOS and cab.versao == VERSAO_FORMATO and cab.tabela == tabela
+            and cab.tam_registro == ctypes.sizeof(tipo) and cab.registros >= 0
+            and cab.soma == soma_cabecalho(cab))
+
+# --- Leitura mapeada em memória (mmap) ---
+# O .dat é mapeado direto na memória e visto como um array ctypes: as consultas leem os
+# registros do próprio mapeamento, sem fread para um buffer novo a cada chamada.
+# O mapeamento só é refeito quando o número de registros do arquivo muda.
+ARQUIVOS_TABELAS = {
+    TABELA_ALUNOS: ("alunos.dat", Aluno),
+    TABELA_TURMAS: ("turmas.dat", Turma),
+    TABELA_MATERIAS: ("materias.dat", Materia),
+    TABELA_MATRICULAS: ("matriculas.dat", Matricula),
+    TABELA_GRADE: ("grade.dat", TurmaMateria),
+}
+
+class VisaoMapeada:
+    def __init__(self, tabela):
+        self.tabela = tabela
+        self.arquivo, self.tipo = ARQUIVOS_TABELAS[tabela]
+        self.assinatura = None  # (registros, inode) do arquivo mapeado
+        self.registros = (self.tipo * 0)()
+
+    def atualizar(self):
+        lib_c.contarRegistros(self.tabela)  # termina um journal pendente antes de ler
+        try:
+            f = open(self.arquivo, "rb")
+        except FileNotFoundError:
+            self.assinatura, self.registros = (0, None), (self.tipo * 0)()
+            return self.registros
+        with f:
+            total = self.ler_contagem(f)
+            # A compactação troca o arquivo por outro (inode novo), às vezes do mesmo tamanho
+            st = os.fstat(f.fileno())
+            if (total, st.st_ino) == self.assinatura: return self.registros
+            self.assinatura = (total, st.st_ino)
+            if total == 0:
+                self.registros = (self.tipo * 0)()
+                return self.registros
+            # ACCESS_COPY: nada escrito no mapeamento volta para o arquivo, mas os registros
+            # alterados no disco (atualizarMatricula) continuam aparecendo aqui.
+            # O mapeamento antigo é liberado sozinho quando ninguém mais usar os registros dele.
+            mapa = mmap.mmap(f.fileno(), TAMANHO_CABECALHO + total * ctypes.sizeof(self.tipo), access=mmap.ACCESS_COPY)
+        self.registros = (self.tipo * total).from_buffer(mapa, TAMANHO_CABECALHO)
+        return self.registros
+
+    # Registros completos segundo o cabeçalho. Um cabeçalho que não confere pode ser uma
+    # gravação em andamento noutro processo: espera a trava (contarRegistros) e lê de novo
+    def ler_contagem(self, f):
+        if os.fstat(f.fileno()).st_size == 0: return 0  # criado, ainda sem registros
+        for tentativa in range(2):
+            cab = CabecalhoDados()
+            f.seek(0)
+            lido = f.readinto(cab) == TAMANHO_CABECALHO and cabecalho_valido(cab, self.tabela, self.tipo)
+            if lido and os.fstat(f.fileno()).st_size >= TAMANHO_CABECALHO + cab.registros * ctypes.sizeof(self.tipo):
+                return cab.registros
+            if tentativa == 0: lib_c.contarRegistros(self.tabela)
+        raise IOError(f"{self.arquivo} está num formato que esta versão não lê. "
+                      "Rode 'python cli.py migrar' para converter os arquivos.")
+
+# Grava várias matrículas de uma vez (uma passada no arquivo, tudo ou nada)
+def atualizar_matriculas_lote(matriculas):
+    if not len(matriculas): return True
+    if not isinstance(matriculas, ctypes.Array):
+        matriculas = (Matricula * len(matriculas))(*matriculas)
+    return lib_c.atualizarMatriculasLote(matriculas, len(matriculas)) == 1
+
+
+# --- 2. A Lógica de Cálculo (Python) ---
+LIMITE_FALTAS = 15
+MEDIA_APROVACAO = 7.0
+# As notas são gravadas como float de 32 bits: a média é sempre calculada das notas já
+# arredondadas para 32 bits (as digitadas e as lidas do arquivo dão o mesmo resultado) e
+# arredondada em CASAS_MEDIA casas antes de comparar com a média de aprovação, para o
+# 6.9999995 de 2.6/9.9/10.0 em 32 bits continuar sendo 7.0
+CASAS_MEDIA = 4
+
+def calcular_status(np1, np2, pim, faltas):
+    if faltas >= LIMITE_FALTAS:
+        media = 0.0
+        status = "Reprovado (Faltas)"
+        return media, status
+    np1, np2, pim = (ctypes.c_float(nota).value for nota in (np1, np2, pim))
+    media = round(((np1 * 4) + (np2 * 4) + (pim * 2)) / 10.0, CASAS_MEDIA)
+    status = "Aprovado" if media >= MEDIA_APROVACAO else "Exame"
+    return media, status
+
+# Mesma regra do calcular_status, mas para colunas inteiras (turma, matéria ou arquivo todo).
+# Com NumPy é uma única operação vetorizada; sem ele, um laço sobre as linhas.
+def calcular_status_lote(np1, np2, pim, faltas):
+    if np is None:
+        resultados = [calcular_status(*linha) for linha in zip(np1, np2, pim, faltas)]
+        return [r[0] for r in resultados], [r[1] for r in resultados]
+    np1, np2, pim = (np.asarray(coluna, dtype=np.float32).astype(np.float64) for coluna in (np1, np2, pim))
+    reprovado = np.asarray(faltas) >= LIMITE_FALTAS
+    media = np.where(reprovado, 0.0, np.round(((np1 * 4) + (np2 * 4) + (pim * 2)) / 10.0, CASAS_MEDIA))
+    status = np.where(reprovado, "Reprovado (Faltas)", np.where(media >= MEDIA_APROVACAO, "Aprovado", "Exame"))
+    return media, status
+
+# dtype NumPy com o mesmo layout da Structure ctypes (para ler o mmap como array estruturado)
+def dtype_numpy(tipo):
+    nomes, formatos, deslocamentos = [], [], []
+    for nome, tipo_campo in tipo._fields_:
+        nomes.append(nome)
+        if issubclass(tipo_campo, ctypes.Array) and tipo_campo._type_ is ctypes.c_char:
+            formatos.append(f"S{tipo_campo._length_}")
+        else:
+            formatos.append(np.dtype(tipo_campo))
+        deslocamentos.append(getattr(tipo, nome).offset)
+    return np.dtype({"names": nomes, "formats": formatos, "offsets": deslocamentos, "itemsize": ctypes.sizeof(tipo)})
+
+# Recalcula media_final e status das matrículas (de uma turma, de uma turma+matéria ou de
+# todas) lendo as colunas direto de 'registros' (ex.: VisaoMapeada) e grava de volta só as
+# que mudaram (status ou média arredondada em CASAS_MEDIA; a diferença no último bit do
+# float gravado por uma versão anterior não conta), num único lote. As "Pendente" (sem
+# notas lançadas) ficam como estão: não viram "Exame" com média 0. Retorna quantas
+# matrículas foram alteradas
+def recalcular_matriculas(registros, id_turma=None, id_materia=None):
+    if not len(registros): return 0
+    if np is not None:
+        tabela = np.frombuffer(registros, dtype=dtype_numpy(Matricula))
+        filtro = (tabela['ra_aluno'] != APAGADO) & (tabela['status'] != STATUS_PENDENTE)
+        if id_turma is not None: filtro &= tabela['id_turma'] == id_turma
+        if id_materia is not None: filtro &= tabela['id_materia'] == id_materia
+        selecionadas = tabela[filtro]
+        media, status = calcular_status_lote(selecionadas['np1'], selecionadas['np2'], selecionadas['pim'], selecionadas['faltas'])
+        status = np.char.encode(status, 'utf-8')
+        gravada = np.round(selecionadas['media_final'].astype(np.float64), CASAS_MEDIA)
+        mudou = (gravada != media) | (selecionadas['status'] != status)
+        alteradas = selecionadas[mudou]  # cópia, com o mesmo layout da Structure
+        alteradas['media_final'] = media[mudou].astype(np.float32)
+        alteradas['status'] = status[mudou]
+        lote = (Matricula * len(alteradas)).from_buffer(alteradas)
+    else:
+        selecionadas = [m for m in registros if m.ra_aluno != APAGADO and m.status != STATUS_PENDENTE
+                        and (id_turma is None or m.id_turma == id_turma) and (id_materia is None or m.id_materia == id_materia)]
+        medias, status = calcular_status_lote([m.np1 for m in selecionadas], [m.np2 for m in selecionadas],
+                                              [m.pim for m in selecionadas], [m.faltas for m in selecionadas])
+        lote = []
+        for m, media, st in zip(selecionadas, medias, status):
+            st = st.encode('utf-8')
+            if round(m.media_final, CASAS_MEDIA) != media or m.status != st:
+                alterada = Matricula.from_buffer_copy(m)
+                alterada.media_final, alterada.status = media, st
+                lote.append(alterada)
+    if not atualizar_matriculas_lote(lote):
+        raise IOError("Não foi possível gravar o lote de matrículas recalculadas.")
+    return len(lote)
+
+# --- 3. Operações do sistema (sem interface) ---
+# Erros de validação viram ValueError e falhas de gravação viram IOError;
+# quem chama (interface ou linha de comando) decide como mostrar.
+
+# RAs e IDs novos saem da sequência gravada em sequencias.dat pela biblioteca: não
+# repetem, nem com vários programas cadastrando ao mesmo tempo
+def reservar_ids(tabela, quantidade=1):
+    primeiro = lib_c.reservarIds(tabela, quantidade)
+    if primeiro < 0: raise IOError("Não foi possível reservar um novo RA/ID (sequencias.dat).")
+    return primeiro
+
+def gerar_id_unico(tabela): return reservar_ids(tabela)
+
+def gerar_ra(): return reservar_ids(TABELA_ALUNOS)
+
+def cadastrar_aluno(nome, cpf, telefone="", ra=None):
+    if not nome or not cpf: raise ValueError("Nome e CPF são obrigatórios.")
+    aluno_c = Aluno(ra=gerar_ra() if ra is None else ra, nome=nome.encode('utf-8'),
+                    cpf=cpf.encode('utf-8'), telefone=telefone.encode('utf-8'))
+    lib_c.salvarAluno(aluno_c)
+    return aluno_c
+
+def cadastrar_turma(nome, id=None):
+    if not nome: raise ValueError("O nome da turma não pode estar vazio.")
+    turma_c = Turma(id=gerar_id_unico(TABELA_TURMAS) if id is None else id, nome=nome.encode('utf-8'))
+    lib_c.salvarTurma(turma_c)
+    return turma_c
+
+def cadastrar_materia(nome, id=None):
+    if not nome: raise ValueError("O nome da matéria não pode estar vazio.")
+    materia_c = Materia(id=gerar_id_unico(TABELA_MATERIAS) if id is None else id, nome=nome.encode('utf-8'))
+    lib_c.salvarMateria(materia_c)
+    return materia_c
+
+def ligar_materia_turma(id_turma, id_materia):
+    tm_c = TurmaMateria(id_turma=id_turma, id_materia=id_materia)
+    lib_c.salvarTurmaMateria(tm_c)
+    return tm_c
+
+# Grade inteira como id_turma -> {id_materia: None} (mesmo formato do cache da interface)
+def carregar_grade():
+    grade = defaultdict(dict)
+    for tm in iterar_registros(TABELA_GRADE, TurmaMateria):
+        grade[tm.id_turma][tm.id_materia] = None
+    return grade
+
+# Cria uma matrícula "Pendente" para cada matéria da grade da turma
+# Matérias em que o aluno já está matriculado nessa turma são puladas (não duplica)
+def matricular_aluno(ra, id_turma, ids_materias):
+    count = 0
+    with sessao():
+        ja_matriculado = {(m.id_turma, m.id_materia) for m in boletim(ra)}
+        for id_materia in ids_materias:
+            if (id_turma, id_materia) in ja_matriculado: continue
+            lib_c.salvarMatricula(Matricula(
+                ra_aluno=ra, id_turma=id_turma, id_materia=id_materia,
+                np1=0.0, np2=0.0, pim=0.0, faltas=0, media_final=0.0, status=STATUS_PENDENTE))
+            count += 1
+    return count
+
+def buscar_aluno_por_ra(ra):
+    aluno_c = Aluno()
+    return aluno_c if lib_c.buscarAlunoPorRA(ra, ctypes.byref(aluno_c)) == 1 else None
+
+def buscar_aluno_por_cpf(cpf):
+    aluno_c = Aluno()
+    return aluno_c if lib_c.buscarAlunoPorCPF(cpf.encode('utf-8'), ctypes.byref(aluno_c)) == 1 else None
+
+def boletim(ra):
+    return consultar_matriculas(lib_c.matriculasPorAluno, ra)
+
+# Monta a matrícula com média e status já calculados
+def montar_matricula(ra, id_turma, id_materia, np1, np2, pim, faltas):
+    media, status = calcular_status(np1, np2, pim, faltas)
+    return Matricula(ra_aluno=ra, id_turma=id_turma, id_materia=id_materia,
+                     np1=np1, np2=np2, pim=pim, faltas=faltas,
+                     media_final=media, status=status.encode('utf-8'))
+
+def lancar_notas(ra, id_turma, id_materia, np1, np2, pim, faltas):
+    matricula_c = montar_matricula(ra, id_turma, id_materia, np1, np2, pim, faltas)
+    if not lib_c.atualizarMatricula(matricula_c):
+        raise IOError("Não foi possível gravar as notas no arquivo de matrículas.")
+    return matricula_c
+
+# Exclusões: apagam também o que depende do registro (matrículas do aluno, ligações e
+# matrículas da turma/matéria). Os registros ficam marcados no .dat e saem do arquivo
+# quando a biblioteca compacta a tabela. Retornam quantos registros principais saíram
+def conferir_exclusao(apagados):
+    if apagados < 0: raise IOError("Não foi possível gravar a exclusão.")
+    return apagados
+
+def apagar_aluno(ra):
+    with sessao():
+        conferir_exclusao(lib_c.apagarMatriculas(ra, 0, 0))
+        return conferir_exclusao(lib_c.apagarAluno(ra))
+
+def apagar_turma(id_turma):
+    with sessao():
+        conferir_exclusao(lib_c.apagarMatriculas(0, id_turma, 0))
+        conferir_exclusao(lib_c.apagarTurmaMateria(id_turma, 0))
+        return conferir_exclusao(lib_c.apagarTurma(id_turma))
+
+def apagar_materia(id_materia):
+    with sessao():
+        conferir_exclusao(lib_c.apagarMatriculas(0, 0, id_materia))
+        conferir_exclusao(lib_c.apagarTurmaMateria(0, id_materia))
+        return conferir_exclusao(lib_c.apagarMateria(id_materia))
+
+def desligar_materia_turma(id_turma, id_materia):
+    with sessao():
+        conferir_exclusao(lib_c.apagarMatriculas(0, id_turma, id_materia))
+        return conferir_exclusao(lib_c.apagarTurmaMateria(id_turma, id_materia))
+
+def cancelar_matricula(ra, id_turma, id_materia):
+    return conferir_exclusao(lib_c.apagarMatriculas(ra, id_turma, id_materia))
+
+# Compacta na hora (sem esperar o limite de espaço morto). Retorna quantos registros saíram
+def compactar(tabela):
+    removidos = lib_c.compactarTabela(tabela)
+    if removidos < 0: raise IOError(f"Não foi possível compactar {ARQUIVOS_TABELAS[tabela][0]}.")
+    return removidos
+
+# --- Busca de alunos por parte do nome ---
+# Índice em memória com os nomes normalizados (sem acento e sem diferença de maiúsculas):
+# uma lista ordenada dos nomes completos e outra das palavras de cada nome, procuradas por
+# prefixo com bisect. Alunos novos entram sem refazer o índice
+def normalizar_nome(texto):
+    sem_acento = "".join(c for c in unicodedata.normalize("NFKD", texto) if not unicodedata.combining(c))
+    return " ".join(re.findall(r"\w+", sem_acento.casefold()))
+
+class IndiceNomes:
+    LIMITE_INSERCAO = 64  # com mais nomes novos que isso, acrescenta tudo e reordena de uma vez
+    FIM_PREFIXO = chr(0x10FFFF)
+
+    def __init__(self):
+        self.nomes = {}         # ra -> nome como está no cadastro
+        self.normalizados = {}  # ra -> nome normalizado
+        self.completos = []     # (nome normalizado, ra), em ordem
+        self.palavras = []      # (palavra, ra), em ordem
+        self.novos = {}         # ra -> nome normalizado, ainda fora das listas
+
+    def limpar(self):
+        for parte in (self.nomes, self.normalizados, self.completos, self.palavras, self.novos): parte.clear()
+
+    # Chamar de novo com o mesmo RA troca o nome (ou não faz nada, se for o mesmo)
+    def adicionar(self, ra, nome):
+        if self.nomes.get(ra) == nome: return
+        self.remover(ra)
+        self.nomes[ra] = nome
+        self.normalizados[ra] = self.novos[ra] = normalizar_nome(nome)
+
+    def remover(self, ra):
+        normalizado = self.normalizados.pop(ra, None)
+        if normalizado is None: return
+        del self.nomes[ra]
+        if self.novos.pop(ra, None) is not None: return
+        del self.completos[bisect.bisect_left(self.completos, (normalizado, ra))]
+        for palavra in set(normalizado.split()):
+            del self.palavras[bisect.bisect_left(self.palavras, (palavra, ra))]
+
+    def consolidar(self):
+        if not self.novos: return
+        completos = [(normalizado, ra) for ra, normalizado in self.novos.items()]
+        palavras = [(palavra, ra) for ra, normalizado in self.novos.items() for palavra in set(normalizado.split())]
+        if len(self.novos) <= self.LIMITE_INSERCAO:
+            for entrada in completos: bisect.insort(self.completos, entrada)
+            for entrada in palavras: bisect.insort(self.palavras, entrada)
+        else:
+            self.completos.extend(completos)
+            self.completos.sort()
+            self.palavras.extend(palavras)
+            self.palavras.sort()
+        self.novos.clear()
+
+    def faixa_prefixo(self, lista, prefixo):
+        return (bisect.bisect_left(lista, (prefixo,)), bisect.bisect_left(lista, (prefixo + self.FIM_PREFIXO,)))
+
+    # Retorna [(ra, nome)] nesta ordem: nome igual ao procurado, nomes que começam com o
+    # texto e, com por_palavras, nomes em que cada palavra procurada é início de alguma
+    # palavra do nome ("sil mar" acha "Maria da Silva"); dentro de cada grupo, por nome
+    def buscar(self, texto, limite=50, por_palavras=True):
+        consulta = normalizar_nome(texto)
+        if not consulta or limite <= 0: return []
+        self.consolidar()
+        inicio, fim = self.faixa_prefixo(self.completos, consulta)
+        achados = [ra for _, ra in self.completos[inicio:min(fim, inicio + limite)]]
+        if por_palavras and len(achados) < limite:
+            # RAs com alguma palavra começando por cada termo; começa pelo termo com menos candidatos
+            faixas = sorted(((self.faixa_prefixo(self.palavras, termo), termo) for termo in set(consulta.split())),
+                            key=lambda faixa: faixa[0][1] - faixa[0][0])
+            candidatos = set(map(itemgetter(1), self.palavras[slice(*faixas[0][0])]))
+            for (inicio, fim), termo in faixas[1:]:
+                if not candidatos: break
+                if len(candidatos) * 8 < fim - inicio:  # poucos candidatos: confere as palavras de cada um
+                    candidatos = {ra for ra in candidatos if any(p.startswith(termo) for p in self.normalizados[ra].split())}
+                else:
+                    candidatos &= set(map(itemgetter(1), self.palavras[inicio:fim]))
+            candidatos.difference_update(achados)
+            achados.extend(heapq.nsmallest(limite - len(achados), candidatos, key=lambda ra: (self.normalizados[ra], ra)))
+        return [(ra, self.nomes[ra]) for ra in achados]
+
+# --- Cache dos cadastros (nomes de alunos, turmas e matérias e a grade) ---
+# A interface mostra nomes no lugar dos IDs a partir deste cache. Fica aqui, sem Tkinter,
+# para dar para medir (benchmark.py) e usar fora da tela. Quem mostra o cache recebe
+# ao_aplicar(tabela, registro) a cada registro novo e ao_limpar() antes de uma recarga.
+# O cache já decodificado pode ser guardado em ARQUIVO_COPIA_CACHE para a próxima abertura
+ARQUIVO_COPIA_CACHE = "cadastros.cache"
+VERSAO_COPIA_CACHE = 1
+
+class CacheCadastros:
+    TABELAS = (TABELA_ALUNOS, TABELA_TURMAS, TABELA_MATERIAS, TABELA_GRADE)
+
+    def __init__(self, visoes=None, ao_aplicar=None, ao_limpar=None):
+        self.alunos, self.turmas, self.materias = {}, {}, {}
+        # id_turma -> {id_materia: None}: dict usado como conjunto que mantém a ordem
+        # de inserção (teste de pertinência O(1), exibição na ordem da grade)
+        self.grade = defaultdict(dict)
+        self.indice_nomes = IndiceNomes()  # busca de alunos por parte do nome
+        self.visoes = visoes if visoes is not None else {tabela: VisaoMapeada(tabela) for tabela in self.TABELAS}
+        # tabela -> (registros já aplicados, (tamanho, mtime, inode) do .dat nessa hora)
+        self.estado = {}
+        self.ao_aplicar = ao_aplicar
+        self.ao_limpar = ao_limpar
+
+    def limpar(self):
+        for cache in (self.alunos, self.turmas, self.materias, self.grade, self.estado): cache.clear()
+        self.indice_nomes.limpar()
+
+    # Recarga completa: só na abertura ou quando algum .dat foi reescrito por fora
+    def carregar(self):
+        self.limpar()
+        if self.ao_limpar: self.ao_limpar()
+        return self.sincronizar()
+
+    # Compara tamanho/mtime de cada .dat com o que já está no cache e aplica só os
+    # registros acrescentados no fim desde a última vez (por este ou por outro programa).
+    # Retorna as tabelas que ganharam registros
+    def sincronizar(self):
+        alteradas = set()
+        for tabela in self.TABELAS:
+            arquivo, tipo = ARQUIVOS_TABELAS[tabela]
+            try:
+                st = os.stat(arquivo)
+                assinatura = (st.st_size, st.st_mtime_ns, st.st_ino)
+            except FileNotFoundError:
+                assinatura = (0, 0, 0)
+            carregados, assinatura_antiga = self.estado.get(tabela, (0, None))
+            if assinatura == assinatura_antiga: continue
+
+            # A assinatura é lida antes dos registros: o que entrar depois disso
+            # muda o arquivo de novo e é pego na próxima sincronização
+            registros = self.visoes[tabela].atualizar()
+            total = len(registros)
+            trocado = assinatura_antiga is not None and assinatura[2] != assinatura_antiga[2]  # compactado
+            if trocado or total < carregados or (total == carregados and assinatura[0] == TAMANHO_CABECALHO + total * ctypes.sizeof(tipo) and carregados):
+                # Encolheu, foi trocado ou reescrito com o mesmo tamanho (ex.: exclusão):
+                # não dá para aproveitar o cache
+                self.carregar()
+                return set(self.TABELAS)
+            for registro in registros[carregados:]:
+                self.aplicar(tabela, registro)
+            self.estado[tabela] = (total, assinatura)
+            if total > carregados: alteradas.add(tabela)
+        return alteradas
+
+    # Fica com o conteúdo de outro cache (montado numa thread, por exemplo) sem trocar os
+    # dicionários, que a interface guarda com nomes curtos. Não chama ao_aplicar/ao_limpar
+    def adotar(self, outro):
+        for meu, dele in ((self.alunos, outro.alunos), (self.turmas, outro.turmas), (self.materias, outro.materias),
+                          (self.grade, outro.grade), (self.estado, outro.estado)):
+            meu.clear()
+            meu.update(dele)
+        self.indice_nomes = outro.indice_nomes
+        for tabela in self.TABELAS: self.visoes[tabela] = outro.visoes[tabela]
+
+    # Cópia em disco (marshal: só dicionários, listas e textos, nada de código) com o estado
+    # (tamanho, mtime, inode) de cada .dat na hora em que foi lida. Depois de carregar_copia,
+    # o sincronizar() aplica só o que entrou nos .dat desde então, ou recarrega tudo se algum
+    # foi reescrito, como faz com o cache em memória
+    def salvar_copia(self, caminho=ARQUIVO_COPIA_CACHE):
+        self.indice_nomes.consolidar()
+        dados = (VERSAO_COPIA_CACHE, self.alunos, self.turmas, self.materias,
+                 {id_turma: dict(materias) for id_turma, materias in self.grade.items()},
+                 self.estado, self.indice_nomes.completos, self.indice_nomes.palavras)
+        temporario = caminho + ".tmp"
+        with open(temporario, "wb") as f:
+            f.write(marshal.dumps(dados))
+        os.replace(temporario, caminho)
+
+    # Retorna False (sem mexer no cache) se não houver cópia ou ela não servir
+    def carregar_copia(self, caminho=ARQUIVO_COPIA_CACHE):
+        try:
+            # loads do arquivo inteiro: o marshal.load(f) lê aos pedaços e é várias vezes mais lento
+            with open(caminho, "rb") as f:
+                versao, alunos, turmas, materias, grade, estado, completos, palavras = marshal.loads(f.read())
+        except (OSError, EOFError, ValueError, TypeError):
+            return False
+        if versao != VERSAO_COPIA_CACHE: return False
+        self.limpar()
+        self.alunos.update(alunos)
+        self.turmas.update(turmas)
+        self.materias.update(materias)
+        self.grade.update(grade)
+        self.estado.update(estado)
+        indice = self.indice_nomes
+        indice.nomes.update(alunos)
+        indice.normalizados.update((ra, normalizado) for normalizado, ra in completos)
+        indice.completos, indice.palavras = completos, palavras
+        return True
+
+    # Pode ser chamado duas vezes para o mesmo registro sem duplicar nada
+    def aplicar(self, tabela, registro):
+        if registro_apagado(registro): return
+        if tabela == TABELA_ALUNOS:
+            self.alunos[registro.ra] = registro.nome.decode('utf-8')
+            self.indice_nomes.adicionar(registro.ra, self.alunos[registro.ra])
+        elif tabela in (TABELA_TURMAS, TABELA_MATERIAS):
+            cache = self.turmas if tabela == TABELA_TURMAS else self.materias
+            cache[registro.id] = registro.nome.decode('utf-8')
+        elif tabela == TABELA_GRADE:
+            if registro.id_materia in self.grade[registro.id_turma]: return
+            self.grade[registro.id_turma][registro.id_materia] = None
+        if self.ao_aplicar: self.ao_aplicar(tabela, registro)
+
+    def nome_turma(self, id_turma): return self.turmas.get(id_turma, f"ID {id_turma}")
+
+    def nome_materia(self, id_materia): return self.materias.get(id_materia, f"ID {id_materia}")
+
+# Linhas das consultas da interface (boletim, notas e exames), com os nomes do cache
+def linhas_boletim(cache, matriculas):
+    return [(cache.nome_turma(m.id_turma), cache.nome_materia(m.id_materia), f"{m.np1:.1f}", f"{m.np2:.1f}",
+             f"{m.pim:.1f}", m.faltas, f"{m.media_final:.2f}", m.status.decode('utf-8')) for m in matriculas]
+
+def linhas_notas(cache, matriculas):
+    return [(m.ra_aluno, cache.alunos.get(m.ra_aluno, "..."), f"{m.np1:.1f}", f"{m.np2:.1f}", f"{m.pim:.1f}",
+             m.faltas, f"{m.media_final:.2f}", m.status.decode('utf-8')) for m in matriculas]
+
+def linhas_exames(cache, matriculas, id_turma=None):
+    return [(m.ra_aluno, cache.alunos.get(m.ra_aluno, "Desconhecido"), cache.nome_turma(m.id_turma),
+             cache.nome_materia(m.id_materia), f"{m.media_final:.2f}", m.faltas, m.status.decode('utf-8'))
+            for m in matriculas if id_turma is None or m.id_turma == id_turma]
+
+# --- Estatísticas por turma/matéria e por situação ---
+# Lidas dos totais que o motor mantém a cada gravação de matrícula: nenhuma delas percorre
+# o matriculas.dat (a não ser na primeira leitura depois de uma compactação ou migração)
+def situacao_status(status):
+    if status == b"Aprovado": return SITUACAO_APROVADO
+    if status == b"Exame": return SITUACAO_EXAME
+    if status.startswith(b"Reprovado"): return SITUACAO_REPROVADO
+    return SITUACAO_PENDENTE
+
+def faixa_nota(nota):
+    if not nota >= 0: return 0  # negativa ou NaN
+    return FAIXAS_NOTA - 1 if nota >= FAIXAS_NOTA else int(nota)
+
+def ler_estatisticas(consulta):
+    tamanho = TAMANHO_LOTE
+    while True:
+        buffer = (Estatistica * tamanho)()
+        total = consulta(buffer, tamanho)
+        if total < 0: raise IOError("Não foi possível ler as estatísticas das matrículas.")
+        if total <= tamanho: return buffer[:total]
+        tamanho = total
+
+# Uma Estatistica por (turma, matéria) com matrículas, em ordem de turma e matéria
+def estatisticas_turmas(id_turma=None):
+    linhas = [e for e in ler_estatisticas(lib_c.estatisticasMatriculas) if id_turma is None or e.id_turma == id_turma]
+    return sorted(linhas, key=lambda e: (e.id_turma, e.id_materia))
+
+# Uma Estatistica por situação, na ordem de SITUACOES
+def estatisticas_situacoes():
+    return ler_estatisticas(lib_c.estatisticasPorSituacao)
+
+def estatistica_turma_materia(id_turma, id_materia):
+    e = Estatistica()
+    achou = lib_c.estatisticaTurmaMateria(id_turma, id_materia, ctypes.byref(e))
+    if achou < 0: raise IOError("Não foi possível ler as estatísticas das matrículas.")
+    return e if achou else None
+
+# Contagens, porcentagens e médias de uma Estatistica (médias de 0 matrículas valem 0)
+def resumo_estatistica(e):
+    n = e.matriculas
+    def media(soma): return soma / n if n else 0.0
+    def porcentagem(qtd): return 100.0 * qtd / n if n else 0.0
+    return {
+        "matriculas": n,
+        "aprovados": e.por_situacao[SITUACAO_APROVADO],
+        "exame": e.por_situacao[SITUACAO_EXAME],
+        "reprovados_faltas": e.por_situacao[SITUACAO_REPROVADO],
+        "pendentes": e.por_situacao[SITUACAO_PENDENTE],
+        "media": media(e.soma_media),
+        "perc_aprovados": porcentagem(e.por_situacao[SITUACAO_APROVADO]),
+        "perc_exame": porcentagem(e.por_situacao[SITUACAO_EXAME]),
+        "perc_reprovados_faltas": porcentagem(e.por_situacao[SITUACAO_REPROVADO]),
+        "media_np1": media(e.soma_np1),
+        "media_np2": media(e.soma_np2),
+        "media_pim": media(e.soma_pim),
+        "media_faltas": media(e.soma_faltas),
+        "faixas_np1": list(e.faixas_np1),
+        "faixas_np2": list(e.faixas_np2),
+        "faixas_pim": list(e.faixas_pim),
+    }
+
+# Linhas do painel de estatísticas: uma por (turma, matéria) e a distribuição das notas
+def linhas_estatisticas(cache, estatisticas):
+    linhas = []
+    for e in estatisticas:
+        r = resumo_estatistica(e)
+        linhas.append((cache.nome_turma(e.id_turma), cache.nome_materia(e.id_materia), r["matriculas"],
+                       f"{r['media']:.2f}", f"{r['perc_aprovados']:.1f}%", f"{r['perc_exame']:.1f}%",
+                       f"{r['perc_reprovados_faltas']:.1f}%", f"{r['media_np1']:.2f}", f"{r['media_np2']:.2f}",
+                       f"{r['media_pim']:.2f}", f"{r['media_faltas']:.1f}"))
+    return linhas
+
+def linhas_faixas(e):
+    return [(f"{k} a {k + 1}", e.faixas_np1[k], e.faixas_np2[k], e.faixas_pim[k]) for k in range(FAIXAS_NOTA)]
+
+# --- Migração e verificação dos .dat ---
+# Tabelas com .dat gravado pela versão anterior (sem cabeçalho) ou com o long de outro
+# tamanho (Windows x Linux): a biblioteca não lê nem grava nelas até migrar
+def tabelas_formato_antigo():
+    return [tabela for tabela in ARQUIVOS_TABELAS if lib_c.formatoTabela(tabela) != FORMATO_ATUAL]
+
+def conferir_formato():
+    antigas = [ARQUIVOS_TABELAS[t][0] for t in tabelas_formato_antigo()]
+    if antigas:
+        raise IOError(f"Arquivos no formato antigo: {', '.join(antigas)}. "
+                      "Rode 'python cli.py migrar' para converter.")
+
+# 'tam_long': tamanho do long (4 no Windows, 8 no Linux) de quem gravou os arquivos sem
+# cabeçalho; 0 = o deste computador. Retorna {tabela: registros convertidos}
+def migrar_formato(tam_long=0):
+    convertidos = {}
+    for tabela in tabelas_formato_antigo():
+        n = lib_c.migrarTabela(tabela, tam_long)
+        if n < 0: raise IOError(erro_migracao(tabela, tam_long))
+        convertidos[tabela] = n
+    return convertidos
+
+# Tamanho do registro gravado num programa em que o long tem 'tam_long' bytes (em Aluno e
+# Matricula o long é o primeiro campo; o resto da struct não muda)
+def tamanho_com_long(tabela, tam_long):
+    tipo = ARQUIVOS_TABELAS[tabela][1]
+    primeiro = tipo._fields_[0][1]
+    if primeiro is not ctypes.c_long: return ctypes.sizeof(tipo)
+    return ctypes.sizeof(tipo) - ctypes.sizeof(ctypes.c_long) + tam_long
+
+# A biblioteca só diz que falhou: um .dat sem cabeçalho cujo tamanho fecha com o long do
+# outro sistema (e não com o informado) foi gravado lá, e a mensagem diz qual --long usar
+def erro_migracao(tabela, tam_long):
+    arquivo = ARQUIVOS_TABELAS[tabela][0]
+    tam_long = tam_long or ctypes.sizeof(ctypes.c_long)
+    outro = 12 - tam_long
+    try:
+        with open(arquivo, "rb") as f:
+            com_cabecalho = f.read(len(MAGICA_DADOS)) == MAGICA_DADOS
+        tamanho = os.path.getsize(arquivo)
+    except OSError:
+        com_cabecalho, tamanho = True, 0
+    sistemas = {4: "Windows", 8: "Linux/macOS"}
+    if not com_cabecalho and tamanho % tamanho_com_long(tabela, tam_long) and tamanho % tamanho_com_long(tabela, outro) == 0:
+        return (f"Não foi possível migrar {arquivo}: ele foi gravado num sistema com long de {outro} bytes "
+                f"({sistemas[outro]}), não de {tam_long}. Rode de novo com 'python cli.py migrar --long {outro}'.")
+    return (f"Não foi possível migrar {arquivo}. Se ele foi gravado em outro sistema, rode "
+            "'python cli.py migrar --long 4' (Windows) ou '--long 8' (Linux/macOS).")
+
+# Confere as somas de verificação do .dat. Retorna a lista dos registros (de, até) dos
+# blocos que não conferem
+MAXIMO_BLOCOS_RUINS = 1024
+
+def verificar(tabela):
+    blocos = (ctypes.c_long * MAXIMO_BLOCOS_RUINS)()
+    ruins = lib_c.verificarTabela(tabela, blocos, MAXIMO_BLOCOS_RUINS)
+    if ruins < 0: raise IOError(f"{ARQUIVOS_TABELAS[tabela][0]} precisa ser migrado antes da verificação.")
+    tamanho = REGISTROS_POR_BLOCO
+    return [(b * tamanho, (b + 1) * tamanho - 1) for b in blocos[:min(ruins, MAXIMO_BLOCOS_RUINS)]]
+
+# --- 4. Conversão registro <-> dicionário (exportação/importação em CSV) ---
+NOMES_TABELAS = {
+    "alunos": TABELA_ALUNOS,
+    "turmas": TABELA_TURMAS,
+    "materias": TABELA_MATERIAS,
+    "matriculas": TABELA_MATRICULAS,
+    "grade": TABELA_GRADE,
+}
+
+def campos(tipo): return [nome for nome, _ in tipo._fields_]
+
+def registro_para_dict(registro):
+    dados = {}
+    for nome in campos(type(registro)):
+        valor = getattr(registro, nome)
+        if isinstance(valor, bytes): valor = valor.decode('utf-8')
+        elif isinstance(valor, float): valor = float(f"{valor:.6g}")  # tira o ruído do float de 32 bits
+        dados[nome] = valor
+    return dados
+
+# Campos ausentes ou vazios ficam zerados; textos grandes demais geram ValueError
+def dict_para_registro(tipo, dados):
+    registro = tipo()
+    for nome, tipo_campo in tipo._fields_:
+        valor = dados.get(nome)
+        if valor is None or valor == "": continue
+        if issubclass(tipo_campo, ctypes.Array):
+            texto = str(valor).encode('utf-8')
+            if len(texto) >= tipo_campo._length_:  # precisa sobrar espaço para o '\0' do C
+                raise ValueError(f"Campo '{nome}' com mais de {tipo_campo._length_ - 1} bytes.")
+            setattr(registro, nome, texto)
+        elif tipo_campo is ctypes.c_float:
+            setattr(registro, nome, float(valor))
+        else:
+            setattr(registro, nome, int(valor))
+    return registro
+
+# --- 5. Importação em lote (CSV) ---
+# O CSV é lido em streaming e validado linha a linha; os registros válidos são gravados
+# em blocos com as funções ...Lote da biblioteca (uma escrita por bloco) e os índices
+# são refeitos uma vez só, no fim. Linhas inválidas são puladas e devolvidas em 'erros'
+TAMANHO_LOTE_IMPORTACAO = 10000
+
+FUNCOES_LOTE = {
+    TABELA_ALUNOS: "salvarAlunosLote",
+    TABELA_TURMAS: "salvarTurmasLote",
+    TABELA_MATERIAS: "salvarMateriasLote",
+    TABELA_GRADE: "salvarTurmaMateriaLote",
+    TABELA_MATRICULAS: "salvarMatriculasLote",
+}
+
+# Entrega RAs/IDs novos reservando um bloco por vez na sequência (uma chamada à biblioteca
+# a cada TAMANHO_BLOCO_IDS linhas). Pula os valores em 'usados': RAs/IDs informados no
+# próprio CSV, que só entram na sequência quando o bloco é gravado
+TAMANHO_BLOCO_IDS = 1000
+
+def reservador_ids(tabela, usados, tamanho_bloco=TAMANHO_BLOCO_IDS):
+    proximo, fim = 0, 0
+    def reservar():
+        nonlocal proximo, fim
+        while True:
+            if proximo == fim:
+                proximo = reservar_ids(tabela, tamanho_bloco)
+                fim = proximo + tamanho_bloco
+            valor, proximo = proximo, proximo + 1
+            if valor not in usados: return valor
+    return reservar
+
+def texto_obrigatorio(linha, campo):
+    valor = (linha.get(campo) or "").strip()
+    if not valor: raise ValueError(f"Campo '{campo}' é obrigatório.")
+    return valor
+
+# Cada preparador recebe uma linha do CSV e devolve o registro a gravar, None para pular
+# a linha sem erro (ex.: ligação que já existe) ou levanta ValueError
+def preparador_alunos():
+    existentes = list(iterar_registros(TABELA_ALUNOS, Aluno))
+    ras = {a.ra for a in existentes}
+    cpfs = {a.cpf.decode('utf-8') for a in existentes}
+    proximo_ra = reservador_ids(TABELA_ALUNOS, ras)
+    def preparar(linha):
+        cpf = texto_obrigatorio(linha, "cpf")
+        if cpf in cpfs: raise ValueError(f"CPF {cpf} já cadastrado.")
+        ra = int(linha["ra"]) if linha.get("ra") else proximo_ra()
+        if ra <= 0: raise ValueError("RA deve ser positivo.")
+        if ra in ras: raise ValueError(f"RA {ra} já cadastrado.")
+        aluno = dict_para_registro(Aluno, {"ra": ra, "nome": texto_obrigatorio(linha, "nome"), "cpf": cpf,
+                                           "telefone": (linha.get("telefone") or "").strip()})
+        ras.add(ra)
+        cpfs.add(cpf)
+        return aluno
+    return preparar
+
+def preparador_cadastro(tabela):
+    tipo = ARQUIVOS_TABELAS[tabela][1]
+    ids = {r.id for r in iterar_registros(tabela, tipo)}
+    proximo_id = reservador_ids(tabela, ids)
+    def preparar(linha):
+        id = int(linha["id"]) if linha.get("id") else proximo_id()
+        if id <= 0: raise ValueError("ID deve ser positivo.")
+        if id in ids: raise ValueError(f"ID {id} já cadastrado.")
+        registro = dict_para_registro(tipo, {"id": id, "nome": texto_obrigatorio(linha, "nome")})
+        ids.add(id)
+        return registro
+    return preparar
+
+def preparador_grade():
+    turmas = {t.id for t in iterar_registros(TABELA_TURMAS, Turma)}
+    materias = {m.id for m in iterar_registros(TABELA_MATERIAS, Materia)}
+    grade = carregar_grade()
+    def preparar(linha):
+        id_turma, id_materia = int(linha["id_turma"]), int(linha["id_materia"])
+        if id_turma not in turmas: raise ValueError(f"Turma {id_turma} não cadastrada.")
+        if id_materia not in materias: raise ValueError(f"Matéria {id_materia} não cadastrada.")
+        if id_materia in grade[id_turma]: return None  # ligação já existe
+        grade[id_turma][id_materia] = None
+        return TurmaMateria(id_turma=id_turma, id_materia=id_materia)
+    return preparar
+
+CAMPOS_NOTAS = ("np1", "np2", "pim", "faltas")
+
+# Sem nenhuma nota/falta no CSV a matrícula entra como "Pendente" (igual à matrícula
+# pela interface; se ela já existe, a linha é pulada em importar); com notas, média e
+# status são calculados
+def preparador_matriculas():
+    ras = {a.ra for a in iterar_registros(TABELA_ALUNOS, Aluno)}
+    grade = carregar_grade()
+    def preparar(linha):
+        m = dict_para_registro(Matricula, {c: linha.get(c) for c in ("ra_aluno", "id_turma", "id_materia") + CAMPOS_NOTAS})
+        if m.ra_aluno not in ras: raise ValueError(f"Aluno com RA {m.ra_aluno} não cadastrado.")
+        if m.id_materia not in grade.get(m.id_turma, {}):
+            raise ValueError(f"Matéria {m.id_materia} não está na grade da turma {m.id_turma}.")
+        if not any(linha.get(c) for c in CAMPOS_NOTAS):
+            m.status = STATUS_PENDENTE
+            return m
+        if not all(0.0 <= nota <= 10.0 for nota in (m.np1, m.np2, m.pim)): raise ValueError("Notas devem ficar entre 0 e 10.")
+        if m.faltas < 0: raise ValueError("Faltas não podem ser negativas.")
+        media, status = calcular_status(m.np1, m.np2, m.pim, m.faltas)
+        m.media_final, m.status = media, status.encode('utf-8')
+        return m
+    return preparar
+
+def gravar_bloco(tabela, registros):
+    if not registros: return 0
+    tipo = ARQUIVOS_TABELAS[tabela][1]
+    gravados = getattr(lib_c, FUNCOES_LOTE[tabela])((tipo * len(registros))(*registros), len(registros))
+    if gravados < 0: raise IOError(f"Não foi possível gravar o bloco importado em {ARQUIVOS_TABELAS[tabela][0]}.")
+    return gravados
+
+# 'linhas' são pares (número da linha, dicionário). Retorna (importados, erros), com
+# erros = [(número da linha, mensagem)]
+def importar(tabela, linhas, tamanho_bloco=TAMANHO_LOTE_IMPORTACAO):
+    if tabela == TABELA_ALUNOS: preparar = preparador_alunos()
+    elif tabela == TABELA_GRADE: preparar = preparador_grade()
+    elif tabela == TABELA_MATRICULAS: preparar = preparador_matriculas()
+    else: preparar = preparador_cadastro(tabela)
+    # Matrículas que já existem (no arquivo ou num bloco anterior) são corrigidas com
+    # atualizarMatriculasLote; as novas são só acrescentadas. Linha sem notas de uma
+    # matrícula que já existe não muda nada: não apaga as notas já lançadas
+    chaves = ({(m.ra_aluno, m.id_turma, m.id_materia) for m in iterar_registros(TABELA_MATRICULAS, Matricula)}
+              if tabela == TABELA_MATRICULAS else None)
+
+    importados, erros = 0, []
+    novos, existentes = {}, []
+    def descarregar():
+        nonlocal importados
+        importados += gravar_bloco(tabela, list(novos.values()))
+        if existentes:
+            if not atualizar_matriculas_lote(existentes):
+                raise IOError("Não foi possível gravar o lote de matrículas importadas.")
+            importados += len(existentes)
+        if chaves is not None: chaves.update(novos)
+        novos.clear()
+        existentes.clear()
+
+    for numero, linha in linhas:
+        try:
+            registro = preparar(linha)
+        except (ValueError, KeyError, TypeError) as e:
+            erros.append((numero, f"campo {e} ausente" if isinstance(e, KeyError) else str(e)))
+            continue
+        if registro is None: continue
+        if chaves is None:
+            novos[len(novos)] = registro
+        else:
+            chave = (registro.ra_aluno, registro.id_turma, registro.id_materia)
+            if registro.status == STATUS_PENDENTE and (chave in chaves or chave in novos): continue
+            if chave in chaves: existentes.append(registro)
+            else: novos[chave] = registro  # repetida no mesmo bloco: vale a última
+        if len(novos) + len(existentes) >= tamanho_bloco: descarregar()
+    descarregar()
+    lib_c.reconstruirIndices(tabela)
+    return importados, erros
+
+def importar_csv(tabela, caminho, separador=","):
+    with open(caminho, newline="", encoding="utf-8-sig") as f, sessao():
+        leitor = csv.DictReader(f, delimiter=separador)
+        return importar(tabela, ((leitor.line_num, linha) for linha in leitor))